@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""Benchmark for canonicalising entries for hashing.
+
+Builds entries shaped like the dict views of Solutions and Toolboxes (lists of
+dicts of plain values, with embedded users and reviews) with many variables
+and dependencies, and entries with dependencies nested depth deep, and times
+sssc.signatures.make_canonical against the previous implementation (kept
+below for reference). Before timing, checks that both give byte-identical
+canonical JSON for every entry and for some unusual inputs, so that existing
+hashes and signatures still verify.
+
+    python scripts/bench_canonical.py -n 10 100 400 1600 -d 4 8
+
+"""
+import argparse
+from collections import OrderedDict
+import json
+import random
+import sys
+import timeit
+
+from sssc.signatures import canonical_ignored_keys, make_canonical
+
+
+def _old_sort_key(obj):
+    if isinstance(obj, dict):
+        return ''.join(str(v) for k, v in sorted(obj.items()))
+    else:
+        return obj
+
+
+def old_make_canonical(obj):
+    """make_canonical as it was, calling itself for every value."""
+    if isinstance(obj, dict):
+        return {k: old_make_canonical(v)
+                for k, v in obj.items()
+                if k not in canonical_ignored_keys}
+    elif isinstance(obj, list) or isinstance(obj, tuple):
+        return sorted((old_make_canonical(v) for v in obj),
+                      key=_old_sort_key)
+    else:
+        return obj
+
+
+def word(rnd):
+    return ''.join(rnd.choice('abcdefghij') for i in range(8))
+
+
+def user(rnd):
+    """Return the dict view of a User, as embedded in an entry."""
+    uid = rnd.randint(1, 100)
+    return {'@id': 'http://sssc.example.org/users/{}'.format(uid),
+            '@type': 'User',
+            'name': word(rnd),
+            'applications': [],
+            'prov:has_provenance':
+                'http://sssc.example.org/users/{}/prov'.format(uid),
+            'reviews': []}
+
+
+def entry(kind, size, rnd):
+    """Return the dict view of a kind of entry with size variables and deps."""
+    url = 'http://sssc.example.org/{}s/1'.format(kind.lower())
+    return {
+        '@context': {'prov': 'http://www.w3.org/ns/prov#'},
+        '@id': url,
+        '@type': kind,
+        'id': 1,
+        'author': user(rnd),
+        'created_at': '2020-05-17T10:30:05+00:00',
+        'name': word(rnd),
+        'description': ' '.join(word(rnd) for i in range(50)),
+        'published': True,
+        'version': 3,
+        'prov:has_provenance': url + '/prov',
+        'dependencies': [
+            {'@type': kind + 'Dependency',
+             'type': 'python',
+             'identifier': word(rnd),
+             'version': '{}.{}'.format(rnd.randint(0, 9), rnd.randint(0, 9))}
+            for i in range(size)
+        ],
+        'variables': [
+            {'@type': kind + 'Var',
+             'name': word(rnd),
+             'type': rnd.choice(['int', 'string', 'double']),
+             'label': word(rnd),
+             'description': ' '.join(word(rnd) for j in range(5)),
+             'optional': rnd.random() < 0.5,
+             'default': rnd.randint(0, 100),
+             'min': 0.0,
+             'max': float(rnd.randint(1, 100)),
+             'step': 1.0,
+             'values': [word(rnd) for j in range(3)]}
+            for i in range(size)
+        ],
+        'tags': [{'@type': kind + 'Tag', 'tag': word(rnd)}
+                 for i in range(size // 10 + 1)],
+        'reviews': [{'@type': 'Review',
+                     'id': i,
+                     'comment': word(rnd),
+                     'rating': rnd.randint(1, 5),
+                     'created_at': '2020-05-17T10:30:05+00:00',
+                     'entry': url,
+                     'reviewer': user(rnd)}
+                    for i in range(size // 10 + 1)],
+        'signatures': [],
+        'versions': [],
+        'images': [],
+    }
+
+
+def nested_entry(depth, rnd, width=3):
+    """Return an entry whose dependencies nest depth levels deep."""
+    def node(level):
+        dep = {'identifier': word(rnd), 'version': rnd.randint(0, 100)}
+        if level < depth:
+            dep['dependencies'] = [node(level + 1) for i in range(width)]
+        return dep
+
+    return {'name': 'nested', 'dependencies': [node(1) for i in range(width)]}
+
+
+class Tags(list):
+    pass
+
+
+# Inputs unlike any entry, which must still canonicalise the same way.
+UNUSUAL = [
+    {'tuple': (3, 1, 2), 'nested': [[2, 1], [1, 2]]},
+    {'mixed': [{'a': 'b'}, 'ab', 'aa', {'a': 'a', 'b': None}]},
+    {'subclasses': Tags([OrderedDict([('z', 1), ('a', 2)]), {'a': 1}]),
+     'bools': [True, False, 1, 0]},
+    {'ignored': [{'id': 2, 'name': 'x'}, {'id': 1, 'name': 'x'}],
+     'empty': [{}, {'a': ''}, {'b': 'x'}], 'none': []},
+]
+
+
+def canonical_json(make, obj):
+    return json.dumps(make(obj), sort_keys=True)
+
+
+def identical(obj):
+    """Return True if both implementations give the same canonical JSON."""
+    return canonical_json(old_make_canonical, obj) == \
+        canonical_json(make_canonical, obj)
+
+
+def bench(obj, number):
+    """Return (old, new) seconds per call for obj, the best of 5 runs."""
+    t_old = min(timeit.repeat(lambda: old_make_canonical(obj),
+                              number=number, repeat=5))
+    t_new = min(timeit.repeat(lambda: make_canonical(obj),
+                              number=number, repeat=5))
+    return t_old / number, t_new / number
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--sizes', type=int, nargs='+',
+                        default=[10, 100, 400, 1600],
+                        help="Numbers of variables and dependencies")
+    parser.add_argument('-d', '--depths', type=int, nargs='+',
+                        default=[4, 8],
+                        help="Depths of nested dependencies")
+    parser.add_argument('-r', '--number', type=int, default=10,
+                        help="Number of calls to time for each entry")
+    args = parser.parse_args()
+
+    if not all(identical(obj) for obj in UNUSUAL):
+        print('Canonical forms of unusual inputs differ')
+        sys.exit(1)
+
+    cases = []
+    for size in args.sizes:
+        for kind in ('Solution', 'Toolbox'):
+            cases.append(('{} {}'.format(kind.lower(), size),
+                          entry(kind, size, random.Random(size))))
+    cases += [('depth {}'.format(depth), nested_entry(depth, random.Random(0)))
+              for depth in args.depths]
+
+    failed = False
+    print('{:>14} {:>10} {:>10} {:>10} {:>8}'.format(
+        'entry', 'identical', 'old (ms)', 'new (ms)', 'speedup'))
+    for name, obj in cases:
+        ok = identical(obj)
+        failed = failed or not ok
+        t_old, t_new = bench(obj, args.number)
+        print('{:>14} {:>10} {:>10.2f} {:>10.2f} {:>7.1f}x'.format(
+            name, 'yes' if ok else 'NO', t_old * 1000, t_new * 1000,
+            t_old / t_new))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""Micro-benchmark for looking up api exposed attributes.
+
+Compares the per-instance cost of scanning a model class for exposed
+attributes (what get_exposed did for every instance) with the cached table
+returned by sssc.api.exposed_attributes, for Solution and Review.
+
+Run from the project directory:
+
+    SSSC_CONFIG=/path/to/config python scripts/bench_exposed.py
+
+"""
+import argparse
+import timeit
+
+from sssc import api
+from sssc.models import Review, Solution
+
+
+def bench(cls, number):
+    """Return per-call times in microseconds (scan, cached) for cls."""
+    scan = timeit.timeit(lambda: api._scan_exposed(cls), number=number)
+    api.exposed_attributes(cls)
+    cached = timeit.timeit(lambda: api.exposed_attributes(cls), number=number)
+    return scan * 1e6 / number, cached * 1e6 / number
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--number', type=int, default=10000,
+                        help="Number of lookups to time for each class")
+    args = parser.parse_args()
+
+    print('{:<10} {:>12} {:>12} {:>10}'.format('class', 'scan (us)',
+                                               'cached (us)', 'speedup'))
+    for cls in (Solution, Review):
+        scan, cached = bench(cls, args.number)
+        print('{:<10} {:>12.2f} {:>12.3f} {:>9.0f}x'.format(
+            cls.__name__, scan, cached, scan / cached))
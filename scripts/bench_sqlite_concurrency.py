@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Concurrency benchmark for the SQLite connection settings.
+
+Runs several worker processes against a scratch database, each doing a mix of
+catalogue style reads and review/signature style writes for a fixed time, and
+reports throughput and "database is locked" failures. The same workload is
+run with the SQLite defaults and with the pragmas from scm.config.
+
+    python scripts/bench_sqlite_concurrency.py -w 8 -t 10
+
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+# Keep in step with the SQLITE_* settings in sssc/scm.config.
+PROFILES = {
+    'default': [],
+    'tuned': [('busy_timeout', 5000),
+              ('journal_mode', 'WAL'),
+              ('synchronous', 'NORMAL'),
+              ('mmap_size', 268435456),
+              ('cache_size', -16000)],
+}
+
+SCHEMA = """
+CREATE TABLE entry (id INTEGER PRIMARY KEY, name TEXT, description TEXT,
+                    latest_id INTEGER, published INTEGER);
+CREATE TABLE review (id INTEGER PRIMARY KEY, entry_id INTEGER, comment TEXT,
+                     rating INTEGER);
+CREATE INDEX review_entry_id ON review (entry_id);
+"""
+
+
+def connect(path, pragmas):
+    # Match the peewee default of a 5 second lock timeout in the driver.
+    conn = sqlite3.connect(path, timeout=5)
+    for name, value in pragmas:
+        conn.execute('PRAGMA {} = {}'.format(name, value))
+    return conn
+
+
+def setup(path, entries):
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany(
+        'INSERT INTO entry (name, description, published) VALUES (?, ?, 1)',
+        [('entry {}'.format(i), 'description ' * 20) for i in range(entries)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def worker(path, pragmas, seconds, write_ratio, entries, seed, results):
+    rnd = random.Random(seed)
+    conn = connect(path, pragmas)
+    reads = writes = locked = 0
+    latency = 0.0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        start = time.monotonic()
+        try:
+            if rnd.random() < write_ratio:
+                with conn:
+                    conn.execute(
+                        'INSERT INTO review (entry_id, comment, rating) '
+                        'VALUES (?, ?, ?)',
+                        (rnd.randrange(entries), 'comment', rnd.randrange(5))
+                    )
+                writes += 1
+            else:
+                conn.execute(
+                    'SELECT e.id, e.name, count(r.id) FROM entry e '
+                    'LEFT JOIN review r ON r.entry_id = e.id '
+                    'WHERE e.latest_id IS NULL AND e.published = 1 '
+                    'GROUP BY e.id LIMIT 50 OFFSET ?',
+                    (rnd.randrange(entries),)
+                ).fetchall()
+                reads += 1
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            locked += 1
+        latency += time.monotonic() - start
+    conn.close()
+    results.put((reads, writes, locked, latency))
+
+
+def run(profile, workers, seconds, write_ratio, entries):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        setup(path, entries)
+        # Set persistent pragmas (journal_mode) before the workers start.
+        connect(path, PROFILES[profile]).close()
+
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(
+                    target=worker,
+                    args=(path, PROFILES[profile], seconds, write_ratio,
+                          entries, i, results))
+                 for i in range(workers)]
+        for p in procs:
+            p.start()
+        totals = [results.get() for p in procs]
+        for p in procs:
+            p.join()
+
+    reads, writes, locked, latency = (sum(t) for t in zip(*totals))
+    ops = reads + writes + locked
+    return dict(profile=profile,
+                reads=reads / seconds,
+                writes=writes / seconds,
+                locked=locked,
+                latency=1000 * latency / ops if ops else 0)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-w', '--workers', type=int, default=4,
+                        help="Number of worker processes")
+    parser.add_argument('-t', '--seconds', type=float, default=5,
+                        help="Run time for each profile")
+    parser.add_argument('-r', '--write-ratio', type=float, default=0.2,
+                        help="Fraction of operations that are writes")
+    parser.add_argument('-n', '--entries', type=int, default=2000,
+                        help="Number of entries in the scratch database")
+    args = parser.parse_args()
+
+    print('{:<8} {:>10} {:>10} {:>8} {:>12}'.format(
+        'profile', 'reads/s', 'writes/s', 'locked', 'mean ms/op'))
+    for profile in PROFILES:
+        r = run(profile, args.workers, args.seconds, args.write_ratio,
+                args.entries)
+        print('{profile:<8} {reads:>10.0f} {writes:>10.0f} {locked:>8d} '
+              '{latency:>12.2f}'.format(**r))
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""Check the incrementally maintained dependency closure against a rebuild.
+
+Makes random changes to the Toolbox dependencies of Solutions and Toolboxes
+in a scratch database, through their models as the views do, with URLs on a
+catalogue host, relative URLs and URLs of another catalogue. Rounds run in
+turn outside any request, in a request for the catalogue host, and in a
+request for another host. After each round the stored DependencyClosure rows
+must equal the rows stored by rebuild_dependency_closure, which is run
+outside any request.
+
+Run from the project directory:
+
+    python scripts/check_dependency_closure.py -n 20 -r 50
+
+"""
+import argparse
+from contextlib import ExitStack
+import os
+import random
+import sys
+import tempfile
+
+HOST = 'sssc.example.org'
+
+
+def closure_rows():
+    from sssc.models import DependencyClosure as C
+    return sorted(C.select(C.ancestor_type, C.ancestor_pk, C.descendant_pk,
+                           C.depth).tuples())
+
+
+def populate(size):
+    """Create size Toolboxes and Solutions in a new database."""
+    from sssc.bootstrap import bootstrap
+    from sssc.models import db, License, Problem, Solution, Toolbox, User
+
+    bootstrap()
+    db.connect()
+    user = User.create(email='fred@example.org', password='x', name='Fred')
+    problem = Problem.create(name='Problem', description='A problem',
+                             author=user, published=True)
+    for i in range(size):
+        Toolbox.create(name='Toolbox {}'.format(i), description='A toolbox',
+                       author=user, license=License.get(), published=True)
+        Solution.create(name='Solution {}'.format(i),
+                        description='A solution', author=user,
+                        problem=problem, template='https://example.org/t',
+                        published=True)
+
+
+def identifier(rnd, toolboxes):
+    """Return a random URL of a Toolbox, on this or another catalogue."""
+    path = '/toolboxes/{}'.format(rnd.choice(toolboxes))
+    if rnd.random() < 0.2:
+        path += '?version=1'
+    return rnd.choice(['http://' + HOST + path,
+                       'https://' + HOST + path,
+                       path,
+                       'http://elsewhere.example.org' + path])
+
+
+def change(rnd):
+    """Make a random change to the entries or their dependencies."""
+    from sssc.models import Solution, SolutionDependency, Toolbox, \
+        ToolboxDependency
+
+    toolboxes = [t.id for t in Toolbox.select(Toolbox.id)]
+    action = rnd.random()
+    if action < 0.05 and len(toolboxes) > 2:
+        Toolbox.get(Toolbox.id == rnd.choice(toolboxes)) \
+               .delete_instance(recursive=True)
+    elif action < 0.1:
+        Toolbox.create(name='New', description='A toolbox',
+                       author=1, license=1, published=True)
+    elif action < 0.6:
+        entry_class, dep_class, fk = rnd.choice([
+            (Toolbox, ToolboxDependency, 'toolbox'),
+            (Solution, SolutionDependency, 'solution'),
+        ])
+        entry = rnd.choice(list(entry_class.select()))
+        dep_class.create(type='toolbox',
+                         identifier=identifier(rnd, toolboxes),
+                         **{fk: entry})
+    else:
+        dep_class = rnd.choice([ToolboxDependency, SolutionDependency])
+        deps = list(dep_class.select())
+        if not deps:
+            return
+        dep = rnd.choice(deps)
+        if action < 0.8:
+            dep.delete_instance()
+        else:
+            dep.identifier = identifier(rnd, toolboxes)
+            dep.save()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--size', type=int, default=20,
+                        help="Number of Toolboxes and of Solutions")
+    parser.add_argument('-r', '--rounds', type=int, default=50,
+                        help="Number of rounds of changes")
+    parser.add_argument('-c', '--changes', type=int, default=10,
+                        help="Number of changes in each round")
+    parser.add_argument('-s', '--seed', type=int, default=0,
+                        help="Seed for the random changes")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    config = os.path.join(tmp, 'check.config')
+    with open(config, 'w') as f:
+        f.write('SQLITE_DB_FILE = {!r}\n'.format(os.path.join(tmp, 'scm.db')))
+        f.write('UPLOADS_DEFAULT_DEST = {!r}\n'.format(tmp))
+        f.write('CATALOGUE_HOSTS = [{!r}]\n'.format(HOST))
+    os.environ['SSSC_CONFIG'] = config
+
+    from sssc import app
+    from sssc.dependencies import rebuild_dependency_closure
+
+    rnd = random.Random(args.seed)
+    populate(args.size)
+    for i in range(args.rounds):
+        with ExitStack() as stack:
+            if i % 3:
+                host = HOST if i % 3 == 1 else 'other.example.org'
+                stack.enter_context(
+                    app.test_request_context(base_url='http://' + host))
+            for j in range(args.changes):
+                change(rnd)
+        incremental = closure_rows()
+        rebuild_dependency_closure()
+        rebuilt = closure_rows()
+        if incremental != rebuilt:
+            print('Round {}: the stored closure differs from a rebuild'
+                  .format(i))
+            print('  missing:', sorted(set(rebuilt) - set(incremental)))
+            print('  extra:', sorted(set(incremental) - set(rebuilt)))
+            sys.exit(1)
+    print('{} rounds of {} changes: the stored closure matches a rebuild, '
+          'with {} rows.'.format(args.rounds, args.changes, len(rebuilt)))
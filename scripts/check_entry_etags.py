@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Check that entry ETags change when the rows embedded in them do.
+
+Serves a Toolbox and a Solution from a scratch database, then edits each kind
+of row embedded in their JSON-LD in another process, as another uwsgi worker
+would. A request with the old ETag in If-None-Match must then get the edited
+response with a new ETag, not 304 Not Modified.
+
+Run from the project directory:
+
+    python scripts/check_entry_etags.py
+
+"""
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+
+# Edits of embedded rows: (name, entry URL, model, id, field, new value, and
+# the path to the field in the response)
+CHANGES = [
+    ('license', '/toolboxes/1', 'License', 1, 'name', 'Renamed',
+     ('license', 'name')),
+    ('author', '/toolboxes/1', 'User', 1, 'name', 'Frederick',
+     ('author', 'name')),
+    ('source', '/toolboxes/1', 'Source', 1, 'url',
+     'https://example.org/moved.git', ('source', 'url')),
+    ('review', '/solutions/1', 'Review', 1, 'comment', 'Edited',
+     ('reviews', 0, 'comment')),
+    ('reviewer', '/solutions/1', 'User', 2, 'name', 'Janet',
+     ('reviews', 0, 'reviewer', 'name')),
+]
+
+HEADERS = {'Accept': 'application/json'}
+
+
+def populate():
+    """Create the entries in a new database."""
+    from sssc.bootstrap import bootstrap, create_problem, create_solution, \
+        create_toolbox
+    from sssc.models import db, License, Review, SolutionReview, Source, User
+
+    bootstrap()
+    db.connect()
+    user = User.create(email='fred@example.org', password='x', name='Fred')
+    other = User.create(email='jane@example.org', password='x', name='Jane')
+    source = Source.create(type='git', url='https://example.org/repo.git')
+    create_toolbox(name='Toolbox', description='A toolbox', author=user,
+                   license=License.get(), source=source, published=True)
+    problem = create_problem(name='Problem', description='A problem',
+                             author=user, published=True)
+    solution = create_solution(name='Solution', description='A solution',
+                               author=user, problem=problem,
+                               template='https://example.org/t.yaml',
+                               published=True)
+    review = Review.create(reviewer=other, comment='Good', rating=4)
+    SolutionReview.create(review=review, entry=solution)
+
+
+def change(model, pk, field, value):
+    """Save a new value of field in the row of model with id pk."""
+    import sssc  # noqa, connects the views to row_changed
+    from sssc import models
+
+    cls = getattr(models, model)
+    row = cls.get(cls.id == pk)
+    setattr(row, field, value)
+    row.save()
+
+
+def lookup(data, path):
+    for key in path:
+        data = data[key]
+    return data
+
+
+def check(client, url, model, pk, field, value, path):
+    """Return (status, new ETag, edited) after changing the row elsewhere."""
+    first = client.get(url, headers=HEADERS)
+    etag = first.headers['ETag']
+    if client.get(url, headers=dict(HEADERS, **{'If-None-Match': etag})) \
+            .status_code != 304:
+        return 'no 304', False, False
+
+    p = multiprocessing.get_context('spawn').Process(
+        target=change, args=(model, pk, field, value))
+    p.start()
+    p.join()
+
+    resp = client.get(url, headers=dict(HEADERS, **{'If-None-Match': etag}))
+    edited = (resp.status_code == 200 and
+              lookup(json.loads(resp.get_data(as_text=True)), path) == value)
+    return resp.status_code, resp.headers['ETag'] != etag, edited
+
+
+if __name__ == '__main__':
+    tmp = tempfile.mkdtemp()
+    config = os.path.join(tmp, 'check.config')
+    with open(config, 'w') as f:
+        f.write('SQLITE_DB_FILE = {!r}\n'.format(os.path.join(tmp, 'scm.db')))
+        f.write('UPLOADS_DEFAULT_DEST = {!r}\n'.format(tmp))
+    os.environ['SSSC_CONFIG'] = config
+
+    from sssc import app
+
+    populate()
+    client = app.test_client()
+
+    failed = False
+    print('{:<10} {:>8} {:>10} {:>8}'.format('change', 'status', 'new etag',
+                                             'edited'))
+    for name, url, *rest in CHANGES:
+        status, new_etag, edited = check(client, url, *rest)
+        failed = failed or not (new_etag and edited)
+        print('{:<10} {:>8} {:>10} {:>8}'.format(
+            name, status, 'yes' if new_etag else 'NO',
+            'yes' if edited else 'NO'))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Check the native JSON-LD provenance against rdflib, and time both.
+
+Builds Solution-like PROV graphs with many dependencies, the way the entry
+views do, and checks that the JSON-LD written by Graph.jsonld parses (with
+rdflib-jsonld) to a graph isomorphic to the same graph converted to rdflib.
+Then times writing the JSON-LD natively and through rdflib-jsonld.
+
+Run from the project directory:
+
+    SSSC_CONFIG=/path/to/config python scripts/check_prov_jsonld.py -n 10 100
+
+"""
+import argparse
+from collections import namedtuple
+from datetime import datetime
+import json
+import sys
+import timeit
+
+from rdflib import ConjunctiveGraph, Graph as RDFGraph
+from rdflib.compare import isomorphic
+
+from sssc.namespaces import BNode, Literal, URIRef, RDF, FOAF, PROV, SSSC, \
+    rdf_graph
+from sssc.prov import add_prov_dependency, add_prov_derivation
+
+Dependency = namedtuple('Dependency',
+                        'id type identifier version repository')
+
+BASE = 'http://sssc.example.org/solutions/1'
+
+
+def solution_graph(size):
+    """Return the PROV graph of a Solution with size dependencies."""
+    g = rdf_graph()
+    s = URIRef(BASE + '?version=3')
+    base = URIRef(BASE + '/prov')
+    server = URIRef('http://sssc.example.org/')
+    created = datetime(2020, 5, 17, 10, 30, 5)
+    for t in [(base, RDF.type, PROV.Bundle),
+              (base, RDF.type, PROV.Entity),
+              (base, PROV.wasAttributedTo, server),
+              (base, PROV.generatedAtTime, Literal(created)),
+              (server, RDF.type, PROV.SoftwareAgent),
+              (server, RDF.type, PROV.Agent),
+              (server, FOAF.name,
+               Literal("Scientific Software Solutions Centre")),
+              (s, RDF.type, PROV.Entity),
+              (s, RDF.type, PROV.Plan),
+              (s, RDF.type, SSSC.Solution)]:
+        g.add(t)
+
+    for i in range(size):
+        if i % 3:
+            dep = Dependency(i, 'python', 'package{}'.format(i),
+                             '1.{}'.format(i), 'https://pypi.org/simple/')
+        else:
+            dep = Dependency(i, 'toolbox',
+                             'http://sssc.example.org/toolboxes/{}'.format(i),
+                             None, None)
+        add_prov_dependency(g, s, dep)
+
+    latest = URIRef(BASE)
+    g.add((latest, RDF.type, PROV.Entity))
+    g.add((s, PROV.specializationOf, latest))
+    previous = URIRef(BASE + '?version=2')
+    g.add((s, PROV.wasRevisionOf, previous))
+    g.add((s, PROV.alternateOf, previous))
+
+    activity = BNode('editActivity')
+    author = URIRef('http://sssc.example.org/users/1')
+    for p, o in [(PROV.startedAtTime, Literal(created)),
+                 (PROV.endedAtTime, Literal(created)),
+                 (PROV.wasStartedBy, author),
+                 (PROV.wasEndedBy, author),
+                 (PROV.wasAssociatedWith, server),
+                 (PROV.generated, s)]:
+        g.add((activity, p, o))
+    g.add((s, PROV.wasGeneratedBy, activity))
+    g.add((s, PROV.generatedAtTime, Literal(created)))
+
+    derivation = add_prov_derivation(g, s, URIRef('http://sssc.example.org/'
+                                                  'problems/1'))
+    g.add((derivation, RDF.type, SSSC.ProblemSolution))
+    derivation = add_prov_derivation(g, s, URIRef('https://example.org/'
+                                                  'template.yaml'))
+    g.add((derivation, RDF.type, SSSC.SolutionTemplate))
+    return g
+
+
+def native_jsonld(g):
+    return json.dumps(g.jsonld())
+
+
+def rdflib_jsonld(g):
+    rdf = g.to_rdflib()
+    context = dict((prefix, str(ns)) for prefix, ns in rdf.namespaces())
+    return rdf.serialize(format='json-ld', context=context, indent=4)
+
+
+def parse_jsonld(data):
+    """Return the triples in the JSON-LD document data as an rdflib Graph.
+
+    rdflib-jsonld 0.4 reads a top-level @graph into a named graph with a
+    blank node name, rather than into the default graph, so the triples of
+    every graph in the document are merged.
+
+    """
+    dataset = ConjunctiveGraph()
+    dataset.parse(data=data, format='json-ld')
+    parsed = RDFGraph()
+    for s, p, o, c in dataset.quads((None, None, None)):
+        parsed.add((s, p, o))
+    return parsed
+
+
+def check(size):
+    """Return True if the native JSON-LD for size is equivalent."""
+    g = solution_graph(size)
+    parsed = parse_jsonld(native_jsonld(g))
+    return len(parsed) == len(g) and isomorphic(parsed, g.to_rdflib())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--sizes', type=int, nargs='+',
+                        default=[10, 100],
+                        help="Numbers of dependencies")
+    parser.add_argument('-r', '--number', type=int, default=10,
+                        help="Number of calls to time for each size")
+    args = parser.parse_args()
+
+    failed = False
+    print('{:>6} {:>10} {:>12} {:>12}'.format('deps', 'equivalent',
+                                              'native (ms)', 'rdflib (ms)'))
+    for size in args.sizes:
+        ok = check(size)
+        failed = failed or not ok
+        g = solution_graph(size)
+        native = timeit.timeit(lambda: native_jsonld(g), number=args.number)
+        rdflib = timeit.timeit(lambda: rdflib_jsonld(g), number=args.number)
+        print('{:>6} {:>10} {:>12.2f} {:>12.2f}'.format(
+            size, 'yes' if ok else 'NO',
+            native * 1000 / args.number, rdflib * 1000 / args.number))
+    sys.exit(1 if failed else 0)
@@ -16,8 +16,7 @@ from .models import Problem, Solution, Toolbox, User, UserRoles, \
     SolutionVar, ToolboxVar, JsonField, Entry, \
     ProblemTag, ToolboxTag, SolutionTag, \
     Application, ApplicationSolution, ApplicationSignature
-from .signatures import hash_entry
-from .views import jsonldify, model_to_dict
+from .views import hash_model, discard_cached_responses
 
 admin = Admin(app, template_mode='bootstrap3')
 
@@ -194,13 +193,9 @@ class EntryModelView(ProtectedModelView):
         """Update entry hashes once we have an id."""
         # Hash updated content and store result with model
         if isinstance(model, Entry):
-            r = jsonldify(model_to_dict(model))
-            entry_json = r.data.decode()
-            model.entry_hash = hash_entry(
-                entry_json,
-                hash_alg=app.config['ENTRY_HASH_FUNCTION']
-            )
+            model.entry_hash = hash_model(model)
             model.save()
+            discard_cached_responses(model)
 
     @action("publish", "Publish",
             "Are you sure you want to publish the selected entries?")
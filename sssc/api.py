@@ -1,4 +1,5 @@
 """Functions for defining and retrieving API objects. """
+from weakref import WeakKeyDictionary
 
 
 def expose(name=None, sense=None):
@@ -35,6 +36,58 @@ def expose(name=None, sense=None):
     return wrapper
 
 
+def _scan_exposed(cls):
+    """Return a list of (attribute, api_name, sense) tuples for cls.
+
+    Inspects every attribute of cls for the annotations added by expose().
+
+    """
+    exposed = []
+    for xname in dir(cls):
+        a = getattr(cls, xname)
+
+        # If it's a property object, look at the getter fn for the annotation
+        if isinstance(a, property):
+            a = a.fget
+
+        apiname = getattr(a, '_api_name', None)
+        if apiname:
+            exposed.append((xname, apiname, getattr(a, '_api_sense', None)))
+    return exposed
+
+
+# Exposed attribute tables, keyed by class.
+_exposed_cache = WeakKeyDictionary()
+
+
+def exposed_attributes(cls):
+    """Return a list of (attribute, api_name, sense) tuples for cls.
+
+    Each tuple describes one attribute of cls that has been exposed through
+    the api. The table is computed the first time it is requested for cls,
+    and cached until invalidate_exposed() is called for cls.
+
+    """
+    try:
+        return _exposed_cache[cls]
+    except KeyError:
+        exposed = _exposed_cache[cls] = tuple(_scan_exposed(cls))
+        return exposed
+
+
+def invalidate_exposed(cls=None):
+    """Forget the cached exposed attributes for cls, or for every class.
+
+    Must be called if exposed attributes are added to or removed from a class
+    after it has been used with the api.
+
+    """
+    if cls is None:
+        _exposed_cache.clear()
+    else:
+        _exposed_cache.pop(cls, None)
+
+
 def get_exposed(x, handler=None, **kwargs):
     """Return a dict of exposed attributes and their values from x.
 
@@ -48,23 +101,14 @@ def get_exposed(x, handler=None, **kwargs):
     exposed = {}
 
     # Find attributes of x that have been annotated with our _api attribute.
-    for xname in dir(type(x)):
-        a = getattr(type(x), xname)
-
-        # If it's a property object, look at the getter fn for the annotation
-        if isinstance(a, property):
-            a = a.fget
-
-        apiname = getattr(a, '_api_name', None)
-        if apiname:
-            value = getattr(x, xname)
-            sense = getattr(a, '_api_sense', None)
-            if sense:
-                handler = kwargs.get('{}_handler'.format(sense))
-            else:
-                handler = kwargs.get('handler')
-            if callable(handler):
-                value = handler(value)
-            exposed[apiname] = value
+    for xname, apiname, sense in exposed_attributes(type(x)):
+        value = getattr(x, xname)
+        if sense:
+            handler = kwargs.get('{}_handler'.format(sense))
+        else:
+            handler = kwargs.get('handler')
+        if callable(handler):
+            value = handler(value)
+        exposed[apiname] = value
 
     return exposed
@@ -0,0 +1,54 @@
+"""In-process caches for serialised responses and other derived data. """
+from collections import OrderedDict
+from threading import Lock
+
+
+class LRUCache(object):
+    """A mapping of at most maxsize items, evicting least recently used first.
+
+    Safe to share between the threads of a worker process. Values should be
+    immutable (bytes, tuples etc), since they are handed out without copying.
+
+    """
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        """Return the value for key, or default if it is not cached."""
+        with self._lock:
+            try:
+                value = self._items[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Cache value under key, evicting the oldest items if full."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def discard(self, predicate):
+        """Remove every item whose key satisfies predicate."""
+        with self._lock:
+            for key in [k for k in self._items if predicate(k)]:
+                del self._items[key]
+
+    def clear(self):
+        """Remove every item."""
+        with self._lock:
+            self._items.clear()
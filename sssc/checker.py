@@ -0,0 +1,89 @@
+"""Background checks of the external resources of entries.
+
+Sweeps the latest version of every Toolbox and Solution, checks their
+resources (see models.check_entry_resources) and records the results in the
+ResourceCheckResult history. Entries are not modified, so a resource that has
+drifted shows up as a changed check until the entry is updated.
+
+Run from the command line with `flask check-resources`, never in a request.
+
+"""
+from threading import Lock
+import time
+from urllib.parse import urlsplit
+
+from .app import app
+from .models import Toolbox, Solution, check_entry_resources, \
+    record_resource_checks
+
+# Types of entry with resources to check.
+CHECKED_TYPES = (Toolbox, Solution)
+
+# Number of entries loaded and checked at a time by sweep_resources.
+SWEEP_CHUNK_SIZE = 100
+
+
+class HostRateLimiter(object):
+    """Spaces out requests to each host by at least interval seconds.
+
+    Shared by the workers checking resources, each of which calls wait(url)
+    before making a request.
+
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self._next = {}
+        self._lock = Lock()
+
+    def wait(self, url):
+        """Block until a request to the host of url is allowed."""
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next.get(host, now))
+            self._next[host] = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def latest_entries(cls, chunk_size=SWEEP_CHUNK_SIZE):
+    """Generate lists of the latest entries of cls, chunk_size at a time."""
+    last_id = 0
+    while True:
+        chunk = list(cls.select()
+                        .where(cls.latest.is_null() & (cls.id > last_id))
+                        .order_by(cls.id)
+                        .limit(chunk_size))
+        if not chunk:
+            break
+        yield chunk
+        last_id = chunk[-1].id
+
+
+def sweep_resources(workers=None, host_interval=None,
+                    chunk_size=SWEEP_CHUNK_SIZE):
+    """Check and record the resources of every latest Toolbox and Solution.
+
+    workers -- Maximum number of concurrent requests (RESOURCE_CHECK_WORKERS
+        by default)
+    host_interval -- Minimum seconds between requests to the same host
+        (RESOURCE_CHECK_HOST_INTERVAL by default)
+
+    Returns a dict with the number of resources checked, changed and failed.
+
+    """
+    if host_interval is None:
+        host_interval = app.config['RESOURCE_CHECK_HOST_INTERVAL']
+    limiter = HostRateLimiter(host_interval)
+    counts = dict(checked=0, changed=0, failed=0)
+    for cls in CHECKED_TYPES:
+        for entries in latest_entries(cls, chunk_size):
+            checks = check_entry_resources(entries,
+                                           workers=workers,
+                                           limiter=limiter)
+            record_resource_checks(entries, checks)
+            for check in checks:
+                counts['checked'] += len(check.checks)
+                counts['changed'] += sum(1 for c in check.get_changed())
+                counts['failed'] += sum(1 for c in check.get_errors())
+    return counts
@@ -1,8 +1,14 @@
 import click
+import time
 
 from . import app
 from .bootstrap import bootstrap
-from .models import db, update_index
+from .checker import sweep_resources
+from .dependencies import rebuild_dependency_closure, dependents_of
+from .views import rehash_entries, REHASH_CHUNK_SIZE, iter_prov_export, \
+    parse_since
+from .models import db, update_index, INDEX_CHUNK_SIZE, create_indexes, \
+    hot_queries, explain_query, audit_signatures, AUDIT_CHUNK_SIZE
 
 @app.cli.command()
 def initdb():
@@ -12,9 +18,164 @@ def initdb():
 
 
 @app.cli.command()
-def index():
+@click.option('--chunk-size', default=INDEX_CHUNK_SIZE,
+              help='Number of entries to index per transaction.')
+def index(chunk_size):
     """Reinitialise the text index."""
     click.echo("Re-initialising the text index.")
     db.connect()
-    update_index()
+    update_index(chunk_size=chunk_size)
     db.close()
+
+
+@app.cli.command()
+@click.option('--chunk-size', default=REHASH_CHUNK_SIZE,
+              help='Number of entries to hash per transaction.')
+def rehash(chunk_size):
+    """Recompute the hashes of all entries.
+
+    SERVER_NAME must be configured to match the served URLs.
+
+    """
+    db.connect()
+    changed = rehash_entries(chunk_size=chunk_size)
+    db.close()
+    click.echo('Updated the hashes of {} entries.'.format(changed))
+
+
+@app.cli.command('create-indexes')
+def create_indexes_command():
+    """Add any missing indexes to an existing database."""
+    db.connect()
+    created = create_indexes(db)
+    db.close()
+    for name in created:
+        click.echo('Created index {}.'.format(name))
+    click.echo('Created {} indexes.'.format(len(created)))
+
+
+@app.cli.command('explain-queries')
+def explain_queries_command():
+    """Show the query plans of the most frequent entry queries."""
+    db.connect()
+    for description, query in hot_queries():
+        click.echo(description)
+        for line in explain_query(query):
+            click.echo('    ' + line)
+    db.close()
+
+
+@app.cli.command('check-resources')
+@click.option('--interval', type=float, default=None,
+              help='Seconds between sweeps, or 0 to sweep once and exit '
+                   '(default RESOURCE_CHECK_INTERVAL).')
+@click.option('--workers', type=int, default=None,
+              help='Maximum number of concurrent requests.')
+@click.option('--host-interval', type=float, default=None,
+              help='Minimum seconds between requests to the same host.')
+def check_resources(interval, workers, host_interval):
+    """Check the resources of the latest Toolboxes and Solutions."""
+    if interval is None:
+        interval = app.config['RESOURCE_CHECK_INTERVAL']
+    while True:
+        db.connect()
+        try:
+            counts = sweep_resources(workers=workers,
+                                     host_interval=host_interval)
+        finally:
+            db.close()
+        click.echo('Checked {checked} resources: {changed} changed, '
+                   '{failed} failed.'.format(**counts))
+        if not interval:
+            break
+        time.sleep(interval)
+
+
+@app.cli.command('verify-signatures')
+@click.option('--workers', type=int, default=None,
+              help='Number of worker processes (default: number of CPUs, '
+                   '0 or 1 to verify in this process).')
+@click.option('--chunk-size', default=AUDIT_CHUNK_SIZE,
+              help='Number of signatures to load at a time.')
+def verify_signatures_command(workers, chunk_size):
+    """Re-verify every stored signature against its key and entry."""
+    db.connect()
+    counts = dict(checked=0, missing=0, invalid=0, changed=0)
+    try:
+        for signature, reason in audit_signatures(workers=workers,
+                                                  chunk_size=chunk_size):
+            counts['checked'] += 1
+            if reason:
+                counts[reason] += 1
+                click.echo('Signature {}: {}'.format(signature.id, reason))
+    finally:
+        db.close()
+    click.echo('Checked {checked} signatures: {invalid} invalid, {changed} '
+               'for changed entries, {missing} for missing entries.'
+               .format(**counts))
+
+
+@app.cli.command('export-prov')
+@click.option('--since', default=None,
+              help='Only export versions created since this ISO 8601 date '
+                   'or datetime.')
+@click.option('--format', 'format_', type=click.Choice(['nquads', 'ntriples']),
+              default='nquads',
+              help='N-Quads with a named graph per entry version, or '
+                   'N-Triples.')
+@click.option('--unpublished', is_flag=True,
+              help='Include unpublished entries.')
+@click.option('--output', type=click.File('w'), default='-',
+              help='File to write to (default standard output).')
+def export_prov(since, format_, unpublished, output):
+    """Export the PROV graphs of every entry version.
+
+    SERVER_NAME must be configured to match the served URLs.
+
+    """
+    if since:
+        try:
+            since = parse_since(since)
+        except ValueError:
+            raise click.BadParameter('Invalid timestamp.', param_hint='since')
+    db.connect()
+    try:
+        for text in iter_prov_export(since or None,
+                                     published_only=not unpublished,
+                                     quads=format_ == 'nquads'):
+            output.write(text)
+    finally:
+        db.close()
+
+
+@app.cli.command('rebuild-dependencies')
+def rebuild_dependencies():
+    """Rebuild the transitive dependency table of the latest entries.
+
+    CATALOGUE_HOSTS must list the hosts of the Toolbox URLs in dependencies.
+
+    """
+    db.connect()
+    try:
+        rows = rebuild_dependency_closure()
+    finally:
+        db.close()
+    click.echo('Stored {} transitive dependencies.'.format(rows))
+
+
+@app.cli.command('dependents')
+@click.argument('toolbox_id', type=int)
+@click.option('--type', 'type_', type=click.Choice(['Solution', 'Toolbox']),
+              default=None, help='Only list entries of this type.')
+def dependents(toolbox_id, type_):
+    """List the latest entries that depend on a Toolbox, nearest first.
+
+    Solutions are listed before Toolboxes.
+
+    """
+    db.connect()
+    try:
+        for name, pk, depth in dependents_of(toolbox_id, type_):
+            click.echo('{} {} (depth {})'.format(name, pk, depth))
+    finally:
+        db.close()
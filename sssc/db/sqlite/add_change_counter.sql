@@ -0,0 +1,8 @@
+PRAGMA foreign_keys=OFF;
+begin transaction;
+
+CREATE TABLE "changecounter" ("name" VARCHAR(255) NOT NULL PRIMARY KEY, "value" INTEGER NOT NULL);
+
+PRAGMA foreign_key_check;
+commit;
+PRAGMA foreign_keys;
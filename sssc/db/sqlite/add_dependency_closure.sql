@@ -0,0 +1,10 @@
+PRAGMA foreign_keys=OFF;
+begin transaction;
+
+CREATE TABLE "dependencyclosure" ("id" INTEGER NOT NULL PRIMARY KEY, "ancestor_type" VARCHAR(255) NOT NULL, "ancestor_pk" INTEGER NOT NULL, "descendant_pk" INTEGER NOT NULL, "depth" INTEGER NOT NULL);
+CREATE UNIQUE INDEX "dependencyclosure_ancestor_type_ancestor_pk_descendant_pk" ON "dependencyclosure" ("ancestor_type", "ancestor_pk", "descendant_pk");
+CREATE INDEX "dependencyclosure_descendant_pk_ancestor_type_depth_ancestor_pk" ON "dependencyclosure" ("descendant_pk", "ancestor_type", "depth", "ancestor_pk");
+
+PRAGMA foreign_key_check;
+commit;
+PRAGMA foreign_keys;
@@ -0,0 +1,9 @@
+PRAGMA foreign_keys=OFF;
+begin transaction;
+
+CREATE TABLE "entryrevision" ("id" INTEGER NOT NULL PRIMARY KEY, "entry_type" VARCHAR(255) NOT NULL, "entry_pk" INTEGER NOT NULL, "version" INTEGER NOT NULL, "snapshot" INTEGER NOT NULL, "data" TEXT NOT NULL);
+CREATE UNIQUE INDEX "entryrevision_entry_type_entry_pk_version" ON "entryrevision" ("entry_type", "entry_pk", "version");
+
+PRAGMA foreign_key_check;
+commit;
+PRAGMA foreign_keys;
@@ -0,0 +1,9 @@
+PRAGMA foreign_keys=OFF;
+begin transaction;
+
+CREATE TABLE "resourcecheckresult" ("id" INTEGER NOT NULL PRIMARY KEY, "entry_type" VARCHAR(255) NOT NULL, "entry_pk" INTEGER NOT NULL, "field" VARCHAR(255) NOT NULL, "url" VARCHAR(255) NOT NULL, "checked_at" DATETIME NOT NULL, "content_hash" VARCHAR(255), "is_changed" INTEGER, "error" TEXT);
+CREATE INDEX "resourcecheckresult_entry_type_entry_pk_field_checked_at" ON "resourcecheckresult" ("entry_type", "entry_pk", "field", "checked_at");
+
+PRAGMA foreign_key_check;
+commit;
+PRAGMA foreign_keys;
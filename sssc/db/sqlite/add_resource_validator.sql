@@ -0,0 +1,9 @@
+PRAGMA foreign_keys=OFF;
+begin transaction;
+
+CREATE TABLE "resourcevalidator" ("id" INTEGER NOT NULL PRIMARY KEY, "url" VARCHAR(255) NOT NULL, "content_hash" VARCHAR(255) NOT NULL, "etag" VARCHAR(255), "last_modified" VARCHAR(255));
+CREATE UNIQUE INDEX "resourcevalidator_url" ON "resourcevalidator" ("url");
+
+PRAGMA foreign_key_check;
+commit;
+PRAGMA foreign_keys;
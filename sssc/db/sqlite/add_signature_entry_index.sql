@@ -0,0 +1,16 @@
+PRAGMA foreign_keys=OFF;
+begin transaction;
+
+ALTER TABLE "signature" ADD COLUMN "entry_type" VARCHAR(255);
+ALTER TABLE "signature" ADD COLUMN "entry_pk" INTEGER;
+
+UPDATE "signature" SET "entry_type" = 'Problem', "entry_pk" = (SELECT "problem_id" FROM "problemsignature" WHERE "signature_id" = "signature"."id") WHERE "id" IN (SELECT "signature_id" FROM "problemsignature");
+UPDATE "signature" SET "entry_type" = 'Toolbox', "entry_pk" = (SELECT "toolbox_id" FROM "toolboxsignature" WHERE "signature_id" = "signature"."id") WHERE "id" IN (SELECT "signature_id" FROM "toolboxsignature");
+UPDATE "signature" SET "entry_type" = 'Solution', "entry_pk" = (SELECT "solution_id" FROM "solutionsignature" WHERE "signature_id" = "signature"."id") WHERE "id" IN (SELECT "signature_id" FROM "solutionsignature");
+UPDATE "signature" SET "entry_type" = 'Application', "entry_pk" = (SELECT "application_id" FROM "applicationsignature" WHERE "signature_id" = "signature"."id") WHERE "id" IN (SELECT "signature_id" FROM "applicationsignature");
+
+CREATE INDEX "signature_entry_type_entry_pk" ON "signature" ("entry_type", "entry_pk");
+
+PRAGMA foreign_key_check;
+commit;
+PRAGMA foreign_keys;
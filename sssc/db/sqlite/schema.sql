@@ -22,14 +22,16 @@ CREATE TABLE "user" ("id" INTEGER NOT NULL PRIMARY KEY, "email" VARCHAR(255) NOT
 CREATE UNIQUE INDEX "user_email" ON "user" ("email");
 CREATE TABLE "problemtag" ("id" INTEGER NOT NULL PRIMARY KEY, "tag" VARCHAR(255) NOT NULL, "entry_id" INTEGER NOT NULL, FOREIGN KEY ("entry_id") REFERENCES "problem" ("id"));
 CREATE INDEX "problemtag_entry_id" ON "problemtag" ("entry_id");
+CREATE INDEX "problemtag_tag" ON "problemtag" ("tag");
 CREATE TABLE "uploadedresource" ("id" INTEGER NOT NULL PRIMARY KEY, "filename" VARCHAR(255) NOT NULL, "name" VARCHAR(255) NOT NULL, "uploaded_at" DATETIME NOT NULL, "published" INTEGER NOT NULL, "user_id" INTEGER NOT NULL, FOREIGN KEY ("user_id") REFERENCES "user" ("id"));
 CREATE INDEX "uploadedresource_user_id" ON "uploadedresource" ("user_id");
 CREATE TABLE "publickey" ("id" INTEGER NOT NULL PRIMARY KEY, "user_id" INTEGER NOT NULL, "registered_at" DATETIME NOT NULL, "key" TEXT NOT NULL, FOREIGN KEY ("user_id") REFERENCES "user" ("id"));
 CREATE INDEX "publickey_user_id" ON "publickey" ("user_id");
-CREATE TABLE "signature" ("id" INTEGER NOT NULL PRIMARY KEY, "signature" VARCHAR(255) NOT NULL, "signed_string" TEXT NOT NULL, "created_at" DATETIME NOT NULL, "user_id_id" INTEGER, "public_key_id" INTEGER NOT NULL, FOREIGN KEY ("user_id_id") REFERENCES "user" ("id"), FOREIGN KEY ("public_key_id") REFERENCES "publicke
-y" ("id"));                                                                                                                                   
+CREATE INDEX "publickey_user_id_registered_at" ON "publickey" ("user_id", "registered_at");
+CREATE TABLE "signature" ("id" INTEGER NOT NULL PRIMARY KEY, "signature" VARCHAR(255) NOT NULL, "signed_string" TEXT NOT NULL, "created_at" DATETIME NOT NULL, "user_id_id" INTEGER, "public_key_id" INTEGER NOT NULL, "entry_type" VARCHAR(255), "entry_pk" INTEGER, FOREIGN KEY ("user_id_id") REFERENCES "user" ("id"), FOREIGN KEY ("public_key_id") REFERENCES "publickey" ("id"));
 CREATE INDEX "signature_user_id_id" ON "signature" ("user_id_id");
 CREATE INDEX "signature_public_key_id" ON "signature" ("public_key_id");
+CREATE INDEX "signature_entry_type_entry_pk" ON "signature" ("entry_type", "entry_pk");
 CREATE TABLE "problemsignature" ("id" INTEGER NOT NULL PRIMARY KEY, "problem_id" INTEGER NOT NULL, "signature_id" INTEGER NOT NULL, FOREIGN KEY ("problem_id") REFERENCES "problem" ("id"), FOREIGN KEY ("signature_id") REFERENCES "signature" ("id") ON DELETE CASCADE);
 CREATE INDEX "problemsignature_problem_id" ON "problemsignature" ("problem_id");
 CREATE UNIQUE INDEX "problemsignature_signature_id" ON "problemsignature" ("signature_id");
@@ -41,8 +43,10 @@ CREATE INDEX "solutionsignature_solution_id" ON "solutionsignature" ("solution_i
 CREATE UNIQUE INDEX "solutionsignature_signature_id" ON "solutionsignature" ("signature_id");
 CREATE TABLE "solutiontag" ("id" INTEGER NOT NULL PRIMARY KEY, "tag" VARCHAR(255) NOT NULL, "entry_id" INTEGER NOT NULL, FOREIGN KEY ("entry_id") REFERENCES "solution" ("id"));
 CREATE INDEX "solutiontag_entry_id" ON "solutiontag" ("entry_id");
+CREATE INDEX "solutiontag_tag" ON "solutiontag" ("tag");
 CREATE TABLE "solutiondependency" ("id" INTEGER NOT NULL PRIMARY KEY, "type" VARCHAR(255) NOT NULL, "identifier" VARCHAR(255) NOT NULL, "version" VARCHAR(255), "repository" VARCHAR(255), "solution_id" INTEGER NOT NULL, FOREIGN KEY ("solution_id") REFERENCES "solution" ("id"));
 CREATE INDEX "solutiondependency_solution_id" ON "solutiondependency" ("solution_id");
+CREATE INDEX "solutiondependency_type_identifier" ON "solutiondependency" ("type", "identifier");
 CREATE TABLE "toolboxvar" ("id" INTEGER NOT NULL PRIMARY KEY, "name" VARCHAR(255) NOT NULL, "type" VARCHAR(255) NOT NULL, "label" VARCHAR(255), "description" TEXT, "optional" INTEGER NOT NULL, "default" VARCHAR(255), "min" REAL, "max" REAL, "step" REAL, "values" VARCHAR(255), "toolbox_id" INTEGER NOT NULL, FOREIGN KE
 Y ("toolbox_id") REFERENCES "toolbox" ("id"));
 CREATE INDEX "toolboxvar_toolbox_id" ON "toolboxvar" ("toolbox_id");
@@ -51,8 +55,10 @@ CREATE INDEX "toolboxsignature_toolbox_id" ON "toolboxsignature" ("toolbox_id");
 CREATE UNIQUE INDEX "toolboxsignature_signature_id" ON "toolboxsignature" ("signature_id");
 CREATE TABLE "toolboxtag" ("id" INTEGER NOT NULL PRIMARY KEY, "tag" VARCHAR(255) NOT NULL, "entry_id" INTEGER NOT NULL, FOREIGN KEY ("entry_id") REFERENCES "toolbox" ("id"));
 CREATE INDEX "toolboxtag_entry_id" ON "toolboxtag" ("entry_id");
+CREATE INDEX "toolboxtag_tag" ON "toolboxtag" ("tag");
 CREATE TABLE "toolboxdependency" ("id" INTEGER NOT NULL PRIMARY KEY, "type" VARCHAR(255) NOT NULL, "identifier" VARCHAR(255) NOT NULL, "version" VARCHAR(255), "repository" VARCHAR(255), "toolbox_id" INTEGER NOT NULL, FOREIGN KEY ("toolbox_id") REFERENCES "toolbox" ("id"));
 CREATE INDEX "toolboxdependency_toolbox_id" ON "toolboxdependency" ("toolbox_id");
+CREATE INDEX "toolboxdependency_type_identifier" ON "toolboxdependency" ("type", "identifier");
 CREATE TABLE "review" ("id" INTEGER NOT NULL PRIMARY KEY, "reviewer_id" INTEGER NOT NULL, "comment" TEXT NOT NULL, "rating" INTEGER NOT NULL, "created_at" DATETIME NOT NULL, FOREIGN KEY ("reviewer_id") REFERENCES "user" ("id"));
 CREATE INDEX "review_reviewer_id" ON "review" ("reviewer_id");
 CREATE TABLE "solutionreview" ("review_id" INTEGER NOT NULL PRIMARY KEY, "entry_id" INTEGER NOT NULL, FOREIGN KEY ("review_id") REFERENCES "review" ("id"), FOREIGN KEY ("entry_id") REFERENCES "solution" ("id"));
@@ -89,6 +95,10 @@ CREATE TABLE "problem" ("id" INTEGER NOT NULL PRIMARY KEY, "name" VARCHAR(255) N
  ("author_id") REFERENCES "user" ("id"), FOREIGN KEY ("latest_id") REFERENCES "problem" ("id"));                                                                                                                                                             
 CREATE INDEX "problem_author_id" ON "problem" ("author_id");
 CREATE INDEX "problem_latest_id" ON "problem" ("latest_id");
+CREATE INDEX "problem_latest_id_published_created_at" ON "problem" ("latest_id", "published", "created_at");
+CREATE INDEX "problem_latest_id_created_at" ON "problem" ("latest_id", "created_at");
+CREATE INDEX "problem_latest_id_version" ON "problem" ("latest_id", "version");
+CREATE INDEX "problem_author_id_latest_id" ON "problem" ("author_id", "latest_id");
 CREATE TABLE "toolbox" ("id" INTEGER NOT NULL PRIMARY KEY, "name" VARCHAR(255) NOT NULL, "description" TEXT NOT NULL, "created_at" DATETIME NOT NULL, "version" INTEGER NOT NULL, "entry_hash" VARCHAR(255), "published" INTEGER NOT NULL, "icon" VARCHAR(255), "author_id" INTEGER NOT NULL, "latest_id" INTEGER, "homepage" 
 VARCHAR(255), "license_id" INTEGER NOT NULL, "source_id" INTEGER, "command" VARCHAR(255), "puppet" VARCHAR(255), "puppet_hash" VARCHAR(255), FOREIGN KEY ("author_id") REFERENCES "user" ("id"), FOREIGN KEY ("latest_id") REFERENCES "toolbox" ("id"), FOREIGN KEY ("license_id") REFERENCES "license" ("id"), FOREIGN KEY ("
 source_id") REFERENCES "source" ("id"));
@@ -96,11 +106,19 @@ CREATE INDEX "toolbox_author_id" ON "toolbox" ("author_id");
 CREATE INDEX "toolbox_latest_id" ON "toolbox" ("latest_id");
 CREATE INDEX "toolbox_license_id" ON "toolbox" ("license_id");
 CREATE INDEX "toolbox_source_id" ON "toolbox" ("source_id");
+CREATE INDEX "toolbox_latest_id_published_created_at" ON "toolbox" ("latest_id", "published", "created_at");
+CREATE INDEX "toolbox_latest_id_created_at" ON "toolbox" ("latest_id", "created_at");
+CREATE INDEX "toolbox_latest_id_version" ON "toolbox" ("latest_id", "version");
+CREATE INDEX "toolbox_author_id_latest_id" ON "toolbox" ("author_id", "latest_id");
 CREATE TABLE "solution" ("id" INTEGER NOT NULL PRIMARY KEY, "name" VARCHAR(255) NOT NULL, "description" TEXT NOT NULL, "created_at" DATETIME NOT NULL, "version" INTEGER NOT NULL, "entry_hash" VARCHAR(255), "published" INTEGER NOT NULL, "icon" VARCHAR(255), "author_id" INTEGER NOT NULL, "latest_id" INTEGER, "problem_i
 d" INTEGER NOT NULL, "runtime" VARCHAR(255) NOT NULL, "template" VARCHAR(255) NOT NULL, "template_hash" VARCHAR(255), FOREIGN KEY ("author_id") REFERENCES "user" ("id"), FOREIGN KEY ("latest_id") REFERENCES "solution" ("id"), FOREIGN KEY ("problem_id") REFERENCES "problem" ("id"));
 CREATE INDEX "solution_author_id" ON "solution" ("author_id");
 CREATE INDEX "solution_latest_id" ON "solution" ("latest_id");
 CREATE INDEX "solution_problem_id" ON "solution" ("problem_id");
+CREATE INDEX "solution_latest_id_published_created_at" ON "solution" ("latest_id", "published", "created_at");
+CREATE INDEX "solution_latest_id_created_at" ON "solution" ("latest_id", "created_at");
+CREATE INDEX "solution_latest_id_version" ON "solution" ("latest_id", "version");
+CREATE INDEX "solution_author_id_latest_id" ON "solution" ("author_id", "latest_id");
 CREATE TABLE "applicationsolution" ("id" INTEGER NOT NULL PRIMARY KEY, "app_id" INTEGER NOT NULL, "solution_id" INTEGER NOT NULL, FOREIGN KEY ("app_id") REFERENCES "application" ("id"), FOREIGN KEY ("solution_id") REFERENCES "solution" ("id"));
 CREATE INDEX "applicationsolution_app_id" ON "applicationsolution" ("app_id");
 CREATE INDEX "applicationsolution_solution_id" ON "applicationsolution" ("solution_id");
@@ -108,6 +126,20 @@ CREATE TABLE "application" ("id" INTEGER NOT NULL PRIMARY KEY, "name" VARCHAR(25
  "latest_id" INTEGER, FOREIGN KEY ("author_id") REFERENCES "user" ("id"), FOREIGN KEY ("latest_id") REFERENCES "application" ("id"));
 CREATE INDEX "application_author_id" ON "application" ("author_id");
 CREATE INDEX "application_latest_id" ON "application" ("latest_id");
+CREATE INDEX "application_latest_id_published_created_at" ON "application" ("latest_id", "published", "created_at");
+CREATE INDEX "application_latest_id_created_at" ON "application" ("latest_id", "created_at");
+CREATE INDEX "application_latest_id_version" ON "application" ("latest_id", "version");
+CREATE INDEX "application_author_id_latest_id" ON "application" ("author_id", "latest_id");
 CREATE TABLE "applicationsignature" ("id" INTEGER NOT NULL PRIMARY KEY, "application_id" INTEGER NOT NULL, "signature_id" INTEGER NOT NULL, FOREIGN KEY ("application_id") REFERENCES "application" ("id"), FOREIGN KEY ("signature_id") REFERENCES "signature" ("id") ON DELETE CASCADE);
 CREATE INDEX "applicationsignature_application_id" ON "applicationsignature" ("application_id");
 CREATE UNIQUE INDEX "applicationsignature_signature_id" ON "applicationsignature" ("signature_id");
+CREATE TABLE "resourcevalidator" ("id" INTEGER NOT NULL PRIMARY KEY, "url" VARCHAR(255) NOT NULL, "content_hash" VARCHAR(255) NOT NULL, "etag" VARCHAR(255), "last_modified" VARCHAR(255));
+CREATE UNIQUE INDEX "resourcevalidator_url" ON "resourcevalidator" ("url");
+CREATE TABLE "resourcecheckresult" ("id" INTEGER NOT NULL PRIMARY KEY, "entry_type" VARCHAR(255) NOT NULL, "entry_pk" INTEGER NOT NULL, "field" VARCHAR(255) NOT NULL, "url" VARCHAR(255) NOT NULL, "checked_at" DATETIME NOT NULL, "content_hash" VARCHAR(255), "is_changed" INTEGER, "error" TEXT);
+CREATE INDEX "resourcecheckresult_entry_type_entry_pk_field_checked_at" ON "resourcecheckresult" ("entry_type", "entry_pk", "field", "checked_at");
+CREATE TABLE "entryrevision" ("id" INTEGER NOT NULL PRIMARY KEY, "entry_type" VARCHAR(255) NOT NULL, "entry_pk" INTEGER NOT NULL, "version" INTEGER NOT NULL, "snapshot" INTEGER NOT NULL, "data" TEXT NOT NULL);
+CREATE UNIQUE INDEX "entryrevision_entry_type_entry_pk_version" ON "entryrevision" ("entry_type", "entry_pk", "version");
+CREATE TABLE "dependencyclosure" ("id" INTEGER NOT NULL PRIMARY KEY, "ancestor_type" VARCHAR(255) NOT NULL, "ancestor_pk" INTEGER NOT NULL, "descendant_pk" INTEGER NOT NULL, "depth" INTEGER NOT NULL);
+CREATE UNIQUE INDEX "dependencyclosure_ancestor_type_ancestor_pk_descendant_pk" ON "dependencyclosure" ("ancestor_type", "ancestor_pk", "descendant_pk");
+CREATE INDEX "dependencyclosure_descendant_pk_ancestor_type_depth_ancestor_pk" ON "dependencyclosure" ("descendant_pk", "ancestor_type", "depth", "ancestor_pk");
+CREATE TABLE "changecounter" ("name" VARCHAR(255) NOT NULL PRIMARY KEY, "value" INTEGER NOT NULL);
@@ -0,0 +1,526 @@
+"""Resolution of the transitive dependencies of Solutions and Toolboxes.
+
+A Solution depends on Toolboxes, which can depend on other Toolboxes, python
+packages and puppet modules. resolve_dependencies walks this graph and
+returns an install plan, with every dependency listed once and after
+everything it depends on.
+
+Resolved Toolboxes are memoised by (toolbox id, version) and the count of
+changes to Toolboxes and their dependencies stored in the database, so a
+Toolbox shared by many Solutions is only walked once per process, until any
+process changes a Toolbox.
+
+The DependencyClosure table stores every Toolbox each latest Solution and
+Toolbox depends on, directly or not, so dependents_of can find every entry
+affected by a Toolbox with one indexed lookup. It is kept up to date by
+update_dependency_closure, which is called whenever an entry or one of its
+dependencies is saved or deleted through its model (see models.row_changed).
+Toolbox dependencies are on this catalogue if their URL is relative or on one
+of the configured catalogue_hosts, whatever the host of the request.
+
+"""
+from collections import namedtuple
+from urllib.parse import parse_qs, urlsplit
+
+from werkzeug.exceptions import HTTPException
+
+from .app import app
+from .cache import LRUCache
+from .models import db, Dependency, DependencyClosure, Solution, Toolbox, \
+    ToolboxDependency, bump_change_counter, change_counter, entry_type, \
+    is_latest, load_revision, row_changed, _select_in, CLOSURE_CHUNK_SIZE
+
+# One step of an install plan. Toolbox steps have the toolbox_id and the
+# resolved version of the Toolbox, and its puppet module. Other steps are
+# the type, identifier, version and repository of a dependency.
+PlanStep = namedtuple('PlanStep', ['type', 'identifier', 'version',
+                                   'repository', 'toolbox_id', 'puppet'])
+
+
+class DependencyError(Exception):
+    """Raised when the dependencies of an entry cannot be resolved."""
+
+
+class DependencyCycle(DependencyError):
+    """Raised when Toolboxes depend on each other in a cycle.
+
+    Cycle is the list of (toolbox id, version) in the cycle, starting and
+    ending with the same Toolbox.
+
+    """
+    def __init__(self, cycle):
+        super().__init__('Dependency cycle: {}'.format(
+            ' -> '.join('toolbox {} v{}'.format(*key) for key in cycle)
+        ))
+        self.cycle = cycle
+
+
+# Resolved Toolboxes, keyed by (toolbox id, version, changes), where changes
+# is the TOOLBOX_CHANGES counter. Values are steps, see _resolve_toolbox.
+_resolved = LRUCache(app.config['DEPENDENCY_CACHE_SIZE'])
+
+# Name of the ChangeCounter for Toolboxes and their dependencies.
+TOOLBOX_CHANGES = 'toolboxes'
+
+
+@row_changed.connect
+def count_toolbox_change(row, **kwargs):
+    """Bump the TOOLBOX_CHANGES counter when a Toolbox or dependency changes.
+
+    The counter is part of the keys of resolved Toolboxes, so no process
+    uses the plans resolved before the change. The cache of this process is
+    cleared to free their space.
+
+    """
+    if isinstance(row, (Toolbox, ToolboxDependency)):
+        bump_change_counter(TOOLBOX_CHANGES)
+        _resolved.clear()
+
+
+def catalogue_hosts():
+    """Return the set of hosts the URLs of this catalogue are on.
+
+    These are CATALOGUE_HOSTS and SERVER_NAME from the config, never the host
+    of a request, so the Toolboxes an entry depends on are the same in every
+    request, command and process.
+
+    """
+    hosts = set(app.config.get('CATALOGUE_HOSTS') or ())
+    if app.config.get('SERVER_NAME'):
+        hosts.add(app.config['SERVER_NAME'])
+    return hosts
+
+
+if not catalogue_hosts():
+    raise RuntimeError('CATALOGUE_HOSTS or SERVER_NAME must be configured, '
+                       'to find the Toolbox dependencies in this catalogue')
+
+
+def toolbox_id(identifier):
+    """Return the id of the Toolbox identifier is the URL of, or None.
+
+    Returns None if identifier is not the URL of a Toolbox in this
+    catalogue. A URL with a host must be on one of the catalogue_hosts.
+
+    """
+    url = urlsplit(identifier)
+    if url.netloc and url.netloc not in catalogue_hosts():
+        return None
+    try:
+        endpoint, args = app.url_map.bind('localhost').match(url.path,
+                                                             method='GET')
+    except HTTPException:
+        return None
+    if endpoint != 'site.toolbox_api':
+        return None
+    return args.get('entry_id')
+
+
+def toolbox_reference(identifier, version=None):
+    """Return (toolbox id, version) for a toolbox dependency, or None.
+
+    Identifier is the URL of a Toolbox, which may include a version
+    parameter. Otherwise version is used, and None stands for the latest
+    version. Returns None if identifier is not the URL of a Toolbox in this
+    catalogue (see toolbox_id), and raises DependencyError if the version is
+    not a number.
+
+    """
+    entry_id = toolbox_id(identifier)
+    if entry_id is None:
+        return None
+    version = parse_qs(urlsplit(identifier).query).get('version',
+                                                       [version])[0]
+    try:
+        return entry_id, int(version) if version else None
+    except ValueError:
+        raise DependencyError('Invalid version {!r} of toolbox {}'.format(
+            version, entry_id
+        ))
+
+
+def load_toolbox(toolbox_id, version=None):
+    """Return version of the Toolbox toolbox_id, or the latest if None."""
+    T = Toolbox
+    try:
+        if version is None:
+            return T.get((T.id == toolbox_id) & T.latest.is_null())
+        return T.get((T.version == version) &
+                     ((T.latest == toolbox_id) | (T.id == toolbox_id)))
+    except T.DoesNotExist:
+        if version is not None:
+            return load_revision(T, toolbox_id, version)
+    return None
+
+
+def entry_dependencies(entry):
+    """Return the dependencies of entry, in the order they were added."""
+    deps = getattr(entry, 'deps_prefetch', None)
+    if deps is None:
+        fk = type(entry)._meta.reverse_rel['deps']
+        deps = fk.model_class.select().where(fk == entry.id) \
+                                      .order_by(fk.model_class.id)
+    return list(deps)
+
+
+def _step_key(step):
+    """Return the key identifying the thing installed by step."""
+    if step.toolbox_id is not None:
+        return 'toolbox', step.toolbox_id, step.version
+    return step
+
+
+def _unique(steps):
+    """Return steps without repeats, keeping the first of each."""
+    seen = set()
+    unique = []
+    for step in steps:
+        key = _step_key(step)
+        if key not in seen:
+            seen.add(key)
+            unique.append(step)
+    return tuple(unique)
+
+
+def _resolve_deps(deps, path, changes):
+    """Return the steps for installing deps.
+
+    Path is the list of (toolbox id, version) being resolved, for detecting
+    cycles, and changes the TOOLBOX_CHANGES counter.
+
+    """
+    steps = []
+    for dep in deps:
+        ref = None
+        if dep.type == 'toolbox':
+            ref = toolbox_reference(dep.identifier, dep.version)
+        if ref is None:
+            steps.append(PlanStep(dep.type, dep.identifier, dep.version,
+                                  dep.repository, None, None))
+            continue
+        steps.extend(_resolve_toolbox(ref[0], ref[1], path, changes))
+    return steps
+
+
+def _resolve_toolbox(toolbox_id, version, path, changes):
+    """Return the steps for installing a Toolbox.
+
+    The steps end with the Toolbox itself, after all its dependencies.
+    Results are memoised until the TOOLBOX_CHANGES counter, changes, is
+    bumped.
+
+    """
+    toolbox = load_toolbox(toolbox_id, version)
+    if toolbox is None:
+        raise DependencyError('Toolbox {} version {} not found'.format(
+            toolbox_id, 'latest' if version is None else version
+        ))
+    key = (toolbox_id, toolbox.version)
+    if key in path:
+        raise DependencyCycle(path[path.index(key):] + [key])
+
+    cache_key = key + (changes,)
+    steps = _resolved.get(cache_key)
+    if steps is not None:
+        # The Toolboxes being resolved may depend on this one through a
+        # different path than when it was cached.
+        for step in steps:
+            step_key = (step.toolbox_id, step.version)
+            if step_key in path:
+                raise DependencyCycle(path[path.index(step_key):] +
+                                      [key, step_key])
+    else:
+        steps = _resolve_deps(entry_dependencies(toolbox), path + [key],
+                              changes)
+        steps.append(PlanStep('toolbox', toolbox.name, toolbox.version,
+                              None, toolbox_id, toolbox.puppet))
+        steps = _unique(steps)
+        _resolved.set(cache_key, steps)
+    return steps
+
+
+def resolve_dependencies(entry):
+    """Return the install plan for the dependencies of entry.
+
+    Entry is a Solution or Toolbox. The plan is a list of PlanSteps in
+    install order: each Toolbox after all of its own dependencies, and
+    otherwise in the order the dependencies were added. Each thing is
+    installed once, so Toolboxes shared by several dependencies appear once.
+
+    Raises DependencyCycle if Toolboxes depend on each other in a cycle,
+    and DependencyError if a Toolbox cannot be found.
+
+    """
+    path = []
+    if isinstance(entry, Toolbox):
+        path.append((entry.entry_id, entry.version))
+    steps = _resolve_deps(entry_dependencies(entry), path,
+                          change_counter(TOOLBOX_CHANGES))
+    return list(_unique(steps))
+
+
+# Types of entry that can depend on Toolboxes, by entry_type.
+DEPENDENT_TYPES = {'Solution': Solution, 'Toolbox': Toolbox}
+
+
+def direct_dependencies(entry):
+    """Return the set of ids of the Toolboxes entry depends on directly.
+
+    Every version of a Toolbox counts as the Toolbox itself, and a Toolbox
+    depending on itself is ignored.
+
+    """
+    ids = set()
+    for dep in entry_dependencies(entry):
+        if dep.type == 'toolbox':
+            ids.add(toolbox_id(dep.identifier))
+    ids.discard(None)
+    if isinstance(entry, Toolbox):
+        ids.discard(entry.id)
+    return ids
+
+
+def _load_closures(keys):
+    """Return {key: {toolbox id: depth}} of the stored closures of keys.
+
+    Keys are (entry type, id) pairs.
+
+    """
+    C = DependencyClosure
+    closures = {key: {} for key in keys}
+    by_type = {}
+    for name, pk in closures:
+        by_type.setdefault(name, []).append(pk)
+    for name, pks in by_type.items():
+        query = (C.select(C.ancestor_pk, C.descendant_pk, C.depth)
+                  .where(C.ancestor_type == name)
+                  .tuples())
+        for pk, descendant, depth in _select_in(query, C.ancestor_pk, pks):
+            closures[(name, pk)][descendant] = depth
+    return closures
+
+
+def _store_closures(closures, replace=True):
+    """Store closures, a dict of {key: {toolbox id: depth}}.
+
+    Any stored rows for the keys are replaced, unless replace is False.
+    Returns the number of rows inserted.
+
+    """
+    C = DependencyClosure
+    if replace:
+        by_type = {}
+        for name, pk in closures:
+            by_type.setdefault(name, []).append(pk)
+        for name, pks in by_type.items():
+            for i in range(0, len(pks), CLOSURE_CHUNK_SIZE):
+                chunk = pks[i:i + CLOSURE_CHUNK_SIZE]
+                C.delete().where((C.ancestor_type == name) &
+                                 (C.ancestor_pk << chunk)).execute()
+    rows = [dict(ancestor_type=name, ancestor_pk=pk,
+                 descendant_pk=descendant, depth=depth)
+            for (name, pk), closure in closures.items()
+            for descendant, depth in closure.items()]
+    for i in range(0, len(rows), CLOSURE_CHUNK_SIZE):
+        C.insert_many(rows[i:i + CLOSURE_CHUNK_SIZE]).execute()
+    return len(rows)
+
+
+def _closure(key, children, closures):
+    """Return {toolbox id: depth} for key, which depends on children.
+
+    Closures has the closures of the child Toolboxes, by key. Each Toolbox is
+    at the shortest depth it can be reached by.
+
+    """
+    closure = {}
+    for child in children:
+        closure[child] = 1
+    for child in children:
+        for descendant, depth in closures.get(('Toolbox', child), {}).items():
+            if depth + 1 < closure.get(descendant, depth + 2):
+                closure[descendant] = depth + 1
+    if key[0] == 'Toolbox':
+        closure.pop(key[1], None)
+    return closure
+
+
+def update_dependency_closure(entry, deleted=False):
+    """Update the stored dependency closure after entry has changed.
+
+    Call after the dependencies of entry have been saved, or with deleted
+    True when entry is being deleted. The closures of entry, and if it is a
+    Toolbox of every entry that depends on it, are recomputed from their
+    direct dependencies (the rows with depth 1), and only those that have
+    changed are rewritten. Only the latest versions of entries are tracked.
+
+    """
+    key = (entry_type(entry), entry.id)
+    if key[0] not in DEPENDENT_TYPES or entry.id is None:
+        return
+    if not is_latest(entry):
+        return
+    children = set() if deleted else direct_dependencies(entry)
+
+    with db.atomic():
+        own = _load_closures([key])[key]
+        if {pk for pk, depth in own.items() if depth == 1} == children:
+            return
+        affected = [key]
+        if key[0] == 'Toolbox':
+            affected.extend((name, pk)
+                            for name, pk, depth in dependents_of(entry.id))
+        old = _load_closures(affected)
+        edges = {k: {pk for pk, depth in closure.items() if depth == 1}
+                 for k, closure in old.items()}
+        edges[key] = children
+
+        # The closures of Toolboxes outside the affected entries do not
+        # change, so load them as they are.
+        affected_keys = set(affected)
+        closures = _load_closures({('Toolbox', pk)
+                                   for pks in edges.values() for pk in pks}
+                                  - affected_keys)
+
+        # Recompute each affected entry after the affected Toolboxes it
+        # depends on, and any left in cycles by iterating until nothing
+        # changes.
+        waiting = {}
+        parents = {}
+        for k in affected:
+            waiting[k] = {('Toolbox', pk) for pk in edges[k]} & affected_keys
+            for child in waiting[k]:
+                parents.setdefault(child, []).append(k)
+        ready = [k for k in affected if not waiting[k]]
+        while ready:
+            k = ready.pop()
+            closures[k] = _closure(k, edges[k], closures)
+            for parent in parents.get(k, []):
+                waiting[parent].discard(k)
+                if not waiting[parent]:
+                    ready.append(parent)
+        cyclic = [k for k in affected if k not in closures]
+        for k in cyclic:
+            closures[k] = {}
+        changed = True
+        while changed:
+            changed = False
+            for k in cyclic:
+                closure = _closure(k, edges[k], closures)
+                if closure != closures[k]:
+                    closures[k] = closure
+                    changed = True
+
+        _store_closures({k: closures[k] for k in affected
+                         if closures[k] != old[k]})
+
+
+@row_changed.connect
+def dependencies_changed(row, deleted=False, **kwargs):
+    """Update the dependency closure when an entry or dependency changes."""
+    if isinstance(row, Dependency):
+        for name, cls in DEPENDENT_TYPES.items():
+            fk = cls._meta.reverse_rel['deps']
+            if isinstance(row, fk.model_class):
+                try:
+                    entry = getattr(row, fk.name)
+                except cls.DoesNotExist:
+                    # Deleted along with its entry.
+                    return
+                update_dependency_closure(entry)
+    elif isinstance(row, tuple(DEPENDENT_TYPES.values())):
+        update_dependency_closure(row, deleted=deleted)
+
+
+def _walk(key, edges):
+    """Return {toolbox id: depth} for key, breadth first through edges."""
+    closure = {}
+    seen = {key[1]} if key[0] == 'Toolbox' else set()
+    frontier = edges.get(key, set()) - seen
+    depth = 1
+    while frontier:
+        for pk in frontier:
+            closure[pk] = depth
+        seen |= frontier
+        frontier = {child for pk in frontier
+                    for child in edges.get(('Toolbox', pk), ())} - seen
+        depth += 1
+    return closure
+
+
+def rebuild_dependency_closure():
+    """Rebuild the whole dependency closure table.
+
+    For a new table, or after dependencies have been changed without calling
+    update_dependency_closure. Returns the number of rows stored.
+
+    """
+    edges = {}
+    for name, cls in DEPENDENT_TYPES.items():
+        fk = cls._meta.reverse_rel['deps']
+        D = fk.model_class
+        query = (D.select(fk, D.identifier)
+                  .join(cls, on=(fk == cls.id))
+                  .where(cls.latest.is_null() & (D.type == 'toolbox'))
+                  .tuples())
+        for pk, identifier in query:
+            ref = toolbox_id(identifier)
+            if ref is not None:
+                edges.setdefault((name, pk), set()).add(ref)
+    closures = {key: _walk(key, edges) for key in edges}
+    with db.atomic():
+        DependencyClosure.delete().execute()
+        return _store_closures(closures, replace=False)
+
+
+def dependents_of(toolbox_id, entry_type=None):
+    """Return (entry type, id, depth) for the entries that use a Toolbox.
+
+    These are the latest Solutions and Toolboxes that depend on the Toolbox,
+    directly (depth 1) or through other Toolboxes, by type and then nearest
+    first. Entry_type ('Solution' or 'Toolbox') restricts them to one type of
+    entry.
+
+    """
+    C = DependencyClosure
+    query = C.select(C.ancestor_type, C.ancestor_pk, C.depth) \
+             .where(C.descendant_pk == toolbox_id)
+    if entry_type is not None:
+        query = query.where(C.ancestor_type == entry_type)
+    # In the order of the (descendant_pk, ancestor_type, depth, ancestor_pk)
+    # index, so the rows are read from it without sorting.
+    return list(query.order_by(C.ancestor_type, C.depth, C.ancestor_pk)
+                     .tuples())
+
+
+def dependent_entries(toolbox_id, entry_type=None):
+    """Return (entry, depth) for the entries that use a Toolbox.
+
+    As dependents_of, but with the entries loaded, one query per type.
+
+    """
+    dependents = dependents_of(toolbox_id, entry_type)
+    wanted = {}
+    for name, pk, depth in dependents:
+        wanted.setdefault(name, []).append(pk)
+    loaded = {}
+    for name, pks in wanted.items():
+        cls = DEPENDENT_TYPES[name]
+        for entry in _select_in(cls.select(), cls.id, pks):
+            loaded[(name, entry.id)] = entry
+    return [(loaded[(name, pk)], depth) for name, pk, depth in dependents
+            if (name, pk) in loaded]
+
+
+def closure_of(entry):
+    """Return (toolbox id, depth) for every Toolbox entry depends on.
+
+    Nearest first, from the stored closure of the latest version of entry.
+
+    """
+    C = DependencyClosure
+    return list(C.select(C.descendant_pk, C.depth)
+                 .where((C.ancestor_type == entry_type(entry)) &
+                        (C.ancestor_pk == entry.entry_id))
+                 .order_by(C.depth, C.descendant_pk)
+                 .tuples())
@@ -1,12 +1,15 @@
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, \
+    as_completed
+from datetime import date, datetime
 from functools import partial
 import hashlib
-import importlib
 import requests
+import requests.adapters
 from flask import json
+from flask.signals import Namespace
 from peewee import BooleanField, CharField, DateTimeField, \
     DoubleField, ForeignKeyField, IntegerField, PrimaryKeyField, \
-    TextField, Model
+    TextField, Model, JOIN, fn
 # Use the ext database to get FTS support
 # from peewee import SqliteDatabase
 from playhouse.sqlite_ext import FTSModel, SqliteExtDatabase, \
@@ -14,6 +17,13 @@ from playhouse.sqlite_ext import FTSModel, SqliteExtDatabase, \
 from flask_security import UserMixin, RoleMixin, current_user
 from sssc import api
 from .app import app
+from .signatures import verify_signatures
+
+# Sent with the instance whenever a row is saved or deleted through its model
+# (see BaseModel), with deleted=True for a delete. Bulk queries, such as
+# Model.update(), do not send it.
+_signals = Namespace()
+row_changed = _signals.signal('row-changed')
 
 # Valid source repositories
 SOURCE_TYPES = (('git', 'GIT repository'),
@@ -34,10 +44,30 @@ VARIABLE_TYPES = (('int', 'Integer'),
                   ('random-int', 'Random Integer'),
                   ('file', 'Input dataset'))
 
+# Pragmas set on each connection, and the config settings for them. The busy
+# timeout comes first, so the remaining pragmas wait for any lock.
+_SQLITE_PRAGMA_SETTINGS = (('busy_timeout', 'SQLITE_BUSY_TIMEOUT'),
+                           ('journal_mode', 'SQLITE_JOURNAL_MODE'),
+                           ('synchronous', 'SQLITE_SYNCHRONOUS'),
+                           ('mmap_size', 'SQLITE_MMAP_SIZE'),
+                           ('cache_size', 'SQLITE_CACHE_SIZE'))
+
+
+def sqlite_pragmas(config):
+    """Return the list of (pragma, value) pairs configured in config."""
+    pragmas = []
+    for pragma, setting in _SQLITE_PRAGMA_SETTINGS:
+        value = config.get(setting)
+        if value is not None:
+            pragmas.append((pragma, value))
+    pragmas.extend(config.get('SQLITE_PRAGMAS') or [])
+    return pragmas
+
+
 # Database set up
 db = SqliteExtDatabase(app.config['SQLITE_DB_FILE'],
-                       threadlocals=True)
-#                       journal_mode='WAL')
+                       threadlocals=True,
+                       pragmas=sqlite_pragmas(app.config))
 
 # Runtime choices for solution templates
 RUNTIME_CHOICES = (('python2', 'Latest Python 2.x'),
@@ -55,41 +85,90 @@ def text_search(text, latest_only=True):
     versions that match are returned. If latest_only is False then all matching
     versions will be returned.
 
-    """
-    def constraint(cls, index):
-        c = index.match(text)
-        if latest_only:
-            c = c & cls.latest.is_null()
-        return c
+    See search_entries for a single ranked and paginated list of results.
 
+    """
     results = dict(problems=[], toolboxes=[], solutions=[], applications=[])
 
     if text:
-        results["problems"] = (Problem
-                               .select()
-                               .join(ProblemIndex,
-                                     on=(Problem.id == ProblemIndex.docid))
-                               .where(constraint(Problem, ProblemIndex))
-                               .order_by(ProblemIndex.bm25()))
-        results["toolboxes"] = (Toolbox
-                                .select()
-                                .join(ToolboxIndex,
-                                      on=(Toolbox.id == ToolboxIndex.docid))
-                                .where(constraint(Toolbox, ToolboxIndex))
-                                .order_by(ToolboxIndex.bm25()))
-        results["solutions"] = (Solution
-                                .select()
-                                .join(SolutionIndex,
-                                      on=(Solution.id == SolutionIndex.docid))
-                                .where(constraint(Solution, SolutionIndex))
-                                .order_by(SolutionIndex.bm25()))
-        results["applications"] = (Application
-                               .select()
-                               .join(ApplicationIndex,
-                                     on=(Application.id == ApplicationIndex.docid))
-                               .where(constraint(Application, ApplicationIndex))
-                               .order_by(ApplicationIndex.bm25()))
+        for key, cls, index in _SEARCH_TYPES:
+            results[key] = (_search_query(cls, index, text, latest_only)
+                            .order_by(index.bm25()))
+
+    return results
 
+
+def _search_query(cls, index, text, latest_only, *selection):
+    """Return a query selecting entries of cls that match text in index.
+
+    Selects the entry model by default, or the columns in selection.
+
+    """
+    c = index.match(text)
+    if latest_only:
+        c = c & cls.latest.is_null()
+    return (cls
+            .select(*selection)
+            .join(index, on=(cls.id == index.docid))
+            .where(c))
+
+
+def search_entries(text, limit=None, offset=0, latest_only=True):
+    """Search every type of entry for text, ranking all matches together.
+
+    Returns a dict with the matching entries ranked by bm25 in 'results',
+    starting at offset and limited to limit entries (all if None), and the
+    total number of matches of each type in 'counts', using the same keys as
+    text_search. The number of queries is fixed: one for the ranked page, one
+    for the counts, and one per type of entry on the page.
+
+    """
+    counts = {key: 0 for key, cls, index in _SEARCH_TYPES}
+    results = dict(results=[], counts=counts, total=0)
+    if not text:
+        return results
+
+    # Rank the ids of matching entries of every type in one query.
+    parts = []
+    params = []
+    count_parts = []
+    count_params = []
+    for kind, (key, cls, index) in enumerate(_SEARCH_TYPES):
+        sql, p = _search_query(cls, index, text, latest_only,
+                               cls.id, index.bm25().alias('score')).sql()
+        parts.append('SELECT {} AS kind, id, score FROM ({})'
+                     .format(kind, sql))
+        params.extend(p)
+        sql, p = _search_query(cls, index, text, latest_only,
+                               fn.COUNT(cls.id)).sql()
+        count_parts.append('({})'.format(sql))
+        count_params.extend(p)
+    sql = ' UNION ALL '.join(parts) + ' ORDER BY score, kind, id'
+    if limit is not None:
+        sql += ' LIMIT ? OFFSET ?'
+        params.extend([limit, offset])
+    elif offset:
+        sql += ' LIMIT -1 OFFSET ?'
+        params.append(offset)
+    hits = [(kind, id) for kind, id, score in db.execute_sql(sql, params)]
+
+    # Count all the matches of each type in one query.
+    row = db.execute_sql('SELECT ' + ', '.join(count_parts),
+                         count_params).fetchone()
+    for (key, cls, index), count in zip(_SEARCH_TYPES, row):
+        counts[key] = count
+    results['total'] = sum(counts.values())
+
+    # Load the entries on this page, one query per type.
+    wanted = {}
+    for kind, id in hits:
+        wanted.setdefault(kind, []).append(id)
+    loaded = {}
+    for kind, ids in wanted.items():
+        cls = _SEARCH_TYPES[kind][1]
+        for entry in _select_in(cls.select(), cls.id, ids):
+            loaded[(kind, entry.id)] = entry
+    results['results'] = [loaded[hit] for hit in hits if hit in loaded]
     return results
 
 
@@ -99,37 +178,181 @@ _rels_ignored_for_cloning = frozenset({
     'solutionindex_set',
     'toolboxindex_set',
     'signatures',
-    'solutions'
+    'solutions',
+    # Reviews belong to the entry they were written for, and their relation
+    # rows are keyed by the review, so they cannot be copied.
+    'problemreview_set',
+    'toolboxreview_set',
+    'solutionreview_set'
 })
 
+# Number of rows copied per INSERT statement by clone_model. Every column is a
+# bound parameter, so keep this well under the SQLite limit on host parameters
+# divided by the widest child table.
+CLONE_CHUNK_SIZE = 100
 
-def clone_model(model):
+
+def clone_model(model, **overrides):
     """Create and return a clone of model.
 
     Save a clone of entry in the database, including all reverse relations
-    (Vars, Deps etc).
+    (Vars, Deps etc). Fields in overrides are set on the clone before it is
+    saved.
+
+    The copy is made in one transaction, with one query and one bulk insert
+    per child table, rather than a query and two writes per child row.
 
     """
-    # Copy current data and clean the primary key and creation time so new ones
-    # are assigned.
-    data = dict(model._data)
-    data.pop(model._meta.primary_key.name)
+    with db.atomic():
+        # Copy current data and clean the primary key so a new one is
+        # assigned.
+        data = dict(model._data)
+        data.pop(model._meta.primary_key.name, None)
+        data.update(overrides)
+
+        # Create the new entry
+        # TODO handle unique id/entry combo!
+        copy = type(model).create(**data)
+
+        if model._get_pk_value() is None:
+            # A version rebuilt by load_revision has no stored child rows, so
+            # copy the ones attached to it.
+            _clone_revision_children(model, copy)
+        else:
+            _clone_children(type(model), {model._get_pk_value(): copy})
+
+        # The child rows are inserted in bulk, so announce the copy again now
+        # that it has them.
+        row_changed.send(copy)
+    return copy
+
+
+def _clone_revision_children(model, copy):
+    """Copy the child rows attached to a version rebuilt by load_revision."""
+    for rel_name, fk in type(model)._meta.reverse_rel.items():
+        if rel_name in _rels_ignored_for_cloning:
+            continue
+        child_class = fk.model_class
+        pk_name = child_class._meta.primary_key.name
+        rows = []
+        for child in getattr(model, rel_name + '_prefetch', []):
+            row = dict(child._data)
+            row.pop(pk_name, None)
+            row[fk.name] = copy._get_pk_value()
+            rows.append(row)
+        for i in range(0, len(rows), CLONE_CHUNK_SIZE):
+            child_class.insert_many(rows[i:i + CLONE_CHUNK_SIZE]).execute()
 
-    # Create the new entry
-    # TODO handle unique id/entry combo!
-    copy = type(model).create(**data)
 
-    # Copy all child instances and point the copies at the clone.
-    for rel_name, fk_field in model._meta.reverse_rel.items():
+def _clone_children(model_class, copies):
+    """Copy the child rows of the model_class instances in copies.
+
+    copies maps the primary key of each original to its copy, and the child
+    rows are pointed at the copies.
+
+    """
+    for rel_name, fk in model_class._meta.reverse_rel.items():
         # Ignore known relations.
-        if rel_name not in _rels_ignored_for_cloning:
-            for rel_instance in getattr(model, rel_name):
-                child = clone_model(rel_instance)
-                setattr(child, fk_field.name, copy)
-                child.save()
+        if rel_name in _rels_ignored_for_cloning:
+            continue
+        child_class = fk.model_class
+        pk_name = child_class._meta.primary_key.name
+        children = list(_select_in(child_class.select(), fk, list(copies)))
+        if not children:
+            continue
+
+        rows = []
+        for child in children:
+            row = dict(child._data)
+            row.pop(pk_name)
+            row[fk.name] = copies[row[fk.name]]._get_pk_value()
+            rows.append(row)
+
+        if any(name not in _rels_ignored_for_cloning
+               for name in child_class._meta.reverse_rel):
+            # The copies are needed to clone the next level, so create them
+            # one at a time to get their ids.
+            _clone_children(child_class, {
+                child._get_pk_value(): child_class.create(**row)
+                for child, row in zip(children, rows)
+            })
+        else:
+            for i in range(0, len(rows), CLONE_CHUNK_SIZE):
+                child_class.insert_many(rows[i:i + CLONE_CHUNK_SIZE]).execute()
+
+
+# Maximum number of ids bound into one IN (...) clause when prefetching, which
+# keeps us well under the SQLite limit on host parameters.
+PREFETCH_CHUNK_SIZE = 500
+
+
+def _select_in(query, field, values):
+    """Yield the results of query restricted to rows where field is in values.
+
+    Values are split into chunks of PREFETCH_CHUNK_SIZE, with one query per
+    chunk.
 
-    # Return the copy
-    return copy
+    """
+    values = list(values)
+    for i in range(0, len(values), PREFETCH_CHUNK_SIZE):
+        chunk = values[i:i + PREFETCH_CHUNK_SIZE]
+        for obj in query.where(field << chunk):
+            yield obj
+
+
+def prefetch_foreign(instances, field):
+    """Load the objects referenced by foreign key field for all instances.
+
+    The related objects are fetched in a single query and cached on each
+    instance, so accessing the field afterwards does not touch the database.
+    Instances are not marked dirty. Returns a list of the distinct related
+    objects.
+
+    """
+    ids = set(i._data.get(field.name) for i in instances)
+    ids.discard(None)
+    if not ids:
+        return []
+
+    to_field = field.to_field
+    related = {getattr(obj, to_field.name): obj
+               for obj in _select_in(field.rel_model.select(), to_field, ids)}
+    for instance in instances:
+        obj = related.get(instance._data.get(field.name))
+        if obj is not None:
+            instance._obj_cache[field.name] = obj
+    return list(related.values())
+
+
+def prefetch_reverse(instances, related_name, fk):
+    """Load the reverse relation related_name for all instances.
+
+    Fk is the foreign key field on the related model that points back at
+    instances. The related objects are fetched in a single query, and stored
+    on each instance as a list in the <related_name>_prefetch attribute (the
+    same convention as peewee.prefetch). Each related object has its foreign
+    key pointed at the cached parent instance. Returns a list of all the
+    related objects.
+
+    """
+    key = fk.to_field.name
+    groups = {}
+    for instance in instances:
+        groups.setdefault(instance._data.get(key), [])
+    groups.pop(None, None)
+
+    children = []
+    if groups:
+        for child in _select_in(fk.model_class.select(), fk, groups):
+            groups[child._data.get(fk.name)].append(child)
+            children.append(child)
+
+    for instance in instances:
+        rel_instances = groups.get(instance._data.get(key), [])
+        for child in rel_instances:
+            child._obj_cache[fk.name] = instance
+        setattr(instance, related_name + '_prefetch', rel_instances)
+    return children
 
 
 def user_entries(user):
@@ -141,6 +364,28 @@ def user_entries(user):
     return entries
 
 
+def user_owns_entry(user, entry_id):
+    """Return True if user created an entry with entry_id.
+
+    Checks the same kinds of entry as user_entries, but with an indexed query
+    for each rather than loading them all.
+
+    """
+    return any(cls.select()
+                  .where((cls.id == entry_id) & (cls.author == user.id))
+                  .exists()
+               for cls in (Problem, Toolbox, Solution))
+
+
+def user_owns_upload(user, resource_id):
+    """Return True if user uploaded the resource with resource_id."""
+    return (UploadedResource
+            .select()
+            .where((UploadedResource.id == resource_id) &
+                   (UploadedResource.user == user.id))
+            .exists())
+
+
 def is_latest(entry):
     """Return True if entry is the latest version.
 
@@ -160,11 +405,22 @@ def is_unpublished(entry):
 class BaseModel(Model):
     """Base of all application models.
 
-    Sets database connection.
+    Sets database connection, and sends row_changed when an instance is
+    saved or deleted.
     """
     class Meta:
         database = db
 
+    def save(self, *args, **kwargs):
+        rows = super().save(*args, **kwargs)
+        row_changed.send(self)
+        return rows
+
+    def delete_instance(self, *args, **kwargs):
+        rows = super().delete_instance(*args, **kwargs)
+        row_changed.send(self, deleted=True)
+        return rows
+
 
 class Role(BaseModel, RoleMixin):
     """Auth role"""
@@ -230,6 +486,12 @@ class PublicKey(BaseModel):
     registered_at = DateTimeField(default=datetime.now)
     key = TextField()
 
+    class Meta:
+        indexes = (
+            # Finds the current key of a user (see User.public_key)
+            (('user', 'registered_at'), False),
+        )
+
 
 class Signature(BaseModel):
     """Stores signed digests for entries.
@@ -243,21 +505,46 @@ class Signature(BaseModel):
     created_at = DateTimeField(default=datetime.now)
     user_id = ForeignKeyField(User, null=True, related_name='signatures')
     public_key = ForeignKeyField(PublicKey, related_name='signatures')
+    # Type name and id of the signed entry, so it can be found directly
+    # instead of searching each of the <Entry>Signature relations.
+    entry_type = CharField(null=True)
+    entry_pk = IntegerField(null=True)
+
+    entry = property(lambda self: self.get_entry())
+
+    class Meta:
+        indexes = (
+            (('entry_type', 'entry_pk'), False),
+        )
+
+    def get_entry_key(self):
+        """Return the (entry_type, entry_pk) of the signed entry, or None.
 
-    entry = property(lambda self: self.get_entry_rel().entry)
+        Signatures saved before the entry columns were added are looked up in
+        the <Entry>Signature relations with a single query.
+
+        """
+        if self.entry_type and self.entry_pk is not None:
+            return self.entry_type, self.entry_pk
+        return _signature_entry_keys([self.id]).get(self.id)
 
     def get_entry_rel(self):
         """Return the Entry relation this is a signature for."""
-        if self.problemsignature_set.count() == 1:
-            return self.problemsignature_set[0]
-        if self.toolboxsignature_set.count() == 1:
-            return self.toolboxsignature_set[0]
-        if self.solutionsignature_set.count() == 1:
-            return self.solutionsignature_set[0]
-        if self.applicationsignature_set.count() == 1:
-            return self.applicationsignature_set[0]
+        key = self.get_entry_key()
+        if key:
+            rel = _SIGNATURE_RELATIONS[key[0]][1]
+            try:
+                return rel.get(rel.signature == self.id)
+            except rel.DoesNotExist:
+                pass
         return None
 
+    def get_entry(self):
+        """Return the Entry this is a signature for."""
+        if not hasattr(self, 'entry_prefetch'):
+            prefetch_signature_entries([self])
+        return self.entry_prefetch
+
 
 class ResourceCheck(object):
     """Stores the results of a resources check for an Entry.
@@ -276,10 +563,11 @@ class ResourceCheck(object):
         """Return True if all checks succeeded."""
         return all(check['errors'] is None for check in self.checks)
 
-    def add_check(self, field, url, is_changed=False, errors=None):
+    def add_check(self, field, url, is_changed=False, errors=None,
+                  content_hash=None):
         """Add a check result for field/url."""
         self.checks.append(dict(field=field, url=url, is_changed=is_changed,
-                                errors=errors))
+                                errors=errors, content_hash=content_hash))
 
     def get_changed(self):
         """Return the checks that indicated the value changed."""
@@ -290,6 +578,497 @@ class ResourceCheck(object):
         return (check for check in self.checks if check['errors'])
 
 
+class ResourceValidator(BaseModel):
+    """Cache validators for an external resource, for conditional requests.
+
+    url -- URL of the resource
+    content_hash -- Hash of the content when it was last downloaded
+    etag -- ETag header sent with that content, if any
+    last_modified -- Last-Modified header sent with that content, if any
+
+    """
+    url = CharField(unique=True)
+    content_hash = CharField()
+    etag = CharField(null=True)
+    last_modified = CharField(null=True)
+
+
+# Shared HTTP session for resource checks, created by resource_session.
+_resource_session = None
+
+
+def resource_session():
+    """Return the HTTP session used to check resources.
+
+    The session keeps a pool of connections per host, large enough for every
+    worker in check_entry_resources.
+
+    """
+    global _resource_session
+    if _resource_session is None:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_maxsize=app.config['RESOURCE_CHECK_WORKERS']
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _resource_session = session
+    return _resource_session
+
+
+def fetch_resource(url, validator=None):
+    """Download url and return (content_hash, etag, last_modified).
+
+    The content is hashed in chunks as it arrives, rather than read into
+    memory. If validator (the ResourceValidator for url) is given, the request
+    is conditional, and None is returned if the resource is not modified.
+
+    Raises requests.exceptions.RequestException if the request fails.
+
+    """
+    headers = {}
+    if validator is not None:
+        if validator.etag:
+            headers['If-None-Match'] = validator.etag
+        if validator.last_modified:
+            headers['If-Modified-Since'] = validator.last_modified
+    req = resource_session().get(url,
+                                 headers=headers,
+                                 stream=True,
+                                 timeout=app.config['RESOURCE_TIMEOUT'])
+    try:
+        if req.status_code == 304 and headers:
+            return None
+        h = resource_hash()
+        for chunk in req.iter_content(app.config['RESOURCE_CHUNK_SIZE']):
+            h.update(chunk)
+        return (h.hexdigest(), req.headers.get('ETag'),
+                req.headers.get('Last-Modified'))
+    finally:
+        req.close()
+
+
+def check_entry_resources(entries, resources=None, workers=None,
+                          limiter=None):
+    """Check the resources of entries, updating the hashes of any that changed.
+
+    Each distinct URL is fetched once, by a pool of worker threads sharing
+    the resource_session. Requests are conditional on the validators stored
+    from the last download, so unchanged resources are not downloaded again.
+    The hash fields are set on the entries but the entries are not saved.
+
+    resources -- (url field, hash field) pairs to check, instead of the
+        _resource_fields of each entry
+    workers -- Maximum number of concurrent requests (RESOURCE_CHECK_WORKERS
+        by default)
+    limiter -- Optional object whose wait(url) method is called by a worker
+        before each request, to limit the rate of requests
+
+    Returns a list with a ResourceCheck for each entry, in the same order.
+
+    """
+    # Find the (entry, url field, hash field, url) to check.
+    tasks = []
+    for entry in entries:
+        for rfield, hfield in resources or entry._resource_fields:
+            url = getattr(entry, rfield)
+
+            # Handle an empty resource field. Ignore it if it's nullable,
+            # otherwise raise an error since validation has failed
+            # somewhere.
+            if not url:
+                if entry._meta.fields.get(rfield).null:
+                    continue
+                else:
+                    raise ValueError('Required resource field {} of {} is emptry.'
+                                     .format(rfield, type(entry).__name__))
+            tasks.append((entry, rfield, hfield, url))
+
+    urls = list({url for entry, rfield, hfield, url in tasks})
+    validators = {v.url: v for v in _select_in(ResourceValidator.select(),
+                                                ResourceValidator.url,
+                                                urls)}
+
+    def fetch(url):
+        if limiter is not None:
+            limiter.wait(url)
+        return fetch_resource(url, validators.get(url))
+
+    # Fetch each URL once, concurrently.
+    results = {}
+    if urls:
+        if workers is None:
+            workers = app.config['RESOURCE_CHECK_WORKERS']
+        with ThreadPoolExecutor(max_workers=min(workers, len(urls))) as pool:
+            futures = {pool.submit(fetch, url): url for url in urls}
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    results[url] = (future.result(), None)
+                except requests.exceptions.RequestException as e:
+                    results[url] = (None, [e])
+
+    # Store the validators for anything that was downloaded.
+    with db.atomic():
+        for url, (result, errors) in results.items():
+            if result is not None:
+                content_hash, etag, last_modified = result
+                if etag or last_modified:
+                    (ResourceValidator
+                     .insert(url=url, content_hash=content_hash, etag=etag,
+                             last_modified=last_modified)
+                     .upsert()
+                     .execute())
+                else:
+                    (ResourceValidator
+                     .delete()
+                     .where(ResourceValidator.url == url)
+                     .execute())
+
+    checks = {id(entry): ResourceCheck() for entry in entries}
+    for entry, rfield, hfield, url in tasks:
+        result, errors = results[url]
+        new_hash = None
+        is_changed = None
+        if not errors:
+            if result is None:
+                # Not modified since the content stored with the validator.
+                new_hash = validators[url].content_hash
+            else:
+                new_hash = result[0]
+            is_changed = new_hash != getattr(entry, hfield)
+            if is_changed:
+                setattr(entry, hfield, new_hash)
+        checks[id(entry)].add_check(rfield, url, is_changed, errors,
+                                    new_hash)
+    return [checks[id(entry)] for entry in entries]
+
+
+class ResourceCheckResult(BaseModel):
+    """History of the checks of the external resources of entries.
+
+    entry_type -- Type of the Entry that was checked (see entry_type)
+    entry_pk -- Id of the Entry that was checked
+    field -- Name of the resource field
+    url -- URL that was checked
+    checked_at -- Datetime of the check
+    content_hash -- Hash of the content, or None if the check failed
+    is_changed -- Whether the content differs from the hash in the Entry
+    error -- Errors raised by the check, if any
+
+    """
+    entry_type = CharField()
+    entry_pk = IntegerField()
+    field = CharField()
+    url = CharField()
+    checked_at = DateTimeField(default=datetime.now)
+    content_hash = CharField(null=True)
+    is_changed = BooleanField(null=True)
+    error = TextField(null=True)
+
+    class Meta:
+        indexes = (
+            (('entry_type', 'entry_pk', 'field', 'checked_at'), False),
+        )
+
+
+# Number of check results inserted per statement by record_resource_checks.
+# Eight parameters are bound per result, so keep this under an eighth of the
+# SQLite limit on host parameters.
+RECORD_CHUNK_SIZE = 100
+
+
+def record_resource_checks(entries, checks):
+    """Add the ResourceCheck for each of entries to the check history."""
+    now = datetime.now()
+    rows = []
+    for entry, check in zip(entries, checks):
+        for c in check.checks:
+            rows.append(dict(
+                entry_type=entry_type(entry),
+                entry_pk=entry.id,
+                field=c['field'],
+                url=c['url'],
+                checked_at=now,
+                content_hash=c['content_hash'],
+                is_changed=c['is_changed'],
+                error='; '.join(str(e) for e in c['errors'])
+                      if c['errors'] else None
+            ))
+    with db.atomic():
+        for i in range(0, len(rows), RECORD_CHUNK_SIZE):
+            ResourceCheckResult.insert_many(
+                rows[i:i + RECORD_CHUNK_SIZE]
+            ).execute()
+
+
+def latest_resource_checks(entry):
+    """Return the latest ResourceCheckResult for each resource of entry."""
+    results = []
+    for rfield, hfield in entry._resource_fields:
+        try:
+            results.append(ResourceCheckResult
+                           .select()
+                           .where((ResourceCheckResult.entry_type ==
+                                   entry_type(entry)) &
+                                  (ResourceCheckResult.entry_pk == entry.id) &
+                                  (ResourceCheckResult.field == rfield))
+                           .order_by(ResourceCheckResult.checked_at.desc())
+                           .get())
+        except ResourceCheckResult.DoesNotExist:
+            pass
+    return results
+
+
+class JsonField(CharField):
+    """Store JSON strings."""
+    def db_value(self, value):
+        """Return database value from python data structure."""
+        if value is not None:
+            return json.dumps(value)
+
+    def python_value(self, value):
+        """Return python data structure from json string in the db."""
+        if value is not None and value != '':
+            return json.loads(value)
+
+
+class JsonTextField(TextField):
+    """Store JSON strings of any length."""
+    db_value = JsonField.db_value
+    python_value = JsonField.python_value
+
+
+class EntryRevision(BaseModel):
+    """Stored state of a historical version of an entry.
+
+    Used instead of a cloned row when VERSION_HISTORY is 'delta'. Each
+    revision is either a full snapshot of the entry and its child rows, or a
+    delta against the previous version (see entry_state_delta). A snapshot is
+    stored every VERSION_SNAPSHOT_INTERVAL versions, so a version can be
+    rebuilt from at most that many revisions.
+
+    entry_type -- Type of the Entry (see entry_type)
+    entry_pk -- Id of the (latest) Entry
+    version -- Version of the entry stored in this revision
+    snapshot -- Whether data is a full state, rather than a delta
+    data -- JSON state or delta
+
+    """
+    entry_type = CharField()
+    entry_pk = IntegerField()
+    version = IntegerField()
+    snapshot = BooleanField(default=False)
+    data = JsonTextField()
+
+    class Meta:
+        indexes = (
+            (('entry_type', 'entry_pk', 'version'), True),
+        )
+
+
+def _state_value(field, value):
+    """Return value of field in a form that can be stored as JSON."""
+    if isinstance(value, (datetime, date)):
+        return str(value)
+    return field.db_value(value)
+
+
+def _row_state(model, exclude):
+    """Return a dict of the stored field values of model, except exclude."""
+    return {name: _state_value(field, model._data.get(name))
+            for name, field in model._meta.fields.items()
+            if name not in exclude}
+
+
+def entry_state(entry):
+    """Return the content of entry and its child rows as a JSON-able dict.
+
+    The state has the entry field values in 'fields', and the child rows of
+    each relation copied by clone_model in 'children', without their ids.
+
+    """
+    fields = _row_state(entry, {entry._meta.primary_key.name, 'latest'})
+    children = {}
+    for rel_name, fk in entry._meta.reverse_rel.items():
+        if rel_name in _rels_ignored_for_cloning:
+            continue
+        child_class = fk.model_class
+        pk = child_class._meta.primary_key
+        children[rel_name] = [
+            _row_state(child, {pk.name, fk.name})
+            for child in child_class.select()
+                                    .where(fk == entry._get_pk_value())
+                                    .order_by(pk)
+        ]
+    return dict(fields=fields, children=children)
+
+
+def entry_state_delta(old, new):
+    """Return the delta from state old to state new.
+
+    Changed fields are included with their new value, and the child rows of a
+    relation are included in full if any of them changed.
+
+    """
+    return dict(
+        fields={k: v for k, v in new['fields'].items()
+                if old['fields'].get(k) != v},
+        children={k: v for k, v in new['children'].items()
+                  if old['children'].get(k) != v}
+    )
+
+
+def apply_state_delta(state, delta):
+    """Update state in place with delta, and return it."""
+    state['fields'].update(delta['fields'])
+    state['children'].update(delta['children'])
+    return state
+
+
+def revision_state(entry_class, entry_pk, version):
+    """Return the stored state of version of an entry, or None.
+
+    Loads the nearest snapshot at or before version and the deltas after it
+    in one query.
+
+    """
+    R = EntryRevision
+    key = ((R.entry_type == entry_class.__name__) & (R.entry_pk == entry_pk))
+    snapshot = (R.select(fn.max(R.version))
+                 .where(key & (R.snapshot == True) & (R.version <= version)))
+    revisions = list(R.select()
+                      .where(key &
+                             (R.version >= snapshot) &
+                             (R.version <= version))
+                      .order_by(R.version))
+    if not revisions or revisions[-1].version != version:
+        return None
+    state = revisions[0].data
+    for revision in revisions[1:]:
+        apply_state_delta(state, revision.data)
+    return state
+
+
+def record_revision(entry):
+    """Store the current state of entry as a historical revision.
+
+    entry must be the stored (not yet updated) latest version. The revision
+    is a snapshot for the first version and every VERSION_SNAPSHOT_INTERVAL
+    versions after it, or if the previous version cannot be rebuilt, and
+    otherwise a delta against the previous version.
+
+    """
+    state = entry_state(entry)
+    interval = max(1, app.config['VERSION_SNAPSHOT_INTERVAL'])
+    previous = None
+    if (entry.version - 1) % interval:
+        previous = revision_state(type(entry), entry.id, entry.version - 1)
+    if previous is None:
+        data, snapshot = state, True
+    else:
+        data, snapshot = entry_state_delta(previous, state), False
+    return EntryRevision.create(entry_type=entry_type(entry),
+                                entry_pk=entry.id,
+                                version=entry.version,
+                                snapshot=snapshot,
+                                data=data)
+
+
+def load_revision(entry_class, entry_pk, version):
+    """Return an unsaved instance of version of an entry, or None.
+
+    The instance has no id, and its latest field points at the stored entry.
+    Its child rows are attached as prefetched relations (see
+    prefetch_reverse), and it has no reviews or signatures of its own, so it
+    can be serialised and cloned like a historical row. It cannot be saved,
+    signed or reviewed (see is_revision).
+
+    """
+    state = revision_state(entry_class, entry_pk, version)
+    if state is None:
+        return None
+    return _revision_entry(entry_class, entry_pk, state)
+
+
+def load_revisions(entry_class, entry_pks):
+    """Generate every version of the entries entry_pks stored as revisions.
+
+    Versions are built as by load_revision, in order of entry and version.
+    The revisions are read with one query per PREFETCH_CHUNK_SIZE entries,
+    and each version is rebuilt from the one before it rather than from its
+    snapshot. Versions that cannot be rebuilt are skipped.
+
+    """
+    R = EntryRevision
+    revisions = _select_in(R.select()
+                            .where(R.entry_type == entry_class.__name__)
+                            .order_by(R.entry_pk, R.version),
+                           R.entry_pk, sorted(entry_pks))
+    entry_pk = state = None
+    for revision in revisions:
+        if revision.entry_pk != entry_pk:
+            entry_pk, state = revision.entry_pk, None
+        if revision.snapshot:
+            state = revision.data
+        elif state is None or state['fields'].get('version') != \
+                revision.version - 1:
+            state = None
+        else:
+            apply_state_delta(state, revision.data)
+        if state is not None:
+            yield _revision_entry(entry_class, entry_pk, state)
+
+
+def _revision_entry(entry_class, entry_pk, state):
+    """Return the unsaved instance of an entry with the stored state."""
+    def restore(model_class, values):
+        fields = model_class._meta.fields
+        return {k: fields[k].python_value(v) for k, v in values.items()
+                if k in fields}
+
+    entry = entry_class(**restore(entry_class, state['fields']))
+    entry.latest = entry_pk
+    entry._dirty.clear()
+    for rel_name, fk in entry_class._meta.reverse_rel.items():
+        if rel_name in _rels_ignored_for_cloning:
+            setattr(entry, rel_name + '_prefetch', [])
+            continue
+        children = []
+        for row in state['children'].get(rel_name, []):
+            child = fk.model_class(**restore(fk.model_class, row))
+            child._data[fk.name] = entry_pk
+            child._obj_cache[fk.name] = entry
+            child._dirty.clear()
+            children.append(child)
+        setattr(entry, rel_name + '_prefetch', children)
+    entry.reviews_prefetch = []
+    return entry
+
+
+def is_revision(entry):
+    """Return True if entry is a version rebuilt by load_revision."""
+    return entry.id is None and entry._data.get('latest') is not None
+
+
+def entry_versions(entry):
+    """Return the numbers of the historical versions of entry, in order.
+
+    Includes versions stored as cloned rows and as revisions.
+
+    """
+    cls = type(entry)
+    versions = {v for v, in cls.select(cls.version)
+                              .where(cls.latest == entry.id)
+                              .tuples()}
+    versions.update(v for v, in EntryRevision
+                    .select(EntryRevision.version)
+                    .where((EntryRevision.entry_type == entry_type(entry)) &
+                           (EntryRevision.entry_pk == entry.id))
+                    .tuples())
+    return sorted(versions)
+
+
 class Entry(BaseModel):
     """Base information shared by all entries.
 
@@ -319,60 +1098,77 @@ class Entry(BaseModel):
     @api.expose(sense='child')
     @property
     def reviews(self):
-        """Return reviews for this Entry."""
-        query = []
-        if (hasattr(self, 'problemreview_set') and
-            self.problemreview_set.count() > 0):
-            query = self.problemreview_set
-        elif (hasattr(self, 'toolboxreview_set') and
-              self.toolboxreview_set.count() > 0):
-            query = self.toolboxreview_set
-        elif (hasattr(self, 'solutionreview_set') and
-              self.solutionreview_set.count() > 0):
-            query = self.solutionreview_set
-        return [rel.review for rel in query]
+        """Return reviews for this Entry.
+
+        Uses the reviews loaded by prefetch_reviews if available, otherwise
+        queries the review relation for this type of Entry.
+
+        """
+        reviews = getattr(self, 'reviews_prefetch', None)
+        if reviews is None:
+            rel = review_relation(type(self))
+            if rel is None:
+                return []
+            reviews = list(_reviews_query(rel, [self.id]))
+        return reviews
+
+    class Meta:
+        # Declared here for every type of entry, whose latest and author
+        # fields are defined on each subclass. They cover the latest entries
+        # by visibility and creation time (get_list and paginate), the
+        # versions of an entry (get_one and entry_versions), and the entries
+        # of an author.
+        indexes = (
+            (('latest', 'published', 'created_at'), False),
+            (('latest', 'created_at'), False),
+            (('latest', 'version'), False),
+            (('author', 'latest'), False),
+        )
+
+    # External resources as (url field, hash field) pairs.
+    _resource_fields = ()
 
     # Fields that do not cause a version change when they are changed.
     _ignored_dirty_fields = frozenset({
         'published'
     })
 
+    # Fields that are copied into the text index.
+    _indexed_fields = frozenset({
+        'name',
+        'description'
+    })
+
+    def save(self, *args, **kwargs):
+        """Save this entry, and update its text index row if required.
+
+        Only the index row for this entry is touched, and only when it is
+        created or an indexed field has changed. Note that bulk updates with
+        Entry.update() bypass this, and need update_index() afterwards.
+
+        """
+        reindex = (self.id is None or
+                   not self._dirty.isdisjoint(self._indexed_fields))
+        with db.atomic():
+            rows = super().save(*args, **kwargs)
+            if reindex:
+                index_entry(self)
+        return rows
+
+    def delete_instance(self, *args, **kwargs):
+        """Delete this entry and its text index row."""
+        with db.atomic():
+            unindex_entry(self)
+            return super().delete_instance(*args, **kwargs)
+
     def check_resources(self, resources=None):
         """Check any resources, update any that have changed.
 
-        Returns a ResourceCheck object with the results of the checks.
+        Returns a ResourceCheck object with the results of the checks. See
+        check_entry_resources for checking the resources of many entries.
 
         """
-        checks = ResourceCheck()
-        if resources:
-            for rfield, hfield in resources:
-                url = getattr(self, rfield)
-
-                # Handle an empty resource field. Ignore it if it's nullable,
-                # otherwise raise an error since validation has failed
-                # somewhere.
-                if not url:
-                    if self._meta.fields.get(rfield).null:
-                        continue
-                    else:
-                        raise ValueError('Required resource field {} of {} is emptry.'
-                                         .format(rfield, type(self).__name__))
-
-                old_hash = getattr(self, hfield)
-                new_hash = None
-                is_changed = None
-                errors = None
-                try:
-                    req = requests.get(url, timeout=app.config['RESOURCE_TIMEOUT'])
-                except requests.exceptions.RequestException as e:
-                    errors = [e]
-                else:
-                    new_hash = resource_hash(req.content).hexdigest()
-                    is_changed = new_hash != old_hash
-                    if is_changed:
-                        setattr(self, hfield, new_hash)
-                checks.add_check(rfield, url, is_changed, errors)
-        return checks
+        return check_entry_resources([self], resources)[0]
 
     def is_version_bump_required(self):
         """Return True if a new version of this entry must be created.
@@ -394,11 +1190,13 @@ class Entry(BaseModel):
             # Find the old state of entry in the db
             E = self._meta.model_class
             old_entry = E.get(E.id == self.id)
-            # Clone the old state into a historical version, and link it back to
-            # the latest entry.
-            clone = clone_model(old_entry)
-            clone.latest = self.id
-            clone.save()
+            if app.config['VERSION_HISTORY'] == 'delta':
+                # Store the old state as a revision of the latest entry.
+                record_revision(old_entry)
+            else:
+                # Clone the old state into a historical version, and link it
+                # back to the latest entry.
+                clone_model(old_entry, latest=self.id)
             # Increment the version on the latest entry, and the timestamp
             self.version = self.version + 1
             self.created_at = datetime.now()
@@ -422,6 +1220,11 @@ class UploadedResource(BaseModel):
 class Tag(BaseModel):
     tag = CharField()
 
+    class Meta:
+        indexes = (
+            (('tag',), False),
+        )
+
 
 class License(BaseModel):
     name = CharField(unique=True)
@@ -456,6 +1259,11 @@ class Dependency(BaseModel):
     def __str__(self):
         return "({}) {}".format(self.type, self.identifier)
 
+    class Meta:
+        indexes = (
+            (('type', 'identifier'), False),
+        )
+
 
 class Problem(Entry):
     """A problem to be solved.
@@ -536,9 +1344,7 @@ class Toolbox(Entry):
     )
     puppet_hash = CharField(null=True)
 
-    def check_resources(self, resources=None):
-        resources = resources or [('puppet', 'puppet_hash')]
-        return super().check_resources(resources)
+    _resource_fields = (('puppet', 'puppet_hash'),)
 
 
 class ToolboxTag(Tag):
@@ -573,9 +1379,7 @@ class Solution(Entry):
     template = CharField(help_text="URL of template that implements this Solution.")
     template_hash = CharField(null=True)
 
-    def check_resources(self, resources=None):
-        resources = resources or [('template', 'template_hash')]
-        return super().check_resources(resources)
+    _resource_fields = (('template', 'template_hash'),)
 
 
 class SolutionTag(Tag):
@@ -593,6 +1397,39 @@ class SolutionDependency(Dependency):
     solution = ForeignKeyField(Solution, related_name="deps")
 
 
+class DependencyClosure(BaseModel):
+    """Transitive Toolbox dependencies of the latest Solutions and Toolboxes.
+
+    There is a row for every Toolbox an entry depends on, directly or through
+    other Toolboxes, so the entries that depend on a Toolbox can be found
+    with a single indexed lookup. Rows with depth 1 are the direct
+    dependencies. Maintained by sssc.dependencies.update_dependency_closure,
+    which is called whenever an entry or dependency is saved or deleted.
+
+    ancestor_type -- Type of the dependent Entry (see entry_type)
+    ancestor_pk -- Id of the dependent (latest) Entry
+    descendant_pk -- Id of the (latest) Toolbox depended on
+    depth -- Length of the shortest chain of dependencies between them
+
+    """
+    ancestor_type = CharField()
+    ancestor_pk = IntegerField()
+    descendant_pk = IntegerField()
+    depth = IntegerField()
+
+    class Meta:
+        indexes = (
+            (('ancestor_type', 'ancestor_pk', 'descendant_pk'), True),
+            (('descendant_pk', 'ancestor_type', 'depth', 'ancestor_pk'),
+             False),
+        )
+
+
+# Number of closure rows inserted per statement. Four parameters are bound per
+# row, so keep this under a quarter of the SQLite limit on host parameters.
+CLOSURE_CHUNK_SIZE = 200
+
+
 class SolutionImage(Image):
     """Image/snapshot that provides a pre-canned environment for a Solution.
 
@@ -645,17 +1482,133 @@ class ApplicationSolution(BaseModel):
     solution = ForeignKeyField(Solution)
 
 
-class JsonField(CharField):
-    """Store JSON strings."""
-    def db_value(self, value):
-        """Return database value from python data structure."""
-        if value is not None:
-            return json.dumps(value)
+# Relations between each type of Entry and its Signatures, keyed by the name
+# of the Entry class, as (entry class, relation class, relation fk to entry).
+_SIGNATURE_RELATIONS = {
+    'Problem': (Problem, ProblemSignature, ProblemSignature.problem),
+    'Toolbox': (Toolbox, ToolboxSignature, ToolboxSignature.toolbox),
+    'Solution': (Solution, SolutionSignature, SolutionSignature.solution),
+    'Application': (Application, ApplicationSignature,
+                    ApplicationSignature.application),
+}
 
-    def python_value(self, value):
-        """Return python data structure from json string in the db."""
-        if value is not None and value != '':
-            return json.loads(value)
+
+def _signature_entry_keys(signature_ids):
+    """Return a dict of signature id to (entry_type, entry_pk).
+
+    Searches all the <Entry>Signature relations in a single query, for
+    signatures that do not have their entry columns set.
+
+    """
+    names = list(_SIGNATURE_RELATIONS)
+    query = Signature.select(Signature.id,
+                             *[_SIGNATURE_RELATIONS[n][2] for n in names])
+    for name in names:
+        rel = _SIGNATURE_RELATIONS[name][1]
+        query = query.switch(Signature).join(rel, JOIN.LEFT_OUTER,
+                                             on=(rel.signature == Signature.id))
+
+    keys = {}
+    for row in _select_in(query.tuples(), Signature.id, signature_ids):
+        for name, entry_pk in zip(names, row[1:]):
+            if entry_pk is not None:
+                keys[row[0]] = (name, entry_pk)
+                break
+    return keys
+
+
+def prefetch_signature_entries(signatures):
+    """Load the signed Entry for all signatures.
+
+    Entries are loaded with one query per type of Entry, using the indexed
+    entry columns on each signature. Each signature stores its entry (or None)
+    in the entry_prefetch attribute, which is used by Signature.entry. Returns
+    a list of the entries.
+
+    """
+    missing = [s.id for s in signatures
+               if not (s.entry_type and s.entry_pk is not None)]
+    found = _signature_entry_keys(missing) if missing else {}
+
+    wanted = {}
+    for signature in signatures:
+        signature.entry_prefetch = None
+        if signature.entry_type and signature.entry_pk is not None:
+            key = (signature.entry_type, signature.entry_pk)
+        else:
+            key = found.get(signature.id)
+        if key and key[0] in _SIGNATURE_RELATIONS:
+            wanted.setdefault(key[0], {}).setdefault(key[1], []) \
+                  .append(signature)
+
+    entries = []
+    for name, by_pk in wanted.items():
+        cls = _SIGNATURE_RELATIONS[name][0]
+        for entry in _select_in(cls.select(), cls.id, by_pk):
+            for signature in by_pk[entry.id]:
+                signature.entry_prefetch = entry
+            entries.append(entry)
+    return entries
+
+
+# Number of signatures loaded and verified at a time by audit_signatures.
+AUDIT_CHUNK_SIZE = 1000
+
+
+def audit_signatures(workers=None, chunk_size=AUDIT_CHUNK_SIZE):
+    """Re-verify every stored Signature.
+
+    Each signature is checked against the public key it was made with, and
+    the hash it signed against the current entry_hash of its entry.
+    Signatures are read chunk_size at a time with their keys and entries, and
+    verified by a pool of worker processes (see verify_signatures), or in
+    this process if workers is 0 or 1.
+
+    Yields a (signature, reason) pair for each signature, where reason is
+    None if it is still valid, 'missing' if the entry no longer exists,
+    'invalid' if the signature does not verify, or 'changed' if the entry
+    has been rehashed since it was signed.
+
+    """
+    if workers is not None and workers <= 1:
+        yield from _audit_signature_chunks(
+            lambda items: verify_signatures(items, workers=workers),
+            chunk_size)
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            yield from _audit_signature_chunks(
+                lambda items: verify_signatures(items, executor=executor),
+                chunk_size)
+
+
+def _audit_signature_chunks(verify, chunk_size):
+    """Yield the audit_signatures results, verifying each chunk with verify."""
+    last_id = 0
+    while True:
+        signatures = list(Signature.select(Signature, PublicKey)
+                                   .join(PublicKey)
+                                   .where(Signature.id > last_id)
+                                   .order_by(Signature.id)
+                                   .limit(chunk_size))
+        if not signatures:
+            break
+        prefetch_signature_entries(signatures)
+        items = [(s.signature,
+                  s.signed_string,
+                  (s.public_key.id, s.public_key.registered_at,
+                   s.public_key.key))
+                 for s in signatures]
+        for signature, (verified, message) in zip(signatures, verify(items)):
+            entry = signature.entry_prefetch
+            if entry is None:
+                yield signature, 'missing'
+            elif not verified:
+                yield signature, 'invalid'
+            elif signature.signed_string.split('$')[0] != entry.entry_hash:
+                yield signature, 'changed'
+            else:
+                yield signature, None
+        last_id = signatures[-1].id
 
 
 class Var(BaseModel):
@@ -712,16 +1665,9 @@ class Review(BaseModel):
     @api.expose(sense='parent')
     def entry(self):
         """Return the entry this review is for."""
-        rel = None
-        if self.problemreview_set.count() > 0:
-            rel = self.problemreview_set.get()
-        elif self.toolboxreview_set.count() > 0:
-            rel = self.toolboxreview_set.get()
-        elif self.solutionreview_set.count() > 0:
-            rel = self.solutionreview_set.get()
-        if rel:
-            return rel.entry
-        return None
+        if not hasattr(self, 'entry_prefetch'):
+            prefetch_review_entries([self])
+        return self.entry_prefetch
 
 
 def get_through_model(model):
@@ -790,6 +1736,181 @@ class SolutionReview(BaseModel):
     entry = ForeignKeyField(Solution)
 
 
+# Through models relating each type of Entry to its Reviews.
+_REVIEW_RELATIONS = (ProblemReview, ToolboxReview, SolutionReview)
+
+
+def review_relation(entry_class):
+    """Return the through model relating Reviews to entry_class, or None."""
+    for rel in _REVIEW_RELATIONS:
+        if issubclass(entry_class, rel.entry.rel_model):
+            return rel
+    return None
+
+
+def _reviews_query(rel, entry_ids):
+    """Yield the Reviews of entry_ids through relation rel.
+
+    Each Review has the id of its entry in the review_entry_id attribute.
+    The ids are queried in chunks, so the reviews of each entry are in order
+    of id but not the reviews across entries.
+
+    """
+    query = (Review
+             .select(Review, rel.entry.alias('review_entry_id'))
+             .join(rel, on=(rel.review == Review.id))
+             .order_by(Review.id)
+             .naive())
+    return _select_in(query, rel.entry, entry_ids)
+
+
+def prefetch_reviews(entries):
+    """Load the Reviews for all entries, with one query per type of Entry.
+
+    The reviews are stored on each entry in the reviews_prefetch attribute,
+    which is used by Entry.reviews, and each review has its entry set so that
+    Review.entry does not need a query. Returns a list of all the reviews.
+
+    """
+    by_class = {}
+    for entry in entries:
+        by_class.setdefault(type(entry), {})[entry.id] = entry
+        entry.reviews_prefetch = []
+
+    reviews = []
+    for entry_class, by_id in by_class.items():
+        rel = review_relation(entry_class)
+        if rel is None or not by_id:
+            continue
+        for review in _reviews_query(rel, list(by_id)):
+            entry = by_id[review.review_entry_id]
+            review.entry_prefetch = entry
+            entry.reviews_prefetch.append(review)
+            reviews.append(review)
+    return reviews
+
+
+def prefetch_review_entries(reviews):
+    """Load the Entry for all reviews, in at most one query per Entry type.
+
+    A single query over all the review relations finds the type and id of the
+    entry for each review, then the entries are loaded by type. Each review
+    stores its entry (or None) in the entry_prefetch attribute, which is used
+    by Review.entry. Returns a list of the entries.
+
+    """
+    reviews = [r for r in reviews if r.id is not None]
+    for review in reviews:
+        review.entry_prefetch = None
+    if not reviews:
+        return []
+
+    # Find the entry id in each relation, at most one will be non-null.
+    query = Review.select(Review.id, *[rel.entry for rel in _REVIEW_RELATIONS])
+    for rel in _REVIEW_RELATIONS:
+        query = query.switch(Review).join(rel, JOIN.LEFT_OUTER,
+                                          on=(rel.review == Review.id))
+    rows = _select_in(query.tuples(), Review.id, [r.id for r in reviews])
+
+    wanted = {rel: {} for rel in _REVIEW_RELATIONS}
+    for row in rows:
+        for rel, entry_id in zip(_REVIEW_RELATIONS, row[1:]):
+            if entry_id is not None:
+                wanted[rel].setdefault(entry_id, []).append(row[0])
+                break
+
+    by_review = {}
+    for rel, review_ids in wanted.items():
+        if review_ids:
+            entry_class = rel.entry.rel_model
+            for entry in _select_in(entry_class.select(), entry_class.id,
+                                    review_ids):
+                for review_id in review_ids[entry.id]:
+                    by_review[review_id] = entry
+
+    for review in reviews:
+        review.entry_prefetch = by_review.get(review.id)
+    return list(set(by_review.values()))
+
+
+def prefetch_exposed(instances, extra=None):
+    """Load the exposed relations of instances in bulk.
+
+    Relations that are only available as extra properties are loaded if they
+    are named in extra. Returns a dict of the related instances that were
+    loaded, keyed by the name of the exposed attribute.
+
+    """
+    if instances:
+        if isinstance(instances[0], Entry):
+            return dict(reviews=prefetch_reviews(instances))
+        if isinstance(instances[0], Review):
+            prefetch_review_entries(instances)
+        if isinstance(instances[0], Signature) and extra and 'entry' in extra:
+            prefetch_signature_entries(instances)
+    return {}
+
+
+class ChangeCounter(BaseModel):
+    """Counters of changes to rows that are shared between entries.
+
+    Responses that embed such rows include the counter in their cache keys
+    and ETags, so that every process sees the change. Updated with queries
+    rather than save, which would send row_changed.
+
+    name -- Name of the counter
+    value -- Number of changes counted
+
+    """
+    name = CharField(primary_key=True)
+    value = IntegerField(default=0)
+
+
+def bump_change_counter(name):
+    """Increment the ChangeCounter name, creating it if needed."""
+    ChangeCounter.insert(name=name, value=0).on_conflict('IGNORE').execute()
+    (ChangeCounter
+     .update(value=ChangeCounter.value + 1)
+     .where(ChangeCounter.name == name)
+     .execute())
+
+
+def change_counter(name):
+    """Return the value of the ChangeCounter name, or 0 if never bumped."""
+    value = (ChangeCounter
+             .select(ChangeCounter.value)
+             .where(ChangeCounter.name == name)
+             .scalar())
+    return value or 0
+
+
+def entry_stamp(entry):
+    """Return a tuple that changes whenever the reviews or signatures do.
+
+    The content of an entry is covered by its version and entry_hash, but
+    reviews and signatures are attached to it without a version bump. The
+    stamp is the count and largest id of each, from their relation indexes.
+
+    """
+    stamp = []
+    rel = review_relation(type(entry))
+    if rel is not None:
+        stamp.extend(rel
+                     .select(fn.count(rel.review), fn.max(rel.review))
+                     .where(rel.entry == entry.id)
+                     .tuples()
+                     .get())
+    fk = entry._meta.reverse_rel.get('signatures')
+    if fk is not None:
+        sig = fk.model_class
+        stamp.extend(sig
+                     .select(fn.count(sig.signature), fn.max(sig.signature))
+                     .where(fk == entry.id)
+                     .tuples()
+                     .get())
+    return tuple(stamp)
+
+
 class BaseIndexModel(FTSModel):
     name = SearchField()
     description = SearchField()
@@ -822,16 +1943,49 @@ def entry_type(entry):
     return type(entry).__name__
 
 
+# Text index for each type of Entry.
+_INDEX_MODELS = [(Problem, ProblemIndex),
+                 (Toolbox, ToolboxIndex),
+                 (Solution, SolutionIndex),
+                 (Application, ApplicationIndex)]
+
+# Number of records copied into a text index per transaction by update_index.
+# Three parameters are bound per record, so keep this under a third of the
+# SQLite limit on host parameters.
+INDEX_CHUNK_SIZE = 300
+
+
+# Searchable types of entry, as (results key, entry class, index class).
+_SEARCH_TYPES = (('problems', Problem, ProblemIndex),
+                 ('toolboxes', Toolbox, ToolboxIndex),
+                 ('solutions', Solution, SolutionIndex),
+                 ('applications', Application, ApplicationIndex))
+
+
+def index_model(entry_class):
+    """Return the text index model for entry_class, or None."""
+    for cls, index in _INDEX_MODELS:
+        if issubclass(entry_class, cls):
+            return index
+    return None
+
+
 def index_entry(entry):
-    """Add entry to the appropriate text index."""
-    et = entry_type(entry)
-    cls = getattr(importlib.import_module(__name__),
-                  et + 'Index')
-    if cls:
-        obj = cls(name=entry.name,
-                  description=entry.description,
-                  docid=entry.id)
-        obj.save()
+    """Add entry to the appropriate text index, replacing any existing row."""
+    index = index_model(type(entry))
+    if index is not None and entry.id is not None:
+        index.insert({index.docid: entry.id,
+                      index.name: entry.name,
+                      index.description: entry.description}) \
+             .upsert() \
+             .execute()
+
+
+def unindex_entry(entry):
+    """Remove entry from the appropriate text index."""
+    index = index_model(type(entry))
+    if index is not None and entry.id is not None:
+        index.delete().where(index.docid == entry.id).execute()
 
 
 _TABLES = [User, Role, UserRoles, License, Problem, Toolbox, Signature,
@@ -840,7 +1994,9 @@ _TABLES = [User, Role, UserRoles, License, Problem, Toolbox, Signature,
            ToolboxImage, ProblemSignature, ToolboxSignature, SolutionSignature,
            ApplicationSignature, ProblemTag, ToolboxTag, SolutionTag,
            Review, ProblemReview, SolutionReview, ToolboxReview,
-           Application, ApplicationSolution, UploadedResource]
+           Application, ApplicationSolution, UploadedResource,
+           ResourceValidator, ResourceCheckResult, EntryRevision,
+           DependencyClosure, ChangeCounter]
 _INDEX_TABLES = [ProblemIndex, SolutionIndex, ToolboxIndex, ApplicationIndex]
 
 
@@ -850,23 +2006,123 @@ def create_database(db, safe=True):
     db.create_tables(_INDEX_TABLES, safe=safe)
 
 
+def index_name(table, columns):
+    """Return the name peewee gives an index of columns on table."""
+    name = '{}_{}'.format(table, '_'.join(columns))
+    if len(name) > 64:
+        digest = hashlib.md5(name.encode('utf-8')).hexdigest()
+        name = '{}_{}'.format(name[:56], digest[:7])
+    return name
+
+
+def create_indexes(db):
+    """Create any missing indexes declared in Meta.indexes of our models.
+
+    For databases created before the indexes were declared. Returns the names
+    of the indexes that were created.
+
+    """
+    existing = {name for name, in db.execute_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'index'"
+    )}
+    created = []
+    with db.atomic():
+        for model in _TABLES:
+            table = model._meta.db_table
+            for fields, unique in model._meta.indexes:
+                columns = [model._meta.fields[f].db_column for f in fields]
+                name = index_name(table, columns)
+                if name in existing:
+                    continue
+                db.execute_sql('CREATE {}INDEX "{}" ON "{}" ({})'.format(
+                    'UNIQUE ' if unique else '',
+                    name,
+                    table,
+                    ', '.join('"{}"'.format(c) for c in columns)
+                ))
+                created.append(name)
+    return created
+
+
+def hot_queries(user_id=1, entry_id=1, version=1):
+    """Return (description, query) pairs for the most frequent entry queries.
+
+    These mirror the queries made by the entry views, for checking their
+    query plans (see explain_query).
+
+    """
+    queries = []
+    for cls in (Problem, Toolbox, Solution, Application):
+        name = cls.__name__
+        latest = cls.select().where(cls.latest.is_null())
+        order = (cls.created_at.desc(), cls.id.desc())
+        queries.extend([
+            ('{} list (moderator)'.format(name),
+             latest.order_by(*order).limit(25)),
+            ('{} list (anonymous)'.format(name),
+             latest.where(cls.published == True).order_by(*order).limit(25)),
+            ('{} list (user)'.format(name),
+             latest.where((cls.published == True) | (cls.author == user_id))
+                   .order_by(*order).limit(25)),
+            ('{} version'.format(name),
+             cls.select().where((cls.version == version) &
+                                ((cls.latest == entry_id) |
+                                 (cls.id == entry_id)))),
+            ('{} versions'.format(name),
+             cls.select(cls.version).where(cls.latest == entry_id)),
+            ('{}s of user'.format(name),
+             cls.select().join(User).where(User.id == user_id)),
+        ])
+    for cls in (ProblemTag, ToolboxTag, SolutionTag):
+        queries.append(('{} by tag'.format(cls.__name__),
+                        cls.select().where(cls.tag == 'tag')))
+    for cls in (ToolboxDependency, SolutionDependency):
+        queries.append(('{} by identifier'.format(cls.__name__),
+                        cls.select().where((cls.type == 'toolbox') &
+                                           (cls.identifier == 'identifier'))))
+    return queries
+
+
+def explain_query(query):
+    """Return the lines of the SQLite query plan for query."""
+    sql, params = query.sql()
+    return [row[-1] for row in db.execute_sql('EXPLAIN QUERY PLAN ' + sql,
+                                              params)]
+
+
 def drop_tables(db):
     """Drop the model tables."""
     db.drop_tables(_INDEX_TABLES, safe=True)
     db.drop_tables(_TABLES, safe=True)
 
 
-def update_index():
-    """Update the text index for the current database."""
+def update_index(chunk_size=INDEX_CHUNK_SIZE):
+    """Rebuild the text index for the current database.
+
+    Entries are read in order of id and copied into the index chunk_size at a
+    time, each chunk in its own transaction, so the whole catalogue is never
+    held in memory and other connections can write between chunks.
+
+    Entries are kept in the index as they are saved and deleted (see
+    Entry.save), so this is only needed to repair or initialise the index.
+
+    """
     db.drop_tables(_INDEX_TABLES, safe=True)
     db.create_tables(_INDEX_TABLES)
-    for cls, index in [(Problem, ProblemIndex),
-                       (Toolbox, ToolboxIndex),
-                       (Solution, SolutionIndex),
-                       (Application, ApplicationIndex)]:
-        records = [
-            {index.docid: t[0], index.name: t[1], index.description: t[2]}
-            for t in cls.select(cls.id, cls.name, cls.description).tuples()
-        ]
-        with db.atomic():
-            index.insert_many(records).execute()
+    for cls, index in _INDEX_MODELS:
+        last_id = 0
+        while True:
+            rows = list(cls.select(cls.id, cls.name, cls.description)
+                           .where(cls.id > last_id)
+                           .order_by(cls.id)
+                           .limit(chunk_size)
+                           .tuples())
+            if not rows:
+                break
+            records = [
+                {index.docid: t[0], index.name: t[1], index.description: t[2]}
+                for t in rows
+            ]
+            with db.atomic():
+                index.insert_many(records).execute()
+            last_id = rows[-1][0]
@@ -1,18 +1,207 @@
-from rdflib import Graph, Namespace
-from rdflib.namespace import FOAF
+"""RDF terms, namespaces and graphs for PROV documents.
 
+These mirror the parts of rdflib used to build PROV graphs, so graphs can be
+built and written as JSON-LD or N-Quads without rdflib. Graph.to_rdflib
+converts a graph for the formats only rdflib can write (Turtle, RDF/XML).
+
+"""
+from datetime import date, datetime, time
+from uuid import uuid4
+
+
+class URIRef(str):
+    """An IRI node."""
+    __slots__ = ()
+
+
+class BNode(str):
+    """A blank node, with a generated label unless one is given."""
+    __slots__ = ()
+
+    def __new__(cls, value=None):
+        if value is None:
+            value = 'N' + uuid4().hex
+        return super().__new__(cls, value)
+
+
+class Namespace(str):
+    """A namespace IRI, whose attributes are the URIRefs of its terms."""
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return self.term(name)
+
+    def term(self, name):
+        return URIRef(self + name)
+
+
+RDF = Namespace("http://www.w3.org/1999/02/22-rdf-syntax-ns#")
+RDFS = Namespace("http://www.w3.org/2000/01/rdf-schema#")
+XML = Namespace("http://www.w3.org/XML/1998/namespace")
+XSD = Namespace("http://www.w3.org/2001/XMLSchema#")
+FOAF = Namespace("http://xmlns.com/foaf/0.1/")
 PROV = Namespace("http://www.w3.org/ns/prov#")
 SSSC = Namespace("http://example.org/sssc#")
 
+RDF_TYPE = RDF.type
+
+# Bindings of every graph, including the ones rdflib adds by default.
 ns_bindings = [
+    ('xml', XML),
+    ('rdf', RDF),
+    ('rdfs', RDFS),
+    ('xsd', XSD),
     ('foaf', FOAF),
     ('prov', PROV),
     ('sssc', SSSC)
 ]
 
+# Datatypes of Literal values, checked in order (bool is an int, and
+# datetime is a date).
+_literal_datatypes = [
+    (bool, XSD.boolean),
+    (int, XSD.integer),
+    (float, XSD.double),
+    (datetime, XSD.dateTime),
+    (date, XSD.date),
+    (time, XSD.time),
+]
+
+
+class Literal(str):
+    """A literal node, whose string value is its lexical form.
+
+    The datatype is derived from the type of value, as rdflib does for the
+    types we use, and value is kept for converting to rdflib.
+
+    """
+
+    def __new__(cls, value, lang=None):
+        if isinstance(value, (date, time)):
+            lexical = value.isoformat()
+        elif isinstance(value, bool):
+            lexical = 'true' if value else 'false'
+        else:
+            lexical = str(value)
+        literal = super().__new__(cls, lexical)
+        literal.value = value
+        literal.language = lang
+        literal.datatype = None
+        if not isinstance(value, str):
+            literal.datatype = next(
+                (dt for t, dt in _literal_datatypes if isinstance(value, t)),
+                None
+            )
+        return literal
+
+
+class Graph(object):
+    """A set of (subject, predicate, object) triples, kept in order added."""
+    def __init__(self):
+        # Triples by themselves, or for literal objects by a key that tells
+        # them apart from IRIs and literals of other types with the same text.
+        self._triples = {}
+        self._namespaces = {}
+
+    def __len__(self):
+        return len(self._triples)
+
+    def __iter__(self):
+        return iter(self._triples.values())
+
+    def add(self, triple):
+        """Add triple to the graph, if it is not already in it."""
+        s, p, o = triple
+        if isinstance(o, Literal):
+            key = (s, p, (str(o), o.datatype, o.language))
+        else:
+            key = triple
+        self._triples.setdefault(key, triple)
+
+    def bind(self, prefix, namespace):
+        """Use prefix for namespace when writing the graph."""
+        self._namespaces[prefix] = namespace
+
+    def namespaces(self):
+        """Return the (prefix, namespace) pairs bound in the graph."""
+        return self._namespaces.items()
+
+    def jsonld(self, context=None):
+        """Return the graph as a JSON-LD dict, with one node per subject.
+
+        Predicates and types in the namespaces bound in the graph are written
+        as compact IRIs, and context (the bound namespaces by default) is
+        included as the @context.
+
+        """
+        if context is None:
+            context = {prefix: str(ns) for prefix, ns in self.namespaces()}
+        prefixes = sorted(((ns, prefix) for prefix, ns in context.items()),
+                          key=lambda item: -len(item[0]))
+        compacted = {}
+
+        def compact(iri):
+            if iri not in compacted:
+                compacted[iri] = str(iri)
+                for ns, prefix in prefixes:
+                    if iri.startswith(ns) and len(iri) > len(ns):
+                        compacted[iri] = '{}:{}'.format(prefix, iri[len(ns):])
+                        break
+            return compacted[iri]
+
+        def value(o):
+            if isinstance(o, Literal):
+                if o.language:
+                    return {'@value': str(o), '@language': o.language}
+                if o.datatype:
+                    return {'@value': str(o), '@type': compact(o.datatype)}
+                return str(o)
+            elif isinstance(o, BNode):
+                return {'@id': '_:' + o}
+            return {'@id': str(o)}
+
+        nodes = {}
+        for s, p, o in self:
+            node = nodes.get(s)
+            if node is None:
+                node = nodes[s] = {
+                    '@id': '_:' + s if isinstance(s, BNode) else str(s)
+                }
+            if p == RDF_TYPE and not isinstance(o, Literal):
+                key, o = '@type', compact(o)
+            else:
+                key, o = compact(p), value(o)
+            if key not in node:
+                node[key] = o
+            elif isinstance(node[key], list):
+                node[key].append(o)
+            else:
+                node[key] = [node[key], o]
+        return {'@context': context, '@graph': list(nodes.values())}
+
+    def to_rdflib(self):
+        """Return the graph as an rdflib.Graph."""
+        import rdflib
+
+        def term(t):
+            if isinstance(t, BNode):
+                return rdflib.BNode(t)
+            elif isinstance(t, Literal):
+                return rdflib.Literal(t.value, lang=t.language)
+            return rdflib.URIRef(t)
+
+        g = rdflib.Graph()
+        for prefix, ns in self.namespaces():
+            g.bind(prefix, rdflib.Namespace(ns))
+        for s, p, o in self:
+            g.add((term(s), term(p), term(o)))
+        return g
+
 
 def rdf_graph(triples=None):
-    """Return a new rdflib.Graph with default ns bindings.
+    """Return a new Graph with default ns bindings.
 
     It will be populated with triples if any are supplied.
 
@@ -1,5 +1,4 @@
-from rdflib import BNode, Literal, URIRef, RDF
-from .namespaces import PROV, SSSC
+from .namespaces import BNode, Literal, URIRef, RDF, PROV, SSSC
 
 
 def add_prov_derivation(g, subject, entity):
@@ -47,3 +46,47 @@ def add_prov_dependency(g, subject, dependency):
     return g
 
 
+
+
+# Characters that may not appear in an N-Triples IRI, and their \u escapes.
+_IRI_ESCAPES = {c: '\\u{:04X}'.format(c)
+                for c in list(range(0x21)) + [ord(c) for c in '<>"{}|^`\\']}
+
+
+def _nt_iri(iri):
+    """Return the N-Triples form of an IRI."""
+    return '<{}>'.format(str(iri).translate(_IRI_ESCAPES))
+
+
+def _nt_literal(literal):
+    """Return the N-Triples form of a Literal."""
+    value = '"{}"'.format(str(literal).replace('\\', '\\\\')
+                                      .replace('"', '\\"')
+                                      .replace('\n', '\\n')
+                                      .replace('\r', '\\r'))
+    if literal.language:
+        return '{}@{}'.format(value, literal.language)
+    if literal.datatype:
+        return '{}^^{}'.format(value, _nt_iri(literal.datatype))
+    return value
+
+
+def nquad_lines(g, graph=None, bnode_prefix=''):
+    """Generate the triples of g as N-Quads (or N-Triples) lines.
+
+    If graph is given, each triple is written as a quad in that named graph,
+    otherwise as a plain triple. Blank node labels are prefixed with
+    bnode_prefix, so that the blank nodes of graphs written to the same
+    stream stay distinct.
+
+    """
+    def term(t):
+        if isinstance(t, BNode):
+            return '_:{}{}'.format(bnode_prefix, t)
+        elif isinstance(t, Literal):
+            return _nt_literal(t)
+        return _nt_iri(t)
+
+    context = ' ' + _nt_iri(graph) if graph is not None else ''
+    for s, p, o in g:
+        yield '{} {} {}{} .\n'.format(term(s), term(p), term(o), context)
@@ -8,7 +8,8 @@ from functools import partial
 import os
 from wtforms import StringField
 from .app import app
-from .models import db, User, Role, UserRoles
+from .models import db, User, Role, UserRoles, user_owns_entry, \
+    user_owns_upload
 
 
 DEFAULT_PWD_LENGTH = 13
@@ -71,7 +72,48 @@ Admins and moderators can view unpublished entries.
 """
 
 
-class EditEntryPermission(Permission):
+class OwnerPermission(Permission):
+    """Permission that is also granted to the owner of an entry or resource.
+
+    The owner's Need (for example EditEntryNeed(entry_id)) is not added to
+    their identity for everything they own. Instead, if the identity does not
+    provide any of the needs, ownership is checked with a query when the
+    permission is checked. The result is remembered on the identity for the
+    rest of the request (see refresh_user_permissions).
+
+    """
+    def __init__(self, owner_need, *needs, owner_allowed=True):
+        if owner_allowed:
+            needs = (owner_need,) + needs
+        super().__init__(*needs)
+        self.owner_need = owner_need if owner_allowed else None
+
+    def allows(self, identity):
+        if super().allows(identity):
+            return True
+        if self.owner_need is None:
+            return False
+        return is_owner(identity, self.owner_need)
+
+
+def is_owner(identity, need):
+    """Return True if the user of identity owns the subject of need."""
+    user = getattr(identity, 'user', None)
+    if user is None or user.is_anonymous:
+        return False
+    owned = getattr(identity, 'owned', None)
+    if owned is None:
+        owned = identity.owned = {}
+    key = (type(need).__name__, need.value)
+    if key not in owned:
+        if isinstance(need, ResourceNeed):
+            owned[key] = user_owns_upload(user, need.value)
+        else:
+            owned[key] = user_owns_entry(user, need.value)
+    return owned[key]
+
+
+class EditEntryPermission(OwnerPermission):
     """Permission to edit an entry.
 
     A regular user has permission to edit their own entries, and an admin user
@@ -85,7 +127,7 @@ class EditEntryPermission(Permission):
         )
 
 
-class PublishEntryPermission(Permission):
+class PublishEntryPermission(OwnerPermission):
     """Permission to publish an entry.
 
     Permission to publish is granted to a user based on their roles and the
@@ -104,13 +146,12 @@ class PublishEntryPermission(Permission):
         for role in app.config['PUBLISH_MODERATOR_ROLES']:
             needs.append(RoleNeed(role))
 
-        # Publish entry permission required 
-        needs.append(PublishEntryNeed(entry_id))
-
-        super().__init__(*needs)
+        # Publish entry permission required
+        super().__init__(PublishEntryNeed(entry_id), *needs,
+                         owner_allowed=app.config['PUBLISH_OWN'])
 
 
-class EditResourcePermission(Permission):
+class EditResourcePermission(OwnerPermission):
     """Permission to edit an resource.
 
     A regular user has permission to edit their own entries, and an admin user
@@ -124,7 +165,7 @@ class EditResourcePermission(Permission):
         )
 
 
-class PublishResourcePermission(Permission):
+class PublishResourcePermission(OwnerPermission):
     """Permission to publish an resource.
 
     Permission to publish is granted to a user based on their roles and the
@@ -143,10 +184,9 @@ class PublishResourcePermission(Permission):
         for role in app.config['PUBLISH_MODERATOR_ROLES']:
             needs.append(RoleNeed(role))
 
-        # Publish entry permission required
-        needs.append(PublishResourceNeed(resource_id))
-
-        super().__init__(*needs)
+        # Publish resource permission required
+        super().__init__(PublishResourceNeed(resource_id), *needs,
+                         owner_allowed=app.config['PUBLISH_OWN'])
 
 
 _default_roles = []
@@ -208,23 +248,12 @@ def initialise_db():
 def refresh_user_permissions(user, identity):
     """Refresh the permissions granted to user.
 
-    Refreshes the user's permissions based on the resources they currently own.
+    Permissions for the entries and uploads a user owns are checked when they
+    are needed (see OwnerPermission), so this just forgets any ownership
+    checked earlier in the request, for example before an upload.
 
     """
-    # Allow a user to edit their own entries and uploads
-    entries = list(user.entries)
-    resources = list(user.uploads)
-    for entry in entries:
-        identity.provides.add(EditEntryNeed(entry.id))
-    for resource in resources:
-            identity.provides.add(EditResourceNeed(resource.id))
-
-    # If PUBLISH_OWN is True then give user publishing permission
-    if app.config['PUBLISH_OWN']:
-        for entry in entries:
-            identity.provides.add(PublishEntryNeed(entry.id))
-        for resource in resources:
-            identity.provides.add(PublishResourceNeed(resource.id))
+    identity.owned = {}
 
 
 def refresh_current_permissions():
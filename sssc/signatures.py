@@ -1,33 +1,119 @@
+from concurrent.futures import ProcessPoolExecutor
 import datetime
-from flask import json
+from flask import current_app, json
 import hashlib
 import rsa
 import base64
+from .cache import LRUCache
+
+# Maximum number of parsed public keys kept by each process.
+PUBLIC_KEY_CACHE_SIZE = 1000
+
+# Parsed public keys, by (PublicKey id, registered_at). The key of a
+# PublicKey is never changed once registered, so entries do not go stale.
+_public_keys = LRUCache(PUBLIC_KEY_CACHE_SIZE)
+
+
+def load_public_key(key_data):
+    """Parse key_data, a PEM encoded PKCS#1 or OpenSSL public key."""
+    try:
+        return rsa.PublicKey.load_pkcs1(key_data.encode())
+    except ValueError:
+        return rsa.PublicKey.load_pkcs1_openssl_pem(key_data.encode())
+
+
+def cached_public_key(key_id, registered_at, key_data):
+    """Return the parsed public key_data of the PublicKey key_id.
+
+    Keys are parsed once per process and cached by (key_id, registered_at).
+    Unsaved keys (key_id None) are parsed every time.
+
+    """
+    if key_id is None:
+        return load_public_key(key_data)
+    key = (key_id, registered_at)
+    pubkey = _public_keys.get(key)
+    if pubkey is None:
+        pubkey = load_public_key(key_data)
+        _public_keys.set(key, pubkey)
+    return pubkey
+
+
+def public_key_for(public_key):
+    """Return the parsed key of the PublicKey model public_key."""
+    return cached_public_key(public_key.id, public_key.registered_at,
+                             public_key.key)
+
 
 def verify_signature(signature, signed_string, user_key):
     """Verify signature is valid for entry_hash and signed with user_key.
 
+    User_key is either a PEM encoded public key or an already parsed
+    rsa.PublicKey (see public_key_for).
+
     Return True if valid and correct.
 
     """
     signature_bytes = base64.b64decode(signature)
     signed_bytes = signed_string.encode('utf-8')
-    pubkey = None
 
-    try:
-        pubkey = rsa.PublicKey.load_pkcs1(user_key.encode())
-    except ValueError:
-        pubkey = rsa.PublicKey.load_pkcs1_openssl_pem(user_key.encode())
+    if isinstance(user_key, rsa.PublicKey):
+        pubkey = user_key
+    else:
+        pubkey = load_public_key(user_key)
 
     # Check signature is valid using user_key
     try:
         rsa.verify(signed_bytes, signature_bytes, pubkey)
     except rsa.pkcs1.VerificationError as e:
-        return False, e.message
+        return False, str(e)
 
     return True, 'Verified'
 
 
+def _verify_item(item):
+    """Verify one (signature, signed_string, key) item for verify_signatures.
+
+    Key is a (key_id, registered_at, key_data) tuple.
+
+    """
+    signature, signed_string, key = item
+    try:
+        return verify_signature(signature, signed_string,
+                                cached_public_key(*key))
+    except ValueError as e:
+        # Malformed signatures or keys fail rather than stop the batch
+        return False, str(e)
+
+
+# Number of signatures sent to a worker process at a time.
+VERIFY_CHUNK_SIZE = 20
+
+
+def verify_signatures(items, workers=None, executor=None):
+    """Verify a batch of signatures, returning a list of (verified, message).
+
+    items -- Sequence of (signature, signed_string, key) tuples, where key
+        is (PublicKey id, registered_at, key) so each worker parses every
+        public key once.
+    workers -- Number of processes to spread the items over. If 0 or 1 they
+        are verified in this process. Defaults to the number of CPUs.
+    executor -- An existing ProcessPoolExecutor to use instead, so that a
+        pool (and its parsed keys) can be shared by several batches.
+
+    Results are in the same order as items.
+
+    """
+    items = list(items)
+    if executor is None and workers is not None and workers <= 1:
+        return [_verify_item(item) for item in items]
+    if executor is None:
+        with ProcessPoolExecutor(workers) as executor:
+            return verify_signatures(items, executor=executor)
+    return list(executor.map(_verify_item, items,
+                             chunksize=VERIFY_CHUNK_SIZE))
+
+
 def _canonical_serializer(obj):
     """Return the JSON serialization of obj for non-standard types.
 
@@ -52,7 +138,7 @@ def _canonical_sort_key(obj):
 
     """
     if isinstance(obj, dict):
-        return ''.join(str(v) for k, v in sorted(obj.items()))
+        return ''.join(map(str, map(obj.__getitem__, sorted(obj))))
     else:
         return obj
 
@@ -66,6 +152,10 @@ canonical_ignored_keys = {
     'images'
 }
 
+# Types of values that are already canonical. Checked by exact type, so that
+# subclasses of dict or list still go through make_canonical.
+_canonical_scalars = frozenset([str, int, float, bool, type(None)])
+
 
 def make_canonical(obj):
     """Return a copy of obj ready for serialization for hashing.
@@ -75,18 +165,24 @@ def make_canonical(obj):
 
     Values in dictionaries and sequences will be made canonical.
 
-    Sequences will be sorted deterministically.
+    Sequences will be sorted deterministically. The sort key is only used
+    for sequences containing dicts, and is computed once for each of them.
 
     """
     if isinstance(obj, dict):
-        # Make values canonical
-        return {k: make_canonical(v)
+        # Make values canonical, without a call for each plain value
+        return {k: v if type(v) in _canonical_scalars else make_canonical(v)
                 for k, v in obj.items()
                 if k not in canonical_ignored_keys}
     elif isinstance(obj, list) or isinstance(obj, tuple):
         # Sort and make canonical
-        return sorted((make_canonical(v) for v in obj),
-                      key=_canonical_sort_key)
+        items = [v if type(v) in _canonical_scalars else make_canonical(v)
+                 for v in obj]
+        if any(isinstance(v, dict) for v in items):
+            items.sort(key=_canonical_sort_key)
+        else:
+            items.sort()
+        return items
     else:
         # Return the value
         return obj
@@ -119,6 +215,61 @@ def canonical_form(obj):
                       sort_keys=True)
 
 
+def _json_value(obj, default):
+    """Return obj as it would be after a round trip through JSON.
+
+    Tuples become lists, dictionary keys become strings in sorted order (the
+    order they are encoded and parsed in), and values that JSON cannot
+    represent are replaced by default(obj), as an encoder would.
+
+    """
+    if isinstance(obj, dict):
+        items = ((k if isinstance(k, str) else str(k), v)
+                 for k, v in obj.items())
+        return {k: _json_value(v, default)
+                for k, v in sorted(items, key=lambda item: item[0])}
+    elif isinstance(obj, list) or isinstance(obj, tuple):
+        return [_json_value(v, default) for v in obj]
+    elif obj is None or isinstance(obj, (str, int, float)):
+        return obj
+    else:
+        return _json_value(default(obj), default)
+
+
+def _canonical_encoder():
+    """Return the JSON encoder that canonical_form serialises with.
+
+    Uses the same encoder class and options that flask.json.dumps would.
+
+    """
+    if current_app:
+        cls = current_app.json_encoder
+        ensure_ascii = current_app.config.get('JSON_AS_ASCII', True)
+    else:
+        cls = json.JSONEncoder
+        ensure_ascii = True
+    return cls(default=_canonical_serializer,
+               sort_keys=True,
+               ensure_ascii=ensure_ascii)
+
+
+def hash_entry_dict(entry, hash_alg='sha256', default=_canonical_serializer):
+    """Return the hex encoded digest for the dict entry.
+
+    Gives the same digest as passing the JSON serialisation of entry to
+    hash_entry, where default is the function the JSON encoder uses for
+    values JSON cannot represent (dates etc), but without serialising and
+    parsing entry first. The canonical form is hashed piece by piece as it is
+    encoded, rather than built as one string.
+
+    """
+    canonical = make_canonical(_json_value(entry, default))
+    hash = getattr(hashlib, hash_alg)()
+    for chunk in _canonical_encoder().iterencode(canonical):
+        hash.update(chunk.encode())
+    return hash.hexdigest()
+
+
 def hash_canonical_entry(canonical_entry, hash_alg='sha256'):
     """Return the hex encoded digest of entry in canonical form.
 
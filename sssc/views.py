@@ -1,36 +1,45 @@
+import aniso8601
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+import binascii
+import hashlib
 from datetime import datetime, date, time, timezone
 from flask import (Blueprint, request, render_template, url_for,
                    jsonify, make_response, abort, redirect, flash,
-                   send_from_directory)
+                   send_from_directory, Response, stream_with_context)
+from flask import json
 from flask.json import JSONEncoder
 from flask.views import MethodView
 from flask_security import current_user
 from flask_security.decorators import auth_required, roles_accepted
 from functools import wraps
 from markdown import markdown
-from peewee import SelectQuery, DoesNotExist
-from rdflib import BNode, Literal, URIRef
-from rdflib.namespace import RDF, FOAF
+from peewee import SelectQuery, DoesNotExist, ForeignKeyField, Tuple
 from urllib.parse import parse_qs, urlparse
 from werkzeug.exceptions import InternalServerError, NotAcceptable
 from werkzeug.routing import RequestRedirect, MethodNotAllowed, NotFound
 
 from .api import get_exposed
+from .dependencies import resolve_dependencies, entry_dependencies, \
+    DependencyError, DEPENDENT_TYPES, dependent_entries, load_toolbox
+from .cache import LRUCache
 from .app import app
 from sssc import models
-from .models import db, Toolbox, Entry, Problem, Solution, text_search, \
+from .models import db, Toolbox, Entry, Problem, Solution, search_entries, \
     is_latest, is_unpublished, User, clone_model, entry_type, \
     License, BaseModel, Role, Dependency, Signature, PublicKey, \
     ProblemSignature, ToolboxSignature, SolutionSignature, Review, \
     SolutionDependency, SolutionImage, SolutionTag, \
     ToolboxDependency, ToolboxImage, ToolboxTag, \
-    UploadedResource, Application, ApplicationSignature, ApplicationSolution
-from .namespaces import PROV, SSSC, rdf_graph
-from .prov import add_prov_dependency, add_prov_derivation
+    UploadedResource, Application, ApplicationSignature, ApplicationSolution, \
+    latest_resource_checks, load_revision, entry_versions, is_revision, \
+    Source
+from .namespaces import BNode, Literal, URIRef, RDF, FOAF, PROV, SSSC, \
+    rdf_graph
+from .prov import add_prov_dependency, add_prov_derivation, nquad_lines
 from .security import is_admin, EditEntryPermission, PublishEntryPermission, \
     ViewUnpublishedPermission, EditResourcePermission, \
     PublishResourcePermission, refresh_current_permissions
-from .signatures import verify_signature
+from .signatures import verify_signature, hash_entry_dict, public_key_for
 from .uploads import allowed_file, save_attachment, delete_upload
 
 site = Blueprint('site', __name__, template_folder='templates')
@@ -214,6 +223,8 @@ _hidden_fields = set([
     Signature.problemsignature_set,
     Signature.toolboxsignature_set,
     Signature.solutionsignature_set,
+    Signature.entry_type,
+    Signature.entry_pk,
     Review.problemreview_set,
     Review.toolboxreview_set,
     Review.solutionreview_set,
@@ -289,147 +300,325 @@ def _clone_set(s, default=None):
     return set()
 
 
-def model_to_dict(model, seen=None, exclude=None, extra=None, refs=None,
-                  max_depth=None, include_nulls=False, include_ids=False):
-    """Return a dict view of model, suitable for the API. """
-    max_depth = -1 if max_depth is None else max_depth
-
-    # Set up fields to extract, include some sensible defaults for the API
-    refs = _clone_set(refs, _default_refs)
-    exclude = _clone_set(exclude, _default_exclude)
-    seen = _clone_set(seen)
-
-    # Never expose certain fields!
-    exclude |= _hidden_fields
-    exclude |= seen
-    if not include_ids:
-        exclude |= _internal_identifiers
-
-    data = {}
-
-    # Always include semantic markup, plus an @id attribute if we have one
-    uri = model_url(model)
-    if uri:
-        data['@id'] = uri
-        prov = prov_url(model)
-        if prov:
-            data['prov:has_provenance'] = prov
-    if isinstance(model, BaseModel):
-        data['@type'] = type(model).__name__
-
-    # Include exposed fields for the api
-    for k, v in get_exposed(model, parent_handler=model_url).items():
-        if isinstance(v, BaseModel):
-            v = model_to_dict(v,
-                              seen=seen,
-                              exclude=exclude,
-                              extra=extra,
-                              refs=refs,
-                              max_depth=max_depth - 1,
-                              include_nulls=include_nulls,
-                              include_ids=include_ids)
-        elif isinstance(v, list) or isinstance(v, tuple):
-            v = [model_to_dict(x,
-                               seen=seen,
-                               exclude=exclude,
-                               extra=extra,
-                               refs=refs,
-                               max_depth=max_depth - 1,
-                               include_nulls=include_nulls,
-                               include_ids=include_ids)
-                 for x in v]
-        data[_property_api_name(k)] = v
-
-    # Iterate over fields of model
-    foreign = set(model._meta.rel.values())
-    for f in model._meta.declared_fields:
-        # Exclude specified fields. Don't include 'id' fields unless explicitly
-        # requested.
-        if f in exclude:
-            continue
-
-        f_data = model._data.get(f.name)
-        if f in foreign:
-            if f_data is not None:
-                rel_obj = getattr(model, f.name)
-                if f not in refs and max_depth != 0:
-                    # extract the related model data
-                    seen.add(f)
-                    f_data = model_to_dict(
-                        rel_obj,
-                        seen=seen,
-                        exclude=exclude,
-                        extra=extra,
-                        refs=refs,
-                        max_depth=max_depth - 1,
-                        include_nulls=include_nulls,
-                        include_ids=include_ids
-                    )
-                else:
-                    # Replace with external reference
-                    f_data = model_url(rel_obj)
+# Limit on how deep we prefetch relations when serialising a query. Anything
+# deeper is still serialised, it is just loaded lazily.
+_max_prefetch_depth = 6
+
+# Number of compiled serialization plans kept. Callers pass their own
+# exclude, extra and refs options, so keep only the most recently used plans.
+SERIALIZATION_PLAN_CACHE_SIZE = 500
+
+# Compiled serialization plans, keyed by model class and options.
+_serialization_plans = LRUCache(SERIALIZATION_PLAN_CACHE_SIZE)
+
+
+def serialization_plan(model_class, seen=None, exclude=None, extra=None,
+                       refs=None, max_depth=None, include_ids=False):
+    """Return the SerializationPlan for model_class with the given options.
 
-        if include_nulls or f_data is not None:
-            data[_property_api_name(f.name)] = f_data
-
-    # Iterate over reverse relations, and embed the data
-    model_class = type(model)
-    for related_name, fk in model._meta.reverse_rel.items():
-        descriptor = getattr(model_class, related_name)
-        if descriptor in exclude or fk in exclude:
-            continue
-
-        exclude.add(fk)
-        related_query = getattr(
-            model,
-            related_name + '_prefetch',
-            getattr(model, related_name)
+    Options have the same meaning as for model_to_dict. Plans are cached, so
+    each combination of model class and options is only compiled once.
+
+    """
+    # Any negative depth is unlimited, so share plans between them.
+    max_depth = -1 if max_depth is None or max_depth < 0 else max_depth
+    key = (model_class,
+           frozenset(_clone_set(seen)),
+           frozenset(_clone_set(exclude, _default_exclude)),
+           tuple(extra) if extra else (),
+           frozenset(_clone_set(refs, _default_refs)),
+           max_depth,
+           include_ids)
+    plan = _serialization_plans.get(key)
+    if plan is None:
+        plan = SerializationPlan(*key)
+        _serialization_plans.set(key, plan)
+    return plan
+
+
+class SerializationPlan(object):
+    """Compiled description of how to serialise a model class for the API.
+
+    Works out once which fields and relations of model_class are included,
+    what they are called in the API, and whether related models are embedded
+    or referenced, so serialising an instance only has to read its values.
+    Plans for embedded models are looked up the first time they are needed,
+    and kept on the parent plan.
+
+    An embedded foreign key is seen (excluded) by the models embedded after
+    it only when it is not null in the instance, so the plans used for those
+    depend on which of the foreign keys of an instance are null.
+
+    """
+    def __init__(self, model_class, seen, exclude, extra, refs, max_depth,
+                 include_ids):
+        self.model_class = model_class
+        self.type_name = model_class.__name__
+        self.is_model = issubclass(model_class, BaseModel)
+        self.extra = extra
+        self.refs = refs
+        self.max_depth = max_depth
+        self._child_options = dict(
+            extra=extra,
+            refs=refs,
+            max_depth=max_depth - 1 if max_depth >= 0 else -1,
+            include_ids=include_ids
         )
+        self._children = {}
+
+        # Never expose certain fields!
+        seen = set(seen)
+        exclude = set(exclude) | _hidden_fields | seen
+        if not include_ids:
+            exclude |= _internal_identifiers
+
+        # Exposed attributes and declared fields are embedded using the
+        # options for this level.
+        self.seen = frozenset(seen)
+        self.field_exclude = frozenset(exclude)
+        self.exposed_options = (self.seen, self.field_exclude)
+
+        # Declared fields as (field, api_name, is_foreign, embed), where embed
+        # is True if a related model is embedded rather than replaced with a
+        # reference.
+        self.fields = []
+        foreign = set(model_class._meta.rel.values())
+        for f in model_class._meta.declared_fields:
+            if f in exclude:
+                continue
+            embed = f in foreign and f not in refs and max_depth != 0
+            self.fields.append((f, _property_api_name(f.name), f in foreign,
+                                embed))
+        self.embedded = tuple(f for f, api_name, is_foreign, embed
+                              in self.fields if embed)
+
+        # Reverse relations as (related_name, fk, api_name, exclude), where
+        # exclude is the set used to embed the related models, or None to
+        # replace them with references.
+        self.reverse = []
+        for related_name, fk in model_class._meta.reverse_rel.items():
+            descriptor = getattr(model_class, related_name)
+            if descriptor in exclude or fk in exclude:
+                continue
+            exclude.add(fk)
+            rel_exclude = None
+            if descriptor not in refs:
+                rel_exclude = frozenset(exclude)
+            self.reverse.append((related_name, fk,
+                                 _property_api_name(related_name),
+                                 rel_exclude))
+
+        # Extra properties use whatever is excluded by the end.
+        self.extra_exclude = frozenset(exclude)
+
+    def present_foreign(self, model):
+        """Return the embedded foreign keys of model that are not null."""
+        return tuple(f for f in self.embedded
+                     if model._data.get(f.name) is not None)
+
+    def child_plan(self, slot, model_class, options):
+        """Return the plan used to embed model_class in slot of this plan.
+
+        Options are the (seen, exclude) sets for the embedded model.
 
-        accum = []
-        for rel_obj in related_query:
-            if descriptor in refs:
-                accum.append(model_url(rel_obj))
+        """
+        key = (slot, model_class, options)
+        plan = self._children.get(key)
+        if plan is None:
+            seen, exclude = options
+            plan = serialization_plan(model_class,
+                                      seen=seen,
+                                      exclude=exclude,
+                                      **self._child_options)
+            self._children[key] = plan
+        return plan
+
+    def extra_seen(self, model_class, seen):
+        """Return seen with any relation between model_class and this model.
+
+        The relation is excluded from model_class when it is embedded as an
+        extra property, and from any extra properties embedded after it.
+
+        """
+        ref = model_class._meta.rel_for_model(self.model_class)
+        if not ref:
+            ref = model_class._meta.reverse_rel_for_model(self.model_class)
+        if ref:
+            seen = seen | {ref}
+        return seen
+
+    def serialize(self, model, include_nulls=False):
+        """Return a dict view of model, suitable for the API."""
+        data = {}
+
+        # Always include semantic markup, plus an @id attribute if we have one
+        uri = model_url(model)
+        if uri:
+            data['@id'] = uri
+            prov = prov_url(model)
+            if prov:
+                data['prov:has_provenance'] = prov
+        if self.is_model:
+            data['@type'] = self.type_name
+
+        # Include exposed fields for the api
+        for k, v in get_exposed(model, parent_handler=model_url).items():
+            if isinstance(v, BaseModel):
+                v = self.child_plan(('exposed', k), type(v),
+                                    self.exposed_options) \
+                        .serialize(v, include_nulls)
+            elif isinstance(v, list) or isinstance(v, tuple):
+                v = [self.child_plan(('exposed', k), type(x),
+                                     self.exposed_options)
+                     .serialize(x, include_nulls)
+                     for x in v]
+            data[_property_api_name(k)] = v
+
+        # Declared fields, embedding or referencing related models. Each
+        # embedded model is seen by the ones embedded after it.
+        seen = self.seen
+        for f, api_name, is_foreign, embed in self.fields:
+            f_data = model._data.get(f.name)
+            if is_foreign and f_data is not None:
+                rel_obj = getattr(model, f.name)
+                if embed:
+                    seen = seen | {f}
+                    f_data = self.child_plan(('field', f.name), f.rel_model,
+                                             (seen, self.field_exclude)) \
+                                 .serialize(rel_obj, include_nulls)
+                else:
+                    f_data = model_url(rel_obj)
+            if include_nulls or f_data is not None:
+                data[api_name] = f_data
+
+        # Reverse relations, using prefetched instances if available
+        for related_name, fk, api_name, rel_exclude in self.reverse:
+            related = getattr(model, related_name + '_prefetch', None)
+            if related is None:
+                related = getattr(model, related_name)
+            if rel_exclude is None:
+                data[api_name] = [model_url(r) for r in related]
             else:
-                accum.append(model_to_dict(
-                    rel_obj,
-                    seen=seen,
-                    exclude=exclude,
-                    extra=extra,
-                    refs=refs,
-                    max_depth=max_depth - 1,
-                    include_nulls=include_nulls,
-                    include_ids=include_ids
-                ))
-        data[_property_api_name(related_name)] = accum
-
-    # Add any extra fields
-    if extra:
-        for prop in extra:
+                plan = self.child_plan(('reverse', related_name),
+                                       fk.model_class, (seen, rel_exclude))
+                data[api_name] = [plan.serialize(r, include_nulls)
+                                  for r in related]
+
+        # Add any extra fields
+        for prop in self.extra:
             value = getattr(model, prop, None)
             if value is not None:
                 if isinstance(value, BaseModel):
                     # Should this be a reference?
-                    if prop in refs:
+                    if prop in self.refs:
                         value = model_url(value)
                     else:
-                        # If it's got any references to model, exclude them
-                        ref = value._meta.rel_for_model(model_class)
-                        if not ref:
-                            ref = value._meta.reverse_rel_for_model(model_class)
-                        if ref:
-                            seen.add(ref)
-                        value = model_to_dict(value,
-                                              seen=seen,
-                                              exclude=exclude,
-                                              extra=extra,
-                                              refs=refs,
-                                              max_depth=max_depth - 1,
-                                              include_nulls=include_nulls,
-                                              include_ids=include_ids)
+                        seen = self.extra_seen(type(value), seen)
+                        value = self.child_plan(('extra', prop), type(value),
+                                                (seen, self.extra_exclude)) \
+                                    .serialize(value, include_nulls)
                 data[_property_api_name(prop)] = value
 
-    return data
+        return data
+
+    def prefetch(self, instances, depth=_max_prefetch_depth):
+        """Load the relations this plan serialises for all instances.
+
+        Each relation is loaded with one query for the whole list of
+        instances, and the same is done for embedded models down to depth
+        levels.
+
+        """
+        if not instances:
+            return
+        exposed = models.prefetch_exposed(instances, extra=self.extra)
+        for name, related in exposed.items():
+            if related and depth > 0:
+                self.child_plan(('exposed', name), type(related[0]),
+                                self.exposed_options) \
+                    .prefetch(related, depth - 1)
+
+        # The embedded models depend on which foreign keys are null, so
+        # prefetch for each group of instances that share them.
+        groups = {}
+        for instance in instances:
+            groups.setdefault(self.present_foreign(instance),
+                              []).append(instance)
+        for present, group in groups.items():
+            seen = self.seen
+            for f, api_name, is_foreign, embed in self.fields:
+                if is_foreign:
+                    related = models.prefetch_foreign(group, f)
+                    if embed and f in present:
+                        seen = seen | {f}
+                        if depth > 0:
+                            self.child_plan(('field', f.name), f.rel_model,
+                                            (seen, self.field_exclude)) \
+                                .prefetch(related, depth - 1)
+            for related_name, fk, api_name, rel_exclude in self.reverse:
+                related = models.prefetch_reverse(group, related_name, fk)
+                if rel_exclude is not None and depth > 0:
+                    self.child_plan(('reverse', related_name),
+                                    fk.model_class, (seen, rel_exclude)) \
+                        .prefetch(related, depth - 1)
+
+
+def model_to_dict(model, seen=None, exclude=None, extra=None, refs=None,
+                  max_depth=None, include_nulls=False, include_ids=False):
+    """Return a dict view of model, suitable for the API. """
+    plan = serialization_plan(type(model),
+                              seen=seen,
+                              exclude=exclude,
+                              extra=extra,
+                              refs=refs,
+                              max_depth=max_depth,
+                              include_ids=include_ids)
+    return plan.serialize(model, include_nulls)
+
+
+def query_to_dicts(query, seen=None, exclude=None, extra=None, refs=None,
+                   max_depth=None, include_nulls=False, include_ids=False):
+    """Return a list of dict views of the models selected by query.
+
+    Equivalent to calling model_to_dict on each result, except that the plan
+    is only looked up once, and all the relations that will be serialised are
+    loaded up front (see SerializationPlan.prefetch), so the number of queries
+    does not grow with the number of results.
+
+    """
+    return models_to_dicts(list(query),
+                           seen=seen,
+                           exclude=exclude,
+                           extra=extra,
+                           refs=refs,
+                           max_depth=max_depth,
+                           include_nulls=include_nulls,
+                           include_ids=include_ids)
+
+
+def models_to_dicts(instances, seen=None, exclude=None, extra=None, refs=None,
+                    max_depth=None, include_nulls=False, include_ids=False):
+    """Return a list of dict views of instances, in the same order.
+
+    Like query_to_dicts, but instances may be of different model classes, in
+    which case the relations are prefetched for each class in turn.
+
+    """
+    plans = {}
+    by_class = {}
+    for m in instances:
+        by_class.setdefault(type(m), []).append(m)
+    for model_class, group in by_class.items():
+        plan = serialization_plan(model_class,
+                                  seen=seen,
+                                  exclude=exclude,
+                                  extra=extra,
+                                  refs=refs,
+                                  max_depth=max_depth,
+                                  include_ids=include_ids)
+        plan.prefetch(group)
+        plans[model_class] = plan
+    return [plans[type(m)].serialize(m, include_nulls) for m in instances]
 
 
 def parse_review_request(request):
@@ -495,11 +684,19 @@ def latest_only(entries):
 
 
 def can_read(resource):
-    """Return True if the current user can read resource."""
+    """Return True if the current user can read resource.
+
+    A version rebuilt from its revisions has no id, so permission to edit
+    the latest version is checked instead.
+
+    """
     if isinstance(resource, Entry):
+        entry_id = resource.id
+        if is_revision(resource):
+            entry_id = resource._data.get('latest')
         return (resource.published or
                 ViewUnpublishedPermission.can() or
-                EditEntryPermission(resource.id).can())
+                EditEntryPermission(entry_id).can())
     return False
 
 
@@ -511,18 +708,28 @@ def readable_only(entries):
 
 
 def can_publish(resource):
-    """Return True if the current user can publish resource."""
+    """Return True if the current user can publish resource.
+
+    A version rebuilt from its revisions cannot be published.
+
+    """
     if isinstance(resource, Entry):
-        return PublishEntryPermission(resource.id).can()
+        return (not is_revision(resource) and
+                PublishEntryPermission(resource.id).can())
     elif isinstance(resource, UploadedResource):
         return PublishResourcePermission(resource.id).can()
     return False
 
 
 def can_edit(resource):
-    """Return True if the current user can edit resource."""
+    """Return True if the current user can edit resource.
+
+    A version rebuilt from its revisions cannot be edited.
+
+    """
     if isinstance(resource, Entry):
-        return EditEntryPermission(resource.id).can()
+        return (not is_revision(resource) and
+                EditEntryPermission(resource.id).can())
     elif isinstance(resource, UploadedResource):
         return EditResourcePermission(resource.id).can()
     return False
@@ -537,9 +744,20 @@ def can_delete(resource):
     return can_edit(resource)
 
 
+def revision_conflict(entry, action):
+    """Return a 409 response refusing action on a version rebuilt from its
+    revisions, which has no row of its own to attach anything to.
+
+    """
+    return ('Version {} of this entry is stored as a revision, so it cannot '
+            'be {}. Use the latest version instead.'
+            .format(entry.version, action), 409)
+
+
 @site.context_processor
 def entry_processor():
     return dict(entry_type=entry_type,
+                entry_versions=entry_versions,
                 model_url=model_url,
                 edit_url=edit_url,
                 action_url=action_url,
@@ -589,6 +807,290 @@ def jsonldify(x, context=_jsonld_context, embed=True):
     return resp
 
 
+def iter_dicts(query, chunk_size=None, **kwargs):
+    """Generate dict views of the models selected by query, one at a time.
+
+    Like query_to_dicts, but rows are read from the database cursor with
+    query.iterator(), and their relations are prefetched chunk_size models at
+    a time, so only one chunk is held in memory. query may also be any other
+    iterable of models, such as a Page. Keyword arguments are passed to
+    models_to_dicts.
+
+    """
+    if chunk_size is None:
+        chunk_size = app.config['STREAM_CHUNK_SIZE']
+    if isinstance(query, SelectQuery):
+        query = query.iterator()
+    chunk = []
+    for m in query:
+        chunk.append(m)
+        if len(chunk) >= chunk_size:
+            yield from models_to_dicts(chunk, **kwargs)
+            chunk = []
+    if chunk:
+        yield from models_to_dicts(chunk, **kwargs)
+
+
+def stream_jsonld(key, items, x=None, context=_jsonld_context, embed=True,
+                  tail=None):
+    """Return a streaming JSON-LD response of x, with items listed under key.
+
+    The rest of x (and the @context, if context is not None) is written
+    first, then each of items is encoded and sent as it is generated, so
+    large listings are never built up in memory. Use with iter_dicts. If
+    tail is given, it is called once the items are sent, and the members of
+    the dict it returns are written after the list.
+
+    The status has been sent by the time items are read, so if reading them
+    fails the error is logged, and the list and object are still closed with
+    an "error" member, so the client gets valid JSON that says the listing is
+    incomplete.
+
+    """
+    head = dict(x or {})
+    mimetype = 'application/json'
+    if context is not None:
+        head = add_context(head, context, embed)
+        mimetype = 'application/ld+json'
+
+    # Open the object and the list, dropping the closing brace from the head.
+    head = json.dumps(head)[:-1]
+    if head != '{':
+        head += ', '
+    head += '{}: ['.format(json.dumps(key))
+
+    def generate():
+        yield head
+        rest = {}
+        try:
+            for i, item in enumerate(items):
+                if i:
+                    yield ', '
+                yield json.dumps(item)
+            if tail is not None:
+                rest = tail() or {}
+        except Exception:
+            app.logger.exception('Failed to stream the %s listing', key)
+            rest = dict(error='The listing is incomplete, because of an '
+                              'error on the server.')
+        yield ']'
+        for k, v in rest.items():
+            yield ', {}: {}'.format(json.dumps(k), json.dumps(v))
+        yield '}\n'
+
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+
+# Serialised JSON-LD responses for single entries, keyed by entry_cache_key.
+_entry_cache = LRUCache(app.config['ENTRY_CACHE_SIZE'])
+
+
+def entry_cache_key(entry, include_ids=False,
+                    mimetype='application/ld+json'):
+    """Return the response cache key for entry.
+
+    Besides the version and entry_hash that cover the content of the entry,
+    the key includes whether it is published (unpublished entries are only
+    served after the permission checks in get_one), the stamp of its
+    reviews and signatures (see models.entry_stamp), the counter of changes
+    to the other rows embedded in the response (see count_embedded_change),
+    and the host URL the absolute links in the response are built from.
+    All of them are read from the database, so the key and ETag change in
+    every process.
+
+    """
+    return (entry_type(entry), (entry.id, entry._data.get('latest')),
+            entry.version, entry.entry_hash,
+            entry.published, models.entry_stamp(entry),
+            models.change_counter(EMBEDDED_CHANGES), include_ids,
+            mimetype, request.host_url)
+
+
+def entry_etag(key):
+    """Return a strong ETag for the response cached under key."""
+    entry_hash = key[3]
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+    return '{}.{}'.format(entry_hash, digest) if entry_hash else digest
+
+
+def cached_entry_response(entry, include_ids=False):
+    """Return the JSON-LD response for entry, from the cache if possible.
+
+    Responds with 304 Not Modified if the request has a matching
+    If-None-Match header, without serialising the entry.
+
+    """
+    key = entry_cache_key(entry, include_ids)
+    etag = entry_etag(key)
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        data = _entry_cache.get(key)
+        if data is None:
+            data = jsonldify(model_to_dict(entry, include_ids=include_ids)) \
+                .get_data()
+            _entry_cache.set(key, data)
+        resp = Response(data, mimetype='application/ld+json')
+    resp.set_etag(etag)
+    resp.vary.add('Accept')
+    if not entry.published:
+        resp.cache_control.private = True
+    return resp
+
+
+# Serialised PROV responses for entries, keyed by prov_cache_key.
+_prov_cache = LRUCache(app.config['PROV_CACHE_SIZE'])
+
+
+def prov_cache_key(entry, mimetype):
+    """Return the PROV response cache key for entry.
+
+    The PROV graph of an entry only changes when it gets a new version, or
+    its entry_hash changes when related rows are edited in place, so both
+    are part of the key and old serialisations are never served. The graph
+    is made of absolute URIs, so the key also includes the host URL they
+    are built from.
+
+    """
+    return (entry_type(entry), (entry.id, entry._data.get('latest')),
+            entry.version, entry.entry_hash, mimetype, request.host_url)
+
+
+def discard_cached_responses(entry):
+    """Drop every cached response for any version of entry.
+
+    Entries are never served stale, since the keys change with each version,
+    but this frees their space as soon as they are replaced.
+
+    """
+    name = entry_type(entry)
+
+    def is_entry_key(key):
+        return key[0] == name and entry.id in key[1]
+
+    _entry_cache.discard(is_entry_key)
+    _prov_cache.discard(is_entry_key)
+
+
+# Models whose rows are embedded in the responses for entries, but are not
+# covered by their entry_hash or stamp.
+_embedded_models = (User, License, Source, Review, Application,
+                    ApplicationSolution)
+
+# Name of the ChangeCounter for the rows of _embedded_models.
+EMBEDDED_CHANGES = 'embedded'
+
+
+@models.row_changed.connect
+def count_embedded_change(row, **kwargs):
+    """Bump the EMBEDDED_CHANGES counter when a row entries embed changes.
+
+    Such rows are shared by many entries and rarely change, so a single
+    counter in the entry cache keys replaces every key rather than tracking
+    which entries embed them. The cache of this process is cleared to free
+    the space of the old responses, which other processes evict as they
+    are replaced.
+
+    """
+    if isinstance(row, _embedded_models):
+        models.bump_change_counter(EMBEDDED_CHANGES)
+        _entry_cache.clear()
+
+
+def plan_step_dict(step):
+    """Return the dict view of a dependency install PlanStep.
+
+    Toolbox steps include the URL of the Toolbox version.
+
+    """
+    data = step._asdict()
+    if step.toolbox_id is not None:
+        data['url'] = url_for('site.toolbox_api',
+                              entry_id=step.toolbox_id,
+                              version=step.version,
+                              _external=True)
+    return data
+
+
+def plan_toolboxes(plan):
+    """Return the Toolbox versions installed by the steps of plan.
+
+    Versions stored as rows are loaded with one query, and those stored as
+    revisions one at a time.
+
+    """
+    keys = {(step.toolbox_id, step.version) for step in plan
+            if step.toolbox_id is not None}
+    ids = {toolbox_id for toolbox_id, version in keys}
+    toolboxes = {}
+    if ids:
+        T = Toolbox
+        for toolbox in T.select().where((T.id << ids) | (T.latest << ids)):
+            key = (toolbox._data.get('latest') or toolbox.id, toolbox.version)
+            if key in keys:
+                toolboxes[key] = toolbox
+    for key in keys - set(toolboxes):
+        toolbox = load_toolbox(*key)
+        if toolbox is not None:
+            toolboxes[key] = toolbox
+    return list(toolboxes.values())
+
+
+def hash_model(entry):
+    """Return the entry_hash for entry.
+
+    This is the hash of the JSON-LD served for entry, computed from the dict
+    rather than the encoded response.
+
+    """
+    return hash_model_dict(model_to_dict(entry))
+
+
+def hash_model_dict(entry_dict):
+    """Return the entry_hash for the dict view of an entry."""
+    return hash_entry_dict(add_context(entry_dict),
+                           hash_alg=app.config['ENTRY_HASH_FUNCTION'],
+                           default=SSSCJSONEncoder().default)
+
+
+# Number of entries serialised and hashed at a time by rehash_entries.
+REHASH_CHUNK_SIZE = 100
+
+
+def rehash_entries(chunk_size=REHASH_CHUNK_SIZE):
+    """Recompute the entry_hash of every entry, and store any that changed.
+
+    Entries are read in order of id, chunk_size at a time with their related
+    rows prefetched, and updated without saving the whole entry. Returns the
+    number of entries whose hash changed.
+
+    Entry hashes include the URLs of related models, so SERVER_NAME must be
+    configured to match the served URLs when this is run outside a request.
+
+    """
+    changed = 0
+    for cls in (Problem, Toolbox, Solution, Application):
+        last_id = 0
+        while True:
+            entries = list(cls.select()
+                              .where(cls.id > last_id)
+                              .order_by(cls.id)
+                              .limit(chunk_size))
+            if not entries:
+                break
+            with db.atomic():
+                for entry, entry_dict in zip(entries,
+                                             models_to_dicts(entries)):
+                    entry_hash = hash_model_dict(entry_dict)
+                    if entry_hash != entry.entry_hash:
+                        (cls.update(entry_hash=entry_hash)
+                            .where(cls.id == entry.id)
+                            .execute())
+                        changed += 1
+            last_id = entries[-1].id
+    return changed
+
+
 def pluralise(name):
     """Return the pluralised form of name."""
     ES_ENDS = ['j', 's', 'x']
@@ -637,6 +1139,100 @@ def properties(obj, props):
     return d
 
 
+# Timestamp format for page cursors, with the same precision as the database.
+_cursor_time_format = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def page_limit(value):
+    """Return the number of results per page requested by value.
+
+    Uses the configured PAGE_SIZE if value is missing or invalid, and never
+    more than MAX_PAGE_SIZE.
+
+    """
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        limit = app.config['PAGE_SIZE']
+    return max(1, min(limit, app.config['MAX_PAGE_SIZE']))
+
+
+def page_offset(value):
+    """Return the (non-negative) offset of a page requested by value."""
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+def encode_cursor(entry):
+    """Return an opaque cursor for the page of entries following entry."""
+    key = '{},{}'.format(entry.created_at.strftime(_cursor_time_format),
+                         entry.id)
+    return urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return the (created_at, id) encoded in cursor, or None if no cursor.
+
+    Raises ValueError if cursor is not valid.
+
+    """
+    if not cursor:
+        return None
+    try:
+        created_at, id = urlsafe_b64decode(cursor.encode()).decode() \
+                             .split(',')
+        return datetime.strptime(created_at, _cursor_time_format), int(id)
+    except (TypeError, UnicodeError, binascii.Error) as e:
+        raise ValueError('Invalid page cursor: {}'.format(e))
+
+
+class Page(object):
+    """A page of the entries selected by query, made by paginate.
+
+    Iterating over the page runs query once, for up to limit + 1 entries, and
+    yields the first limit of them. An extra entry only shows that there is
+    another page, and sets next_cursor to the cursor for it; next_cursor is
+    None until the page has been read, and after reading the last page.
+
+    """
+
+    def __init__(self, query, limit):
+        self.query = query.limit(limit + 1)
+        self.limit = limit
+        self.next_cursor = None
+
+    def __iter__(self):
+        last = None
+        for i, entry in enumerate(self.query.iterator()):
+            if i == self.limit:
+                self.next_cursor = encode_cursor(last)
+                break
+            last = entry
+            yield entry
+
+
+def paginate(query, model, cursor=None, limit=None):
+    """Return the Page of entries selected by query that follows cursor.
+
+    Entries are ordered newest first by (created_at, id), and the page starts
+    after the entry identified by cursor (see decode_cursor). The cursor is
+    compared as a row value, so each page is an index range scan no matter
+    how deep into the results it is.
+
+    The page itself is not loaded, so it can be streamed (see stream_jsonld).
+
+    """
+    if limit is None:
+        limit = page_limit(None)
+    query = query.order_by(model.created_at.desc(), model.id.desc())
+    if cursor is not None:
+        query = query.where(Tuple(model.created_at, model.id) <
+                            Tuple(*cursor))
+    return Page(query, limit)
+
+
 def checked_field(entry, field, hash_field=None):
     """Return a dict with the field value and checksum from entry.
 
@@ -769,28 +1365,72 @@ def server_uri():
 class ResourceView(MethodView):
     api_fields = {}
 
+    def resources_view(self, entry):
+        """Return the latest status of the external resources of entry."""
+        return jsonldify(dict(resources=[
+            dict(field=r.field,
+                 url=r.url,
+                 checked_at=r.checked_at,
+                 content_hash=r.content_hash,
+                 is_changed=r.is_changed,
+                 error=r.error)
+            for r in latest_resource_checks(entry)
+        ]))
+
     def prov_view(self, entry):
-        print('prov_view', entry, entry.version)
-        # Build the RDF prov graph
-        g = self.graph(entry)
-        # Return the appropriate serialization
+        """Return the PROV graph for entry in the best accepted format.
+
+        Serialisations are cached by prov_cache_key, and revalidated with
+        ETags as for cached_entry_response.
+
+        """
         best = best_mimetype("application/ld+json",
                              "application/json",
                              "text/turtle",
                              "application/rdf+xml")
         if best is None:
             raise NotAcceptable
-        mimetype = best
-        if best == "application/json":
-            best = "application/ld+json"
-        serialize_args = dict(format=best)
-        if best == "application/ld+json":
-            context = dict((prefix, str(ns)) for prefix, ns in g.namespaces())
-            serialize_args.update(context=context, indent=4)
-        resp = make_response(g.serialize(**serialize_args))
-        resp.mimetype = mimetype
+        key = prov_cache_key(entry, best)
+        etag = entry_etag(key)
+        if request.if_none_match.contains(etag):
+            resp = Response(status=304)
+        else:
+            data = _prov_cache.get(key)
+            if data is None:
+                data = self.serialize_prov(entry, best)
+                _prov_cache.set(key, data)
+            resp = Response(data, mimetype=best)
+        resp.set_etag(etag)
+        resp.vary.add('Accept')
+        if not getattr(entry, 'published', True):
+            resp.cache_control.private = True
         return resp
 
+    def serialize_prov(self, entry, mimetype):
+        """Return the PROV graph for entry serialised as mimetype bytes.
+
+        JSON-LD is written directly from the graph (see Graph.jsonld), and
+        rdflib is only used for the other formats.
+
+        """
+        # Build the RDF prov graph
+        g = self.graph(entry)
+        # Return the appropriate serialization
+        if mimetype in ("application/ld+json", "application/json"):
+            return json.dumps(g.jsonld()).encode()
+        data = g.to_rdflib().serialize(format=mimetype)
+        return data.encode() if isinstance(data, str) else data
+
+    def generated_at(self, entry):
+        """Return the time the PROV bundle for entry was generated.
+
+        This is when the entry (or this version of it) was created, rather
+        than the time of the request, so the bundle for a version is always
+        the same and can be cached.
+
+        """
+        return getattr(entry, 'created_at', None) or datetime.now()
+
     def subject(self, entry):
         """Return the RDF subject node for entry.
 
@@ -822,7 +1462,8 @@ class ResourceView(MethodView):
         for t in [(base, RDF.type, PROV.Bundle),
                   (base, RDF.type, PROV.Entity),
                   (base, PROV.wasAttributedTo, server),
-                  (base, PROV.generatedAtTime, Literal(datetime.now())),
+                  (base, PROV.generatedAtTime,
+                   Literal(self.generated_at(entry))),
                   (server, RDF.type, PROV.SoftwareAgent),
                   (server, RDF.type, PROV.Agent),
                   (server,
@@ -913,13 +1554,30 @@ class EntryView(ResourceView):
     def get(self, entry_id=None):
         best = best_mimetype("application/json", "text/html")
         if entry_id is None:
-            entries = self.get_list()
+            limit = page_limit(request.args.get('limit'))
+            try:
+                cursor = decode_cursor(request.args.get('after'))
+            except ValueError:
+                return 'Invalid page cursor.', 400, None
+            page = paginate(self.get_list(), self.model, cursor, limit)
+
+            def next_page():
+                """Link to the next page, keeping any other parameters."""
+                if not page.next_cursor:
+                    return {}
+                args = request.args.to_dict()
+                args.update(after=page.next_cursor, limit=limit)
+                return dict(next=url_for(model_endpoint(self.model),
+                                         _external=True,
+                                         **args))
+
             if best == "application/json":
-                return jsonldify({
-                    self.entries_key: [model_to_dict(entry)
-                                       for entry in entries]
-                })
+                # The next link is only known once the page has been read,
+                # so it follows the entries.
+                return stream_jsonld(self.entries_key, iter_dicts(page),
+                                     tail=next_page)
             elif best == "text/html":
+                entries = list(page)
                 entries_url = url_for(model_endpoint(self.model),
                                       _external=True,
                                       mimetype='application/json')
@@ -927,7 +1585,8 @@ class EntryView(ResourceView):
                     'entries/list.html',
                     entry_type=pluralise(self.model.__name__),
                     entries_url=entries_url,
-                    entries=entries
+                    entries=entries,
+                    next_url=next_page().get('next')
                 )
             else:
                 return NotAcceptable
@@ -939,14 +1598,17 @@ class EntryView(ResourceView):
                 abort(404)
             if request.path.endswith('/prov'):
                 return self.prov_view(entry)
+            elif request.path.endswith('/resources'):
+                return self.resources_view(entry)
+            elif request.path.endswith('/dependencies'):
+                return self.dependencies_view(entry)
+            elif request.path.endswith('/dependents'):
+                return self.dependents_view(entry)
             elif best == "application/json":
                 # Do *not* include internal ids, except if requested using the
                 # undocumented API.
-                if request.args.get('_include_ids'):
-                    entry_dict = model_to_dict(entry, include_ids=True)
-                else:
-                    entry_dict = model_to_dict(entry)
-                return jsonldify(entry_dict)
+                include_ids = bool(request.args.get('_include_ids'))
+                return cached_entry_response(entry, include_ids)
             elif best == "text/html":
                 return render_template(self.detail_template,
                                        **self.detail_template_args(entry))
@@ -982,6 +1644,8 @@ class EntryView(ResourceView):
         entry = self.get_one(entry_id, version=version)
         if not entry:
             abort(404)
+        if is_revision(entry):
+            return revision_conflict(entry, 'updated')
 
         # Ensure the user has the correct permissions for the current
         # configuration
@@ -1047,7 +1711,12 @@ class EntryView(ResourceView):
                      (model.id == entry_id))
                 )
         except DoesNotExist:
-            return None
+            # The version may be stored as a revision instead of a row.
+            entry = None
+            if version is not None:
+                entry = load_revision(model, entry_id, int(version))
+            if entry is None:
+                return None
 
         if entry and not entry.published:
             if (current_user.is_anonymous or
@@ -1089,6 +1758,30 @@ class EntryView(ResourceView):
         else:
             return cls.get_one(entry_id, **kwargs)
 
+    def dependencies_view(self, entry):
+        """Return the dependencies of entry.
+
+        With closure=true, return the install plan for all the transitive
+        dependencies of entry instead (see resolve_dependencies), or 409 if
+        they cannot be resolved. The plan is refused with 403 if it installs
+        any Toolbox the current user cannot read.
+
+        """
+        if not parse_boolean_param(request.args.get('closure')):
+            fk = type(entry)._meta.reverse_rel['deps']
+            return jsonldify(dict(dependencies=models_to_dicts(
+                entry_dependencies(entry), exclude=[fk]
+            )))
+        try:
+            plan = resolve_dependencies(entry)
+        except DependencyError as e:
+            return str(e), 409, None
+        if not all(can_read(t) for t in plan_toolboxes(plan)):
+            return ('The dependencies of this entry include Toolboxes you '
+                    'cannot read.', 403, None)
+        return jsonldify(dict(dependencies=[plan_step_dict(step)
+                                            for step in plan]))
+
     def get_previous(self, entry):
         """Return the Entry that is the previous version of entry."""
         return self.model.get(self.model.version == entry.version - 1)
@@ -1099,7 +1792,10 @@ class EntryView(ResourceView):
         s = self.subject(entry)
 
         # Dependencies become Prov Derivations
-        for d in getattr(entry, 'deps', []):
+        deps = getattr(entry, 'deps_prefetch', None)
+        if deps is None:
+            deps = getattr(entry, 'deps', [])
+        for d in deps:
             add_prov_dependency(g, s, d)
 
         # Include revision history. Add a description of the permanent link for
@@ -1198,6 +1894,28 @@ class ToolboxView(EntryView):
     def semantic_types(self):
         return super().semantic_types() + [SSSC.Toolbox]
 
+    def dependents_view(self, entry):
+        """Return the latest entries that depend on this Toolbox.
+
+        Includes entries that depend on it through other Toolboxes, nearest
+        first, with the depth of the dependency (1 for direct dependencies).
+        The type parameter ('solutions' or 'toolboxes') restricts the results
+        to one type of entry. Only readable entries are included.
+
+        """
+        types = {pluralise(name).lower(): name for name in DEPENDENT_TYPES}
+        name = request.args.get('type')
+        if name is not None and name not in types:
+            return 'Unknown type of entry "{}".'.format(name), 400, None
+        dependents = dependent_entries(entry.entry_id, types.get(name))
+        return jsonldify(dict(dependents=[
+            dict(type=entry_type(dependent),
+                 name=dependent.name,
+                 url=model_url(dependent),
+                 depth=depth)
+            for dependent, depth in dependents if can_read(dependent)
+        ]))
+
     def graph(self, entry):
         """Return the RDF PROV graph for this Entry.
 
@@ -1229,9 +1947,7 @@ class UserView(ResourceView):
             # TODO: restrict this based on user authorisation?
             users = User.select()
             if best == "application/json":
-                return jsonldify(dict(
-                    users=[model_to_dict(user) for user in users]
-                ))
+                return stream_jsonld('users', iter_dicts(users))
             elif best == "text/html":
                 return render_template('user_list.html', users=users)
             else:
@@ -1352,9 +2068,7 @@ class LicenseView(ResourceView):
     def get(self, license_id):
         if license_id is None:
             licenses = License.select()
-            return jsonldify(dict(
-                licenses=[model_to_dict(license) for license in licenses]
-            ))
+            return stream_jsonld('licenses', iter_dicts(licenses))
         else:
             license = License.get(License.id == license_id)
             if not license:
@@ -1373,9 +2087,7 @@ class SignatureView(ResourceView):
     def get(self, signature_id):
         if signature_id is None:
             signatures = Signature.select()
-            return jsonldify(dict(
-                signatures=[model_to_dict(s) for s in signatures]
-            ))
+            return stream_jsonld('signatures', iter_dicts(signatures))
         else:
             signature = Signature.get(Signature.id == signature_id)
             if not signature:
@@ -1401,6 +2113,8 @@ class SignatureView(ResourceView):
         entry = get_models_for_url(uri)
         if not entry:
             return "Entry for signature could not be found", 404
+        if isinstance(entry, Entry) and is_revision(entry):
+            return revision_conflict(entry, 'signed')
 
         sig_fields = signed_string.split('$')
 
@@ -1425,13 +2139,15 @@ class SignatureView(ResourceView):
         public_key = current_user.public_key
         verified, verify_msg = verify_signature(signature,
                                                 signed_string,
-                                                public_key.key)
+                                                public_key_for(public_key))
         if verified:
             rel_class, rel_field = signature_relation(entry)
             if rel_class:
                 sig_instance = Signature(signature=signature,
                                          public_key=public_key,
-                                         signed_string=signed_string)
+                                         signed_string=signed_string,
+                                         entry_type=entry_type(entry),
+                                         entry_pk=entry.id)
                 # Add the metadata
                 sig_instance.user_id = User.get(User.id == current_user.id)
                 sig_instance.save()
@@ -1480,7 +2196,8 @@ class UploadView(MethodView):
                 resources = (UploadedResource
                              .select()
                              .where(UploadedResource.published == True))
-                return jsonify(uploads=[model_to_dict(r) for r in resources])
+                return stream_jsonld('uploads', iter_dicts(resources),
+                                     context=None)
             elif best == "text/html":
                 return render_template('upload.html')
         else:
@@ -1615,6 +2332,24 @@ def register_api(model, view, endpoint, url, pk='id', pk_type='int'):
     site.add_url_rule('{}<{}:{}>/prov'.format(url, pk_type, pk),
                       view_func=prov_view_func, methods=['GET'])
 
+    # Dependencies endpoint, for entries with dependencies
+    if any('deps' in m._meta.reverse_rel for m in models):
+        dependencies_view_func = view.as_view(endpoint + '_dependencies')
+        site.add_url_rule('{}<{}:{}>/dependencies'.format(url, pk_type, pk),
+                          view_func=dependencies_view_func, methods=['GET'])
+
+    # Resource check status endpoint, for entries with external resources
+    if any(getattr(m, '_resource_fields', None) for m in models):
+        resources_view_func = view.as_view(endpoint + '_resources')
+        site.add_url_rule('{}<{}:{}>/resources'.format(url, pk_type, pk),
+                          view_func=resources_view_func, methods=['GET'])
+
+    # Dependents endpoint, for entries that others can depend on
+    if any(issubclass(m, Toolbox) for m in models):
+        dependents_view_func = view.as_view(endpoint + '_dependents')
+        site.add_url_rule('{}<{}:{}>/dependents'.format(url, pk_type, pk),
+                          view_func=dependents_view_func, methods=['GET'])
+
 
 register_api(Toolbox, ToolboxView, 'toolbox_api', '/toolboxes/', pk='entry_id')
 register_api(Problem, ProblemView, 'problem_api', '/problems/', pk='entry_id')
@@ -1635,6 +2370,154 @@ register_api(UploadedResource, UploadView, 'uploads_api', '/uploads/',
              pk='resource_id')
 
 
+# ======================================================================
+#
+# Provenance export
+#
+# ======================================================================
+
+# Views that build the PROV graph of each type of Entry.
+_PROV_VIEWS = {
+    Problem: ProblemView,
+    Toolbox: ToolboxView,
+    Solution: SolutionView,
+    Application: ApplicationView,
+}
+
+# Serialisations of the PROV export, by mimetype.
+PROV_EXPORT_FORMATS = {
+    'application/n-quads': 'nquads',
+    'application/n-triples': 'ntriples',
+}
+
+
+def parse_since(value):
+    """Return the ISO 8601 date or datetime value as a naive UTC datetime.
+
+    Raises ValueError if value is not a valid date or datetime.
+
+    """
+    try:
+        since = aniso8601.parse_datetime(value)
+    except ValueError:
+        since = datetime.combine(aniso8601.parse_date(value), time())
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return since
+
+
+def _prefetch_prov(entries):
+    """Load the rows referenced by the PROV graphs of entries in bulk."""
+    if entries:
+        cls = type(entries[0])
+        for field in cls._meta.fields.values():
+            if isinstance(field, ForeignKeyField):
+                models.prefetch_foreign(entries, field)
+        fk = cls._meta.reverse_rel.get('deps')
+        if fk is not None and not hasattr(entries[0], 'deps_prefetch'):
+            models.prefetch_reverse(entries, 'deps', fk)
+
+
+def iter_prov_entries(since=None, published_only=True, chunk_size=None):
+    """Generate every version of every Entry, for a PROV export.
+
+    Includes historical versions stored as cloned rows and as revisions.
+    Entries are loaded chunk_size (default STREAM_CHUNK_SIZE) at a time, with
+    the rows their PROV graphs refer to prefetched. If since is given, only
+    versions created at or after since are included. If published_only is
+    True, only published versions (and the revisions of published entries)
+    are included.
+
+    """
+    if chunk_size is None:
+        chunk_size = app.config['STREAM_CHUNK_SIZE']
+    for cls in _PROV_VIEWS:
+        # Latest and cloned versions
+        last_id = 0
+        while True:
+            query = cls.select().where(cls.id > last_id)
+            if since is not None:
+                query = query.where(cls.created_at >= since)
+            if published_only:
+                query = query.where(cls.published == True)
+            entries = list(query.order_by(cls.id).limit(chunk_size))
+            if not entries:
+                break
+            _prefetch_prov(entries)
+            yield from entries
+            last_id = entries[-1].id
+
+        # Versions stored as revisions. A revision is recorded when its
+        # entry gets a new version, so only entries updated since are
+        # searched.
+        latest = cls.select(cls.id).where(cls.latest.is_null())
+        if since is not None:
+            latest = latest.where(cls.created_at >= since)
+        if published_only:
+            latest = latest.where(cls.published == True)
+        latest_ids = [id for id, in latest.order_by(cls.id).tuples()]
+        for i in range(0, len(latest_ids), chunk_size):
+            entries = [
+                entry for entry in models.load_revisions(
+                    cls, latest_ids[i:i + chunk_size])
+                if since is None or entry.created_at >= since
+            ]
+            _prefetch_prov(entries)
+            yield from entries
+
+
+def prov_statements(entry, quads=True):
+    """Generate the PROV graph of entry as N-Quads or N-Triples lines.
+
+    Each version of an entry is written to a named graph identified by its
+    pinned prov URL, which is also used to keep its blank nodes apart from
+    those of other graphs in the same stream.
+
+    """
+    view = _PROV_VIEWS[type(entry)]()
+    graph = model_url(entry, pinned=True,
+                      endpoint=model_endpoint(type(entry)) + '_prov')
+    prefix = 'b{}'.format(hashlib.sha1(graph.encode()).hexdigest()[:12])
+    return nquad_lines(view.graph(entry),
+                       graph=graph if quads else None,
+                       bnode_prefix=prefix)
+
+
+def iter_prov_export(since=None, published_only=True, quads=True):
+    """Generate the PROV export of every entry version, one entry at a time.
+
+    Each item is the N-Quads (or N-Triples) text for the graph of one entry
+    version, so the export is never held in memory at once.
+
+    """
+    for entry in iter_prov_entries(since, published_only):
+        yield ''.join(prov_statements(entry, quads))
+
+
+@site.route('/prov')
+def prov_export():
+    """Stream the PROV graphs of every entry version.
+
+    Responds with N-Quads, with one named graph per entry version, or with
+    N-Triples if requested. Takes an optional 'since' parameter, an ISO 8601
+    date or datetime, to only include versions created since then.
+
+    """
+    best = best_mimetype(*PROV_EXPORT_FORMATS)
+    if best is None:
+        raise NotAcceptable
+    since = request.args.get('since')
+    if since:
+        try:
+            since = parse_since(since)
+        except ValueError:
+            return 'Invalid since timestamp.', 400, None
+    published_only = not ViewUnpublishedPermission.can()
+    export = iter_prov_export(since or None, published_only,
+                              quads=PROV_EXPORT_FORMATS[best] == 'nquads')
+    return Response(stream_with_context(export), mimetype=best)
+
+
 # ======================================================================
 #
 # Actions API
@@ -1677,6 +2560,8 @@ def publish_entry():
 
     # Make sure we have permission to publish the entry.
     if isinstance(entry, Entry):
+        if is_revision(entry):
+            return revision_conflict(entry, 'published')
         permission = PublishEntryPermission(entry.id)
         redirect_target = model_url(entry)
     elif isinstance(entry, UploadedResource):
@@ -1724,6 +2609,8 @@ def review_entry():
         abort(404)
     elif not isinstance(entry, Entry):
         return "URI ({}) does not identify a unique entry.".format(uri), 400
+    elif is_revision(entry):
+        return revision_conflict(entry, 'reviewed')
 
     # Make sure we have permission to review the entry. Any registered user can
     # review a published entry, but only certain users can review an
@@ -1769,20 +2656,51 @@ def review_entry():
 
 @site.route('/search')
 def search():
+    """Search all entries, returning a page of results ranked together.
+
+    Takes the search text in the 'search' parameter, and optionally 'limit'
+    and 'offset' parameters to select the page of results.
+
+    """
     if request.method == 'POST':
         search = request.form.get("search")
     else:
         search = request.args.get("search")
-    results = text_search(search)
+    limit = page_limit(request.args.get('limit'))
+    offset = page_offset(request.args.get('offset'))
+    found = search_entries(search, limit=limit, offset=offset)
+
+    # Links to the neighbouring pages of results
+    next_url = prev_url = None
+    if offset + limit < found['total']:
+        next_url = url_for('site.search', _external=True, search=search,
+                           limit=limit, offset=offset + limit)
+    if offset > 0:
+        prev_url = url_for('site.search', _external=True, search=search,
+                           limit=limit, offset=max(0, offset - limit))
 
     best = best_mimetype('application/json', 'text/html')
     if best == 'text/html':
         return render_template('search_results.html',
                                search=search,
-                               results=results)
+                               results=found['results'],
+                               counts=found['counts'],
+                               total=found['total'],
+                               offset=offset,
+                               next_url=next_url,
+                               prev_url=prev_url)
     else:
-        return jsonldify({k: [model_to_dict(e) for e in entries]
-                          for k, entries in results.items()})
+        response = dict(search=search,
+                        results=models_to_dicts(found['results']),
+                        counts=found['counts'],
+                        total=found['total'],
+                        limit=limit,
+                        offset=offset)
+        if next_url:
+            response['next'] = next_url
+        if prev_url:
+            response['prev'] = prev_url
+        return jsonldify(response)
 
 
 @site.route('/sssc.jsonld')
@@ -1815,15 +2733,12 @@ def clone_entry():
 
     # Clone the entry, and return new entry on success.
     try:
-        # Create the clone instance
-        clone = clone_model(entry)
-
-        # Reset the version info and metadata
-        clone.author = current_user.id
-        clone.created_at = datetime.now()
-        clone.latest = None
-        clone.version = 1
-        clone.save()
+        # Create the clone instance, resetting the version info and metadata
+        clone = clone_model(entry,
+                            author=current_user.id,
+                            created_at=datetime.now(),
+                            latest=None,
+                            version=1)
     except Exception as ex:
         result = dict(message='Failed to clone entry: {}'.format(str(ex)),
                       category='error')